@@ -19,9 +19,6 @@ __version__ = "2.0.0"
 __author__ = "Alejandro G."
 __license__ = "MIT"
 
-from .core import main, load_config
-from .template_engine import TemplateEngine
-
 __all__ = [
     # Función principal
     "main",
@@ -29,3 +26,15 @@ __all__ = [
     "load_config",
     "TemplateEngine",
 ]
+
+
+def __getattr__(name):
+    # API pública importada al primer uso: así `python -m MergeSourceFile.<módulo>`
+    # no importa el módulo antes de ejecutarlo (RuntimeWarning de runpy)
+    if name in ("main", "load_config"):
+        from . import core
+        return getattr(core, name)
+    if name == "TemplateEngine":
+        from .template_engine import TemplateEngine
+        return TemplateEngine
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
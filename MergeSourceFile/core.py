@@ -26,19 +26,36 @@ Core - Sistema de plantillas basado en Jinja2.
 Funcionalidades principales:
 - Carga y validación de configuración TOML
 - Función main() para procesamiento completo
+- Punto de entrada cli() con opciones de línea de comandos (--metrics, --trace, --profile)
 - Setup de logging y carga de variables
 """
 
 import sys
+import queue
 import logging
+import argparse
 import traceback
 import yaml
 import tomllib
+from contextlib import contextmanager, nullcontext
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional
+
+from . import incremental, metrics, profiling
+from .fs import Dependencies, open_source_fs
+from .output import DEFAULT_GZIP_LEVEL, write_if_changed, create_backup
+from .pipeline import DEFAULT_QUEUE_SIZE
+from .sourcemap import SourceMapBuilder, map_path_for
+from .statements import StatementIndexer, index_path_for
+from .variables import DEFAULT_ENV_PREFIX, VariableScope, env_overrides, parse_assignments
 
 logger = logging.getLogger(__name__)
 
+# Cola de registros de log mientras está activo _background_logging()
+_log_queue: Optional[queue.SimpleQueue] = None
+_log_listener: Optional[QueueListener] = None
+
 
 # ============================================================================
 # CONFIGURACIÓN Y VALIDACIÓN TOML
@@ -153,6 +170,14 @@ def _normalize_config(config: Dict[str, Any]) -> Dict[str, Any]:
     config['project'].setdefault('output', '')
     config['project'].setdefault('verbose', False)
     config['project'].setdefault('create_backup', False)
+    config['project'].setdefault('backup_count', 1)
+    config['project'].setdefault('streaming_output', False)
+    config['project'].setdefault('gzip_level', DEFAULT_GZIP_LEVEL)
+    config['project'].setdefault('source_map', False)
+    config['project'].setdefault('statement_index', False)
+    config['project'].setdefault('pipeline_stages', False)
+    config['project'].setdefault('pipeline_queue_size', DEFAULT_QUEUE_SIZE)
+    config['project'].setdefault('incremental', False)
     
     # execution_order debe ser definido explícitamente
     config['project'].setdefault('execution_order', [])
@@ -241,33 +266,104 @@ def _setup_logging(verbose: bool = False) -> None:
     """Configura el sistema de logging."""
     level = logging.DEBUG if verbose else logging.INFO
     log_format = '%(message)s' if not verbose else '[%(levelname)s] %(name)s: %(message)s'
-    logging.basicConfig(level=level, format=log_format, handlers=[logging.StreamHandler(sys.stdout)])
+    handler: logging.Handler = logging.StreamHandler(sys.stdout)
+    if _log_queue is not None:
+        handler = _start_log_listener(handler, log_format)
+    logging.basicConfig(level=level, format=log_format, handlers=[handler])
+
 
+def _start_log_listener(handler: logging.Handler, log_format: str) -> logging.Handler:
+    """
+    Pasa handler a un QueueListener y devuelve el QueueHandler que lo alimenta.
+    
+    El QueueHandler solo compone el mensaje (%-args y traza de la excepción);
+    el formato final lo aplica handler en el hilo del listener.
+    """
+    global _log_listener
+    handler.setFormatter(logging.Formatter(log_format))
+    if _log_listener is None:
+        _log_listener = QueueListener(_log_queue, handler, respect_handler_level=True)
+        _log_listener.start()
+    queue_handler = QueueHandler(_log_queue)
+    queue_handler.setFormatter(logging.Formatter('%(message)s'))
+    return queue_handler
 
-def _load_variables(config: Dict[str, Any]) -> Dict[str, Any]:
-    """Carga variables desde archivo YAML si está configurado."""
-    variables = {}
-    variables_file = config.get('jinja2', {}).get('variables_file')
-    if variables_file:
+
+@contextmanager
+def _background_logging() -> Iterator[None]:
+    """
+    Escribe los registros de log desde un hilo durante el bloque.
+    
+    El hilo que procesa solo encola cada registro; la escritura en stdout
+    (una terminal o una tubería lenta) no frena la expansión de inclusiones.
+    Al salir se vacía la cola y el handler de stdout vuelve al logger raíz.
+    """
+    global _log_queue, _log_listener
+    _log_queue = queue.SimpleQueue()
+    try:
+        yield
+    finally:
+        listener, _log_listener, log_queue, _log_queue = _log_listener, None, _log_queue, None
+        if listener is not None:
+            listener.stop()
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                if isinstance(handler, QueueHandler) and handler.queue is log_queue:
+                    root.removeHandler(handler)
+                    for target in listener.handlers:
+                        root.addHandler(target)
+
+
+def _load_variables(config: Dict[str, Any],
+                    overrides: Optional[Dict[str, Any]] = None) -> VariableScope:
+    """
+    Carga las capas de variables (ver MergeSourceFile.variables).
+    
+    Args:
+        config: Configuración normalizada
+        overrides: Asignaciones de la línea de comandos (msf --set)
+    
+    Returns:
+        VariableScope con --set, el entorno y los archivos YAML, por prioridad
+    """
+    jinja_config = config.get('jinja2', {})
+    variables_files = jinja_config.get('variables_file') or []
+    if isinstance(variables_files, str):
+        variables_files = [variables_files]
+    
+    # El último archivo de la lista tiene prioridad
+    layers = []
+    for variables_file in variables_files:
         try:
             with open(variables_file, 'r', encoding='utf-8') as f:
                 file_vars = yaml.safe_load(f)
                 if file_vars:  # yaml.safe_load puede retornar None para archivos vacíos
-                    variables.update(file_vars)
+                    layers.insert(0, file_vars)
                 logger.info(f"Variables cargadas desde: {variables_file}")
         except FileNotFoundError:
             logger.warning(f"Archivo de variables no encontrado: {variables_file}")
         except yaml.YAMLError as e:
             logger.warning(f"Error al leer variables YAML: {e}")
-    return variables
+    
+    env_prefix = jinja_config.get('env_prefix', DEFAULT_ENV_PREFIX)
+    env_vars = env_overrides(env_prefix)
+    if env_vars:
+        logger.info(f"Variables del entorno ({env_prefix}*): {sorted(env_vars)}")
+        layers.insert(0, env_vars)
+    if overrides:
+        logger.info(f"Variables de la línea de comandos: {sorted(overrides)}")
+        layers.insert(0, overrides)
+    return VariableScope(*layers)
 
 
-def main(config_file: str = None) -> int:
+def main(config_file: str = None, overrides: Optional[Dict[str, Any]] = None) -> int:
     """
     Función principal del sistema.
     
     Args:
         config_file: Archivo de configuración TOML
+        overrides: Variables que prevalecen sobre los archivos YAML y el
+            entorno (msf --set clave=valor)
         
     Returns:
         Código de salida (0 = éxito, 1 = error)
@@ -279,36 +375,87 @@ def main(config_file: str = None) -> int:
     try:
         # 1. Cargar configuración
         logger.info(f"Cargando configuración desde: {config_file}")
-        config = load_config(config_file)
+        with metrics.stage('config_load'):
+            config = load_config(config_file)
         
         # 2. Configurar logging
         verbose = config.get('project', {}).get('verbose', False)
         _setup_logging(verbose)
+        metrics.set_lane(f"msf: {config['project']['output']}")
         
         # 3. Inicializar motor de plantillas
         from .template_engine import TemplateEngine
         engine = TemplateEngine(config)
         
         # 4. Cargar variables
-        variables = _load_variables(config)
+        with metrics.stage('variables_load'):
+            variables = _load_variables(config, overrides)
+        
+        # Modo incremental: omitir el objetivo si no cambiaron sus fuentes ni sus variables
+        output_path = Path(config['project']['output'])
+        dependencies = None
+        if config['project'].get('incremental', False):
+            state_path = incremental.state_path_for(output_path)
+            source_fs = open_source_fs(config.get('jinja2', {}).get('source_bundle'))
+            if incremental.up_to_date(state_path, config, variables, output_path, source_fs):
+                logger.info(f"Procesamiento omitido. Sin cambios en fuentes ni variables: {output_path}")
+                return 0
+            dependencies = Dependencies()
+            variables = incremental.VariableRecorder(variables)
         
-        # 5. Procesar archivo
+        # 5. Procesar archivo (en streaming, el render se escribe por fragmentos)
         input_file = config['project']['input']
-        result_content = engine.process_file(input_file, variables)
+        source_map = SourceMapBuilder() if config['project'].get('source_map', False) else None
+        if config['project'].get('pipeline_stages', False):
+            result_chunks = engine.process_file_pipeline(
+                input_file, variables, source_map,
+                queue_size=config['project'].get('pipeline_queue_size', DEFAULT_QUEUE_SIZE),
+                dependencies=dependencies
+            )
+        elif config['project'].get('streaming_output', False):
+            result_chunks = engine.process_file_stream(input_file, variables, source_map, dependencies)
+        else:
+            result_chunks = [engine.process_file(input_file, variables, source_map, dependencies)]
+        
+        # Índice de sentencias: se calcula sobre los fragmentos a medida que se escriben
+        statement_index = None
+        if config['project'].get('statement_index', False):
+            statement_index = StatementIndexer()
+            result_chunks = statement_index.observe(result_chunks)
         
-        # 6. Crear backup si se solicita
-        output_file = config['project']['output']
-        output_path = Path(output_file)
+        # 6. Escribir resultado (atómico, solo si cambió; backup antes de reemplazar)
+        project_config = config.get('project', {})
+        backup_hook = None
+        if project_config.get('create_backup', False):
+            backup_count = project_config.get('backup_count', 1)
+            
+            def backup_hook(path: Path) -> None:
+                backup_path = create_backup(path, backup_count)
+                logger.info(f"Backup creado: {backup_path}")
         
-        if config.get('project', {}).get('create_backup', False) and output_path.exists():
-            backup_path = output_path.with_suffix(output_path.suffix + '.bak')
-            backup_path.write_text(output_path.read_text(encoding='utf-8'), encoding='utf-8')
-            logger.info(f"Backup creado: {backup_path}")
+        with metrics.stage('output_write'):
+            changed = write_if_changed(
+                output_path, result_chunks, before_replace=backup_hook,
+                gzip_level=project_config.get('gzip_level', DEFAULT_GZIP_LEVEL)
+            )
         
-        # 7. Escribir resultado
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        output_path.write_text(result_content, encoding='utf-8')
-        logger.info(f"Procesamiento completado. Resultado en: {output_path}")
+        # 7. Mapa de origen e índice de sentencias junto a la salida (completos una vez escrita)
+        if source_map is not None:
+            map_path = map_path_for(output_path)
+            write_if_changed(map_path, [source_map.build().to_json()], counter='sidecar_bytes_out')
+            logger.info(f"Mapa de origen: {map_path}")
+        if statement_index is not None:
+            index_path = index_path_for(output_path)
+            write_if_changed(index_path, [statement_index.to_json()], counter='sidecar_bytes_out')
+            metrics.count('statements', len(statement_index))
+            logger.info(f"Índice de sentencias: {index_path} ({len(statement_index)} sentencias)")
+        if dependencies is not None:
+            incremental.save_state(state_path, config, dependencies, variables, output_path, source_fs)
+        
+        if changed:
+            logger.info(f"Procesamiento completado. Resultado en: {output_path}")
+        else:
+            logger.info(f"Procesamiento completado. Sin cambios (unchanged): {output_path}")
         
         return 0
         
@@ -325,5 +472,79 @@ def main(config_file: str = None) -> int:
         return 1
 
 
+def cli(argv: Optional[List[str]] = None) -> int:
+    """
+    Punto de entrada de línea de comandos (msf / mergesourcefile).
+    
+    Args:
+        argv: Argumentos de línea de comandos (por defecto, sys.argv[1:])
+        
+    Returns:
+        Código de salida de main()
+    """
+    parser = argparse.ArgumentParser(
+        prog='msf',
+        description="Procesa scripts SQL*Plus con plantillas Jinja2 según un archivo de configuración TOML."
+    )
+    parser.add_argument('config', nargs='?', default=None,
+                        help="Archivo de configuración TOML (por defecto: MKFSource.toml)")
+    parser.add_argument('--metrics', metavar='ARCHIVO',
+                        help="Escribe un informe JSON con tiempos por etapa y contadores")
+    parser.add_argument('--trace', metavar='ARCHIVO',
+                        help="Escribe una traza Chrome trace-event (chrome://tracing, Perfetto)")
+    parser.add_argument('--profile', choices=['cpu', 'mem', 'render'],
+                        help="Perfila la ejecución: cpu (cProfile), mem (tracemalloc por etapa) "
+                             "o render (tiempo y bytes por línea de plantilla)")
+    parser.add_argument('--profile-output', metavar='ARCHIVO',
+                        help="Archivo del perfil (por defecto: msf.prof, msf-mem.json o msf-render.json)")
+    parser.add_argument('--async-logging', action='store_true',
+                        help="Escribe el log desde un hilo en segundo plano (QueueHandler)")
+    parser.add_argument('--set', dest='assignments', action='append', default=[], metavar='CLAVE=VALOR',
+                        help="Define una variable de plantilla con prioridad sobre YAML y entorno "
+                             "(repetible; el valor es texto, CLAVE:=VALOR lo interpreta como YAML)")
+    args = parser.parse_args(argv)
+    try:
+        args.overrides = parse_assignments(args.assignments)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    with _background_logging() if args.async_logging else nullcontext():
+        return _run_cli(args)
+
+
+def _run_cli(args: argparse.Namespace) -> int:
+    """Ejecuta main() con las métricas y perfiles pedidos en la línea de comandos."""
+    if not args.metrics and not args.trace and not args.profile:
+        return main(args.config, args.overrides)
+    
+    def run() -> int:
+        return main(args.config, args.overrides)
+    
+    # El perfil de memoria se registra por etapa a través del colector de métricas
+    collector = None
+    if args.profile == 'mem':
+        collector = profiling.MemoryMetrics(trace=bool(args.trace))
+    elif args.metrics or args.trace:
+        collector = metrics.Metrics(trace=bool(args.trace))
+    
+    with metrics.collect_metrics(collector) if collector is not None else nullcontext():
+        if args.profile == 'cpu':
+            exit_code = profiling.run_cpu_profile(run, args.profile_output or 'msf.prof')
+        elif args.profile == 'mem':
+            exit_code = profiling.run_memory_profile(run, collector, args.profile_output or 'msf-mem.json')
+        elif args.profile == 'render':
+            exit_code = profiling.run_render_profile(run, args.profile_output or 'msf-render.json')
+        else:
+            exit_code = run()
+    
+    if args.metrics and collector is not None:
+        collector.write_json(args.metrics)
+        logger.info(f"Métricas escritas en: {args.metrics}")
+    if args.trace and collector is not None:
+        collector.write_trace(args.trace)
+        logger.info(f"Traza escrita en: {args.trace}")
+    return exit_code
+
+
 if __name__ == '__main__':
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file
@@ -0,0 +1,271 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+Caché de resultados de extensiones por huella de su entrada.
+
+Con las mismas fuentes y distintas variables Jinja2, el pre-procesamiento de
+una extensión (p. ej. la expansión de inclusiones SQLPlus) da siempre el
+mismo resultado. La caché lo reutiliza sin ejecutar el handler.
+
+- Clave: nombre de la extensión, versión del paquete, configuración de la
+  extensión, archivo de entrada y hash del contenido recibido.
+- Cada entrada guarda además las dependencias que la extensión anotó al
+  ejecutarse (fs.Dependencies): los archivos leídos con su tamaño, mtime y
+  hash, y las rutas consultadas que no existían. La entrada solo es válida
+  si ningún archivo cambió y ninguna ruta ausente apareció; un mtime
+  distinto con el mismo contenido no la invalida.
+- En memoria, compartida por proceso, y opcionalmente en disco (un JSON por
+  entrada, escrito de forma atómica) para reutilizarla entre ejecuciones.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import __version__, metrics
+from .fs import MMAP_THRESHOLD, Dependencies, SourceFS, open_source_fs
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato de las entradas en disco
+CACHE_FORMAT = 1
+
+# Entradas en memoria por caché (se descartan las más antiguas)
+DEFAULT_MAX_ENTRIES = 256
+
+# Claves de configuración que no forman parte de la huella
+_TRANSIENT_CONFIG = ('dependencies',)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtensionCache:
+    """
+    Resultados de extensiones en memoria y, si se indica directory, en disco.
+    
+    Un resultado es la tupla que devuelve el handler (contenido, variables
+    y, opcionalmente, orígenes) o el contenido solo. Puede compartirse entre
+    hilos.
+    """
+    
+    def __init__(self, directory: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.directory = Path(directory) if directory else None
+        self.max_entries = max_entries
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(ext_name: str, config: Dict[str, Any], input_file: str, base_path: str, content: str) -> str:
+        """Huella de una ejecución de la extensión, sin sus dependencias."""
+        fingerprint = json.dumps({
+            'extension': ext_name,
+            'version': __version__,
+            'config': {k: v for k, v in config.items() if k not in _TRANSIENT_CONFIG},
+            'input_file': str(input_file),
+            'base_path': str(base_path),
+            'content': _sha256(content.encode('utf-8')),
+        }, sort_keys=True, default=repr)
+        return _sha256(fingerprint.encode('utf-8'))
+    
+    def get(self, key: str, config: Dict[str, Any],
+            dependencies: Optional[Dependencies] = None) -> Optional[Any]:
+        """
+        Resultado guardado para la clave, o None si no hay o sus dependencias cambiaron.
+        
+        Args:
+            key: Clave calculada con key()
+            config: Configuración de la extensión (fuente de archivos con la
+                que comprobar las dependencias)
+            dependencies: Si se indica, recibe las dependencias guardadas
+                cuando el resultado se reutiliza
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key)
+        # files_unchanged actualiza los registros: se trabaja sobre una copia y
+        # la entrada actualizada se publica bajo el lock
+        files = [list(record) for record in entry['files']] if entry is not None else None
+        if entry is None or not files_unchanged(files, entry['missing'], _source_fs(config)):
+            metrics.count('extension_cache_misses')
+            return None
+        
+        metrics.count('extension_cache_hits')
+        if dependencies is not None:
+            for path, digest, *stat in files:
+                dependencies.note_read(Path(path), digest, tuple(stat) if stat[0] is not None else None)
+            for path in entry['missing']:
+                dependencies.note_missing(Path(path))
+        entry = dict(entry, files=files)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+        result = entry['result']
+        if isinstance(result, list):
+            return tuple(result)
+        return result
+    
+    def put(self, key: str, result: Any, dependencies: Dependencies, config: Dict[str, Any]) -> None:
+        """Guarda el resultado de una ejecución junto con sus dependencias."""
+        entry = {
+            'format': CACHE_FORMAT,
+            'result': list(result) if isinstance(result, tuple) else result,
+            'files': snapshot_files(dependencies, _source_fs(config)),
+            'missing': list(dependencies.missing),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+        if self.directory is not None:
+            self._store(key, entry)
+    
+    def clear(self) -> None:
+        """Vacía la caché en memoria."""
+        with self._lock:
+            self._entries.clear()
+    
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+    
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.directory is None:
+            return None
+        try:
+            entry = json.loads(self._path(key).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        if not isinstance(entry, dict) or entry.get('format') != CACHE_FORMAT:
+            return None
+        result = entry['result']
+        if isinstance(result, list) and len(result) == 3 and result[2] is not None:
+            # Orígenes (archivo, línea): JSON los devuelve como listas
+            result[2] = [tuple(origin) if origin is not None else None for origin in result[2]]
+        return entry
+    
+    def _store(self, key: str, entry: Dict[str, Any]) -> None:
+        try:
+            data = json.dumps(entry, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            # Variables no serializables: el resultado queda solo en memoria
+            logger.debug(f"Resultado de extensión no serializable, no se guarda en disco: {e}")
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def snapshot_files(dependencies: Dependencies, fs: SourceFS) -> List[list]:
+    """
+    Registros [ruta, sha256, mtime_ns, tamaño] de los archivos leídos, para files_unchanged().
+    
+    Se usan el hash y el stat que se anotaron al leer cada archivo
+    (Dependencies.snapshots), de modo que un cambio posterior a la lectura
+    no queda registrado como vigente. Los archivos leídos sin anotarlos
+    (por ejemplo, por un loader de una extensión externa) se leen ahora,
+    tomando el stat antes que el contenido.
+    """
+    files = []
+    for path in dependencies.read:
+        snapshot = dependencies.snapshots.get(path)
+        if snapshot is not None:
+            digest, stat = snapshot
+        else:
+            stat = _stat(fs, path)
+            digest = _sha256(fs.read_bytes(Path(path)))
+        files.append([path, digest] + list(stat or (None, None)))
+    return files
+
+
+def files_unchanged(files: List[list], missing: Iterable[str], fs: SourceFS) -> bool:
+    """
+    Comprueba que ningún archivo registrado cambió y ninguna ruta ausente apareció.
+    
+    Un archivo con el mismo stat no se vuelve a leer; si solo cambió su
+    mtime, se compara el hash y el registro se actualiza con el stat nuevo.
+    """
+    for path in missing:
+        if fs.is_file(Path(path)):
+            return False
+    for record in files:
+        path, digest = record[0], record[1]
+        stat = _stat(fs, path)
+        if stat is not None and list(stat) == record[2:]:
+            continue
+        if not fs.is_file(Path(path)) or _sha256(fs.read_bytes(Path(path))) != digest:
+            return False
+        # Mismo contenido con otro mtime: basta con stat la próxima vez
+        record[2:] = list(stat) if stat is not None else [None, None]
+    return True
+
+
+def _source_fs(config: Dict[str, Any]) -> SourceFS:
+    """Fuente de archivos de la extensión, nueva en cada uso (sin listados cacheados)."""
+    return open_source_fs(config.get('source_bundle'), config.get('mmap_threshold', MMAP_THRESHOLD))
+
+
+def _stat(fs: SourceFS, path: str) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, tamaño) en disco local; None en otras fuentes (se compara el hash)."""
+    if not fs.is_local:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    metrics.count('stat_calls')
+    return st.st_mtime_ns, st.st_size
+
+
+# Cachés por directorio (None = solo memoria), compartidas por todo el proceso
+_caches: Dict[Optional[str], ExtensionCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory: Optional[str] = None) -> ExtensionCache:
+    """
+    Devuelve la caché compartida para un directorio.
+    
+    Args:
+        directory: Directorio de la caché en disco, o None para solo memoria
+    """
+    key = str(Path(directory).resolve()) if directory else None
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ExtensionCache(key)
+        return cache
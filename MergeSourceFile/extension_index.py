@@ -0,0 +1,193 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+Descubrimiento de extensiones externas mediante entry points.
+
+Un paquete instalado aporta extensiones declarando entry points del grupo
+'mergesourcefile.extensions'. El nombre del entry point es el nombre de la
+extensión en [jinja2] extensions y su valor apunta a un diccionario con la
+forma de una entrada de EXTENSION_REGISTRY:
+
+    [project.entry-points."mergesourcefile.extensions"]
+    liquibase = "msf_liquibase.extension:EXTENSION"
+
+    EXTENSION = {
+        "function": "process_liquibase",   # obligatorio
+        "priority": 20,                    # opcional (por defecto 100)
+        "namespace": "lb",                 # opcional (por defecto, el nombre)
+    }
+
+'module' es, por defecto, el módulo del entry point.
+
+Recorrer las distribuciones instaladas es lento, así que el índice nombre ->
+entry point se guarda en disco junto con una huella de sys.path (mtime de
+cada directorio: instalar o desinstalar un paquete la cambia) y solo se
+reconstruye si la huella cambia. Los módulos de las extensiones solo se
+importan al cargar las que están habilitadas.
+"""
+
+import os
+import sys
+import json
+import logging
+import tempfile
+import importlib
+import threading
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Grupo de entry points de las extensiones
+ENTRY_POINT_GROUP = 'mergesourcefile.extensions'
+
+# Versión del formato del índice en disco
+INDEX_FORMAT = 1
+
+# Prioridad de las extensiones externas que no la declaran
+DEFAULT_PRIORITY = 100
+
+# Índice en memoria: (huella, índice)
+_memo: Optional[tuple] = None
+_memo_lock = threading.Lock()
+
+
+def index_path() -> Path:
+    """Ruta del índice en disco ($XDG_CACHE_HOME/mergesourcefile/extensions.json)."""
+    cache_home = os.environ.get('XDG_CACHE_HOME') or str(Path.home() / '.cache')
+    return Path(cache_home) / 'mergesourcefile' / 'extensions.json'
+
+
+def _fingerprint() -> List[List[Any]]:
+    """Huella de sys.path: cada entrada con el mtime de su directorio (None si no existe)."""
+    fingerprint = []
+    for entry in sys.path:
+        try:
+            mtime = os.stat(entry or '.').st_mtime_ns
+        except OSError:
+            mtime = None
+        fingerprint.append([entry, mtime])
+    return fingerprint
+
+
+def _scan() -> Dict[str, Dict[str, str]]:
+    """Recorre las distribuciones instaladas buscando entry points de extensiones."""
+    index: Dict[str, Dict[str, str]] = {}
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name in index:
+            # Como importlib.metadata: gana la primera distribución en sys.path
+            continue
+        dist = getattr(entry_point, 'dist', None)
+        index[entry_point.name] = {
+            'value': entry_point.value,
+            'distribution': dist.name if dist is not None else '',
+            'version': dist.version if dist is not None else '',
+        }
+    logger.debug(f"Extensiones descubiertas: {sorted(index)}")
+    return index
+
+
+def _load_index(path: Path, fingerprint: List[List[Any]]) -> Optional[Dict[str, Dict[str, str]]]:
+    try:
+        data = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('format') != INDEX_FORMAT or data.get('fingerprint') != fingerprint:
+        return None
+    return data.get('extensions')
+
+
+def _store_index(path: Path, fingerprint: List[List[Any]], index: Dict[str, Dict[str, str]]) -> None:
+    data = json.dumps({'format': INDEX_FORMAT, 'fingerprint': fingerprint, 'extensions': index}, indent=2)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data + '\n')
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError as e:
+        # Sin caché en disco el descubrimiento sigue funcionando
+        logger.debug(f"No se pudo guardar el índice de extensiones en {path}: {e}")
+
+
+def discover(refresh: bool = False) -> Dict[str, Dict[str, str]]:
+    """
+    Extensiones externas instaladas, sin importar sus módulos.
+    
+    Args:
+        refresh: Ignorar los índices en memoria y en disco y recorrer de
+            nuevo las distribuciones instaladas
+    
+    Returns:
+        Diccionario nombre -> {'value', 'distribution', 'version'}
+    """
+    global _memo
+    fingerprint = _fingerprint()
+    with _memo_lock:
+        if not refresh and _memo is not None and _memo[0] == fingerprint:
+            return _memo[1]
+        
+        path = index_path()
+        index = None if refresh else _load_index(path, fingerprint)
+        if index is None:
+            index = _scan()
+            _store_index(path, fingerprint, index)
+        _memo = (fingerprint, index)
+        return index
+
+
+def load_extension(name: str) -> Dict[str, Any]:
+    """
+    Importa una extensión externa y devuelve su entrada de registro.
+    
+    Raises:
+        KeyError: Si no hay ninguna extensión instalada con ese nombre
+        ImportError: Si el entry point no puede cargarse
+        ValueError: Si la entrada no es válida
+    """
+    info = discover()[name]
+    module_name, _, attr = info['value'].partition(':')
+    module_name = module_name.strip()
+    module = importlib.import_module(module_name)
+    entry = module
+    for part in attr.strip().split('.') if attr.strip() else []:
+        entry = getattr(entry, part)
+    
+    if not isinstance(entry, dict) or 'function' not in entry:
+        raise ValueError(
+            f"El entry point de la extensión '{name}' ({info['value']}) debe apuntar "
+            f"a un diccionario con la clave 'function'"
+        )
+    ext_info = dict(entry)
+    ext_info.setdefault('module', module_name)
+    ext_info.setdefault('priority', DEFAULT_PRIORITY)
+    ext_info.setdefault('namespace', name)
+    ext_info.setdefault('description', f"{info['distribution']} {info['version']}".strip())
+    return ext_info
@@ -24,18 +24,32 @@
 Extensión SQLPlus para Jinja2.
 
 Funciones de pre-procesamiento para compatibilidad con SQL*Plus:
-- Resolución de inclusiones @ y @@
+- Resolución de inclusiones @ y @@ (antes del renderizado o, en modo
+  diferido, durante el renderizado mediante un loader de Jinja2)
+- Política include-once (global o con el pragma '-- msf:once')
 - Procesamiento de variables DEFINE/UNDEFINE
 """
 
+import os
 import re
+import json
 import logging
 from pathlib import Path
-from typing import Dict, Tuple
-from jinja2 import BaseLoader, TemplateError
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from jinja2 import BaseLoader, TemplateError, TemplateNotFound
+
+from .. import metrics
+from ..fs import MMAP_THRESHOLD, IncludeResolver, is_gzip_path, open_source_fs, search_paths_from_config
+from ..splice import DEFAULT_TEMPLATE_MARKERS, classify_inert, make_marker
 
 logger = logging.getLogger(__name__)
 
+# Prefijo de los nombres de plantilla generados para inclusiones diferidas
+_LAZY_PREFIX = 'sqlplus:'
+
+# Pragma que marca un archivo para incluirse una sola vez (en su primera línea)
+_ONCE_PRAGMA = re.compile(r'^\s*--\s*msf:once\s*$', re.IGNORECASE)
+
 
 class NoIncludeLoader(BaseLoader):
     """
@@ -51,6 +65,101 @@ class NoIncludeLoader(BaseLoader):
         )
 
 
+class SqlPlusIncludeLoader(NoIncludeLoader):
+    """
+    Loader que resuelve las inclusiones SQLPlus durante el renderizado Jinja2.
+    
+    Con lazy_includes=True cada línea @ / @@ se sustituye por un
+    {% include %} cuyo nombre codifica la ruta base, el directorio de
+    referencia y el archivo. Jinja2 solo lo carga si la rama que lo contiene
+    se ejecuta, y las plantillas compiladas quedan en su caché.
+    
+    Las variables &var que el archivo incluido no define se sustituyen por
+    la variable de contexto con namespace (sql_var), que Jinja2 resuelve al
+    renderizar. Los {% include %} propios de Jinja2 siguen deshabilitados.
+    
+    line_origins guarda, por archivo cargado, el origen (archivo, línea) de
+    cada línea de la plantilla generada (descontando las líneas DEFINE).
+    """
+    
+    def __init__(self, config: Dict):
+        self.line_origins: Dict[str, List[Tuple[str, int]]] = {}
+        self.resolver = _make_resolver(config)
+        self.process_defines = config.get('process_defines', True)
+        self.splice_markers = _splice_markers(config)
+        self.namespace = config.get('variable_namespace', 'sql')
+        self.variable_start, self.variable_end = config.get('variable_delimiters', ('{{', '}}'))
+    
+    def get_source(self, environment, template):
+        if not template.startswith(_LAZY_PREFIX):
+            return super().get_source(environment, template)
+        
+        base_path, relative_to, name = template[len(_LAZY_PREFIX):].split('|', 2)
+        try:
+            full_path = self.resolver.resolve(name, Path(relative_to))
+        except FileNotFoundError as e:
+            raise TemplateNotFound(template, str(e))
+        
+        # Jinja2 elimina un salto de línea final del código fuente: se añade uno
+        # extra para que el resultado sea idéntico al de la expansión previa
+        if (self.splice_markers is not None and self.resolver.fs.is_local
+                and not is_gzip_path(full_path)):
+            inert = classify_inert(full_path, self.splice_markers)
+            if inert is not None:
+                logger.info("|-- %s (diferido, inerte)", full_path.name)
+                return make_marker(full_path.resolve(), *inert) + '\n\n', str(full_path), lambda: True
+        
+        logger.info("|-- %s (diferido)", full_path.name)
+        with metrics.span(name, lazy=True):
+            lines = [
+                _lazy_include_line(line.rstrip(), Path(base_path), full_path.parent)
+                for line in self.resolver.fs.iter_lines(full_path, self.resolver.dependencies)
+            ]
+            removed: List[int] = []
+            origins = [(str(full_path), n) for n in range(1, len(lines) + 1)]
+            if self.process_defines:
+                lines, _, _ = _substitute_defines(lines, on_undefined=self._context_variable, removed=removed)
+            removed_set = set(removed)
+            self.line_origins[str(full_path)] = [o for i, o in enumerate(origins) if i not in removed_set]
+        
+        metrics.count('string_concats', len(lines))
+        source = ''.join(line + '\n' for line in lines)
+        return source + '\n', str(full_path), lambda: True
+    
+    def _context_variable(self, var_name: str) -> str:
+        """Expresión Jinja2 que referencia una variable DEFINE con namespace."""
+        return f"{self.variable_start} {self.namespace}_{var_name} {self.variable_end}"
+
+
+class IncludeOnce:
+    """
+    Estado de la política include-once durante una expansión de inclusiones.
+    
+    Registra cada archivo expandido (por ruta resuelta) junto con si lleva el
+    pragma '-- msf:once' y el tamaño de su expansión, para omitir las
+    inclusiones repetidas y contabilizar los bytes ahorrados.
+    """
+    
+    def __init__(self, all_files: bool = False):
+        self.all_files = all_files
+        self.expanded: Dict[str, Tuple[bool, int]] = {}
+        self.skipped = 0
+        self.bytes_saved = 0
+    
+    def skip(self, key: str) -> Optional[int]:
+        """Si la inclusión debe omitirse, la contabiliza y devuelve los bytes ahorrados."""
+        seen = self.expanded.get(key)
+        if seen is None or not (self.all_files or seen[0]):
+            return None
+        self.skipped += 1
+        self.bytes_saved += seen[1]
+        return seen[1]
+    
+    def record(self, key: str, once: bool, size: int) -> None:
+        """Registra la primera expansión de un archivo."""
+        self.expanded.setdefault(key, (once, size))
+
+
 def process_sqlplus(
     content: str,
     input_file: str,
@@ -72,23 +181,96 @@ def process_sqlplus(
         verbose: Modo verbose
     
     Returns:
-        Tuple[contenido_procesado, variables_define_extraidas]
+        Tuple[contenido_procesado, variables_define_extraidas]; si
+        config['track_line_origins'] es True se añade un tercer elemento con
+        el origen (archivo, línea) de cada línea del contenido procesado
     """
     extracted_variables = {}
+    origins: Optional[List[Tuple[str, int]]] = [] if config.get('track_line_origins', False) else None
     
     # 1. Procesar inclusiones @ / @@ (si está habilitado)
-    if config.get('process_includes', True):
+    if config.get('process_includes', True) and config.get('lazy_includes', False):
+        logger.info("Inclusiones SQLPlus (@, @@) diferidas al renderizado Jinja2")
+        if config.get('include_once', False):
+            logger.warning("include_once no se aplica con lazy_includes; se ignora")
+        with metrics.stage('include_read'):
+            content = _defer_includes(input_file, base_path, _make_resolver(config), origins,
+                                      _splice_markers(config))
+    elif config.get('process_includes', True):
         logger.info("Procesando inclusiones SQLPlus (@, @@)")
-        content = _process_includes(content, input_file, base_path, verbose)
+        with metrics.stage('include_read'):
+            content = _process_includes(content, input_file, base_path, verbose,
+                                        _splice_markers(config), _make_resolver(config),
+                                        IncludeOnce(config.get('include_once', False)), origins)
+    elif origins is not None:
+        origins.extend((input_file, n) for n in range(1, len(content.splitlines()) + 1))
     
     # 2. Procesar variables DEFINE / UNDEFINE (si está habilitado)
     if config.get('process_defines', True):
         logger.info("Procesando variables SQLPlus (DEFINE, UNDEFINE)")
-        content, extracted_variables = _process_defines_with_extraction(content, verbose)
+        removed: List[int] = []
+        with metrics.stage('define_substitution'):
+            content, extracted_variables = _process_defines_with_extraction(content, verbose, removed)
+        if origins is not None and removed:
+            removed_set = set(removed)
+            origins = [origin for i, origin in enumerate(origins) if i not in removed_set]
     
+    if origins is not None:
+        return content, extracted_variables, origins
     return content, extracted_variables
 
 
+def stream_sqlplus(
+    chunks: Iterable[str],
+    input_file: str,
+    base_path: str,
+    config: Dict,
+    verbose: bool = False
+) -> Iterator[str]:
+    """
+    Versión en streaming de process_sqlplus (contrato de extensión en streaming).
+    
+    Consume el contenido como fragmentos de una línea (con su salto, salvo
+    quizá la última) y emite el resultado del mismo modo, sin construir el
+    documento completo. Con process_includes los fragmentos recibidos no se
+    consumen: el archivo se lee (y sus inclusiones se expanden) línea a línea.
+    
+    Args:
+        chunks: Contenido a procesar, por líneas
+        input_file: Archivo de entrada (para resolver rutas relativas)
+        base_path: Ruta base para resolución de archivos
+        config: Configuración de la extensión sqlplus
+        verbose: Modo verbose
+    
+    Returns:
+        Generador de fragmentos cuyo valor de retorno son las variables DEFINE
+        extraídas, o Tuple[variables, orígenes] si config['track_line_origins']
+    """
+    pipeline = SqlPlusPipeline(config)
+    if config.get('process_includes', True):
+        lines = metrics.timed('include_read', pipeline.read(input_file, base_path))
+    elif config.get('process_defines', True):
+        lines = pipeline.split(chunks, input_file)
+    else:
+        # Sin nada que hacer el contenido pasa tal cual
+        for chunk in chunks:
+            if pipeline.origins is not None:
+                start = len(pipeline.origins)
+                pipeline.origins.extend((input_file, start + n) for n in range(1, len(chunk.splitlines()) + 1))
+            yield chunk
+        lines = None
+    
+    if lines is not None:
+        output = pipeline.preprocess(lines)
+        if config.get('process_defines', True):
+            output = metrics.timed('define_substitution', output)
+        yield from output
+    
+    if pipeline.origins is not None:
+        return pipeline.variables, pipeline.origins
+    return pipeline.variables
+
+
 def get_sqlplus_loader(config: Dict) -> BaseLoader:
     """
     Retorna el loader apropiado para SQLPlus basado en configuración.
@@ -97,14 +279,251 @@ def get_sqlplus_loader(config: Dict) -> BaseLoader:
         config: Configuración de la extensión SQLPlus
         
     Returns:
-        NoIncludeLoader si process_includes=True, None si no debe interferir
+        SqlPlusIncludeLoader si las inclusiones son diferidas, NoIncludeLoader
+        si process_includes=True, None si no debe interferir
     """
     if config.get('process_includes', True):
+        if config.get('lazy_includes', False):
+            return SqlPlusIncludeLoader(config)
         return NoIncludeLoader()
     return None
 
 
-def _process_includes(content: str, input_file: str, base_path: str, verbose: bool) -> str:
+def get_sqlplus_pipeline(config: Dict) -> Optional['SqlPlusPipeline']:
+    """
+    Retorna las etapas de la extensión para el modo pipeline.
+    
+    Args:
+        config: Configuración de la extensión SQLPlus
+        
+    Returns:
+        SqlPlusPipeline, o None si la extensión no tiene nada que hacer
+    """
+    if config.get('process_includes', True) or config.get('process_defines', True):
+        return SqlPlusPipeline(config)
+    return None
+
+
+class SqlPlusPipeline:
+    """
+    La extensión SQLPlus dividida en etapas para el modo pipeline.
+    
+    read() es la etapa de lectura (E/S de las inclusiones @ / @@) y emite las
+    líneas de la expansión; preprocess() es la de pre-procesamiento (DEFINE /
+    UNDEFINE) y emite fragmentos de texto cuya concatenación es el mismo
+    contenido que devuelve process_sqlplus. Ambas trabajan línea a línea, de
+    modo que cada una puede ejecutarse en su propio hilo.
+    
+    variables y origins están completos cuando preprocess() se agota.
+    """
+    
+    def __init__(self, config: Dict):
+        self.config = config
+        self.variables: Dict[str, str] = {}
+        self.origins: Optional[List[Tuple[str, int]]] = [] if config.get('track_line_origins', False) else None
+    
+    def read(self, input_file: str, base_path: str) -> Iterator[str]:
+        """Líneas del archivo principal con las inclusiones expandidas (o diferidas)."""
+        config = self.config
+        resolver = _make_resolver(config)
+        if config.get('process_includes', True) and config.get('lazy_includes', False):
+            logger.info("Inclusiones SQLPlus (@, @@) diferidas al renderizado Jinja2")
+            if config.get('include_once', False):
+                logger.warning("include_once no se aplica con lazy_includes; se ignora")
+            yield from _iter_deferred_includes(input_file, base_path, resolver, self.origins,
+                                               _splice_markers(config))
+        elif config.get('process_includes', True):
+            logger.info("Procesando inclusiones SQLPlus (@, @@)")
+            logger.info("Árbol de inclusiones:")
+            input_path = Path(input_file)
+            include_once = IncludeOnce(config.get('include_once', False))
+            with metrics.span(input_path.name, depth=0):
+                yield from _iter_file_recursive(
+                    str(input_path), input_path.parent if input_path.is_absolute() else Path(base_path),
+                    0, False, _splice_markers(config), resolver, include_once, self.origins
+                )
+            if include_once.skipped:
+                logger.info(
+                    f"Include-once: {include_once.skipped} inclusiones repetidas omitidas "
+                    f"({include_once.bytes_saved} bytes ahorrados)"
+                )
+        else:
+            input_path = Path(input_file)
+            for line_number, line in enumerate(resolver.fs.iter_lines(input_path, resolver.dependencies), 1):
+                if self.origins is not None:
+                    self.origins.append((input_file, line_number))
+                yield line
+    
+    def split(self, chunks: Iterable[str], input_file: str) -> Iterator[str]:
+        """Líneas (sin salto) del contenido recibido en fragmentos, sin leer el archivo."""
+        line_number = 0
+        for chunk in chunks:
+            for line in chunk.splitlines():
+                line_number += 1
+                if self.origins is not None:
+                    self.origins.append((input_file, line_number))
+                yield line
+    
+    def preprocess(self, lines: Iterable[str]) -> Iterator[str]:
+        """Aplica DEFINE / UNDEFINE a las líneas y emite el texto resultante, una línea por fragmento."""
+        if not self.config.get('process_defines', True):
+            # Sin DEFINE el contenido es la expansión tal cual, con salto en cada línea
+            for line in lines:
+                yield line + '\n'
+            return
+        
+        logger.info("Procesando variables SQLPlus (DEFINE, UNDEFINE)")
+        removed: Optional[List[int]] = [] if self.origins is not None else None
+        replacement_count: Dict[str, int] = {}
+        # Como "\n".join(): salto de línea tras cada línea salvo la última
+        previous = None
+        for line in _iter_substitute_defines(lines, self.variables, replacement_count, removed=removed):
+            if previous is not None:
+                yield previous + '\n'
+            previous = line
+        if previous is not None:
+            yield previous
+        metrics.count('substitutions', sum(replacement_count.values()))
+        _log_substitution_summary(replacement_count)
+        if removed:
+            removed_set = set(removed)
+            self.origins[:] = [origin for i, origin in enumerate(self.origins) if i not in removed_set]
+
+
+def _make_resolver(config: Dict) -> IncludeResolver:
+    """Construye el resolvedor de inclusiones según la configuración."""
+    return IncludeResolver(
+        open_source_fs(config.get('source_bundle'), config.get('mmap_threshold', MMAP_THRESHOLD)),
+        search_paths_from_config(config),
+        config.get('dependencies')
+    )
+
+
+def _splice_markers(config: Dict) -> Optional[Tuple[str, ...]]:
+    """
+    Delimitadores para clasificar archivos inertes, o None si no se empalman.
+    
+    Al seguir el origen de las líneas no se empalma: cada línea de un archivo
+    inerte debe conservar su propio origen.
+    """
+    if config.get('splice_inert_files', False) and not config.get('track_line_origins', False):
+        return tuple(config.get('template_markers', DEFAULT_TEMPLATE_MARKERS))
+    return None
+
+
+def _include_target(line: str, base_path: Path, parent_dir: Path) -> Optional[Tuple[str, Path]]:
+    """(archivo, directorio de referencia) de una línea @ / @@, o None si no es una inclusión."""
+    if line.startswith('@@'):
+        return line[2:].strip(), parent_dir
+    if line.startswith('@'):
+        return line[1:].strip(), base_path
+    return None
+
+
+def _lazy_include_line(line: str, base_path: Path, parent_dir: Path) -> str:
+    """Sustituye una línea @ / @@ por un {% include %} diferido; el resto no cambia."""
+    target = _include_target(line, base_path, parent_dir)
+    if target is None:
+        return line
+    
+    name, relative_to = target
+    template_name = f"{_LAZY_PREFIX}{base_path.as_posix()}|{relative_to.as_posix()}|{name}"
+    return "{% include " + json.dumps(template_name, ensure_ascii=False) + " %}"
+
+
+def _defer_includes(input_file: str, base_path: str, resolver: IncludeResolver,
+                    origins: Optional[List[Tuple[str, int]]] = None,
+                    splice_markers: Optional[Sequence[str]] = None) -> str:
+    """
+    Lee el archivo principal sustituyendo sus inclusiones por {% include %} diferidos.
+    
+    El resultado tiene la misma estructura de líneas que _process_includes,
+    de modo que el procesamiento de DEFINE se aplica igual sobre él.
+    """
+    lines = _iter_deferred_includes(input_file, base_path, resolver, origins, splice_markers)
+    lines = [line + '\n' for line in lines]
+    metrics.count('string_concats', len(lines))
+    return ''.join(lines)
+
+
+def _iter_deferred_includes(input_file: str, base_path: str, resolver: IncludeResolver,
+                            origins: Optional[List[Tuple[str, int]]] = None,
+                            splice_markers: Optional[Sequence[str]] = None) -> Iterator[str]:
+    """
+    Versión en streaming de _defer_includes: emite las líneas sin salto final.
+    
+    Una inclusión en la última línea no se difiere: se expande en el sitio
+    (con sus propias inclusiones diferidas), seguida de la línea vacía del
+    @ / @@ como en _process_includes. Jinja2 elimina un único salto de línea
+    final del documento; con un {% include %} en la última línea ese salto
+    sería el del archivo incluido y la salida acabaría en un salto de más.
+    
+    Raises:
+        ValueError: Si la cadena de inclusiones en la última línea es circular
+    """
+    input_path = Path(input_file)
+    if not resolver.fs.is_file(input_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {input_path}")
+    if resolver.dependencies is not None:
+        resolver.dependencies.note_read(input_path)
+    base = input_path.parent if input_path.is_absolute() else Path(base_path)
+    
+    path = input_path
+    active = [_once_key(path, resolver)]
+    # Inclusiones de última línea expandidas en el sitio: (archivo, línea del @)
+    trailing: List[Tuple[Path, int]] = []
+    while path is not None:
+        last = None
+        for line_number, line in enumerate(resolver.fs.iter_lines(path, resolver.dependencies), 1):
+            if last is not None:
+                if origins is not None:
+                    origins.append((str(path), last[0]))
+                yield _lazy_include_line(last[1], base, path.parent)
+            last = (line_number, line.rstrip())
+        if last is None:
+            break
+        
+        line_number, line = last
+        target = _include_target(line, base, path.parent)
+        if target is None:
+            if origins is not None:
+                origins.append((str(path), line_number))
+            yield line
+            break
+        
+        full_path = resolver.resolve(*target)
+        trailing.append((path, line_number))
+        if (splice_markers is not None and resolver.fs.is_local
+                and not is_gzip_path(full_path)):
+            inert = classify_inert(full_path, splice_markers)
+            if inert is not None:
+                logger.info("|-- %s (inerte)", full_path.name)
+                metrics.count('files_spliced')
+                metrics.count('bytes_spliced', inert[0])
+                if origins is not None:
+                    origins.append((str(path), line_number))
+                yield make_marker(full_path.resolve(), *inert)
+                break
+        
+        key = _once_key(full_path, resolver)
+        if key in active:
+            chain = ' -> '.join([str(p) for p, _ in trailing] + [str(full_path)])
+            raise ValueError(f"Inclusión circular: {chain}")
+        active.append(key)
+        logger.info("|-- %s", full_path.name)
+        path = full_path
+    
+    for parent, line_number in reversed(trailing):
+        if origins is not None:
+            origins.append((str(parent), line_number))
+        yield ''
+
+
+def _process_includes(content: str, input_file: str, base_path: str, verbose: bool,
+                      splice_markers: Optional[Sequence[str]] = None,
+                      resolver: Optional[IncludeResolver] = None,
+                      include_once: Optional[IncludeOnce] = None,
+                      origins: Optional[List[Tuple[str, int]]] = None) -> str:
     """
     Resuelve inclusiones @ y @@ en el contenido.
     
@@ -115,6 +534,12 @@ def _process_includes(content: str, input_file: str, base_path: str, verbose: bo
         input_file: Archivo de entrada
         base_path: Ruta base para resolución
         verbose: Modo verbose
+        splice_markers: Delimitadores de plantilla para clasificar archivos
+            inertes; si es None no se empalman archivos
+        resolver: Resolución de inclusiones y acceso a archivos (por defecto,
+            disco local sin rutas de búsqueda adicionales)
+        include_once: Estado include-once; si es None no se omite ninguna inclusión
+        origins: Si se indica, recibe el origen (archivo, línea) de cada línea
     
     Returns:
         Contenido con inclusiones expandidas
@@ -122,92 +547,348 @@ def _process_includes(content: str, input_file: str, base_path: str, verbose: bo
     input_path = Path(input_file)
     logger.info("Árbol de inclusiones:")
     
-    return _read_file_recursive(
-        file_path=str(input_path),
-        base_path=input_path.parent if input_path.is_absolute() else Path(base_path),
-        tree_depth=0,
-        verbose=verbose
-    )
+    with metrics.span(input_path.name, depth=0):
+        content = _read_file_recursive(
+            file_path=str(input_path),
+            base_path=input_path.parent if input_path.is_absolute() else Path(base_path),
+            tree_depth=0,
+            verbose=verbose,
+            splice_markers=splice_markers,
+            resolver=resolver if resolver is not None else IncludeResolver(),
+            include_once=include_once,
+            origins=origins
+        )
+    
+    if include_once is not None and include_once.skipped:
+        logger.info(
+            f"Include-once: {include_once.skipped} inclusiones repetidas omitidas "
+            f"({include_once.bytes_saved} bytes ahorrados)"
+        )
+    return content
 
 
-def _read_file_recursive(file_path: str, base_path: Path, tree_depth: int, verbose: bool) -> str:
+def _read_file_recursive(file_path: str, base_path: Path, tree_depth: int, verbose: bool,
+                         splice_markers: Optional[Sequence[str]] = None,
+                         resolver: Optional[IncludeResolver] = None,
+                         include_once: Optional[IncludeOnce] = None,
+                         origins: Optional[List[Tuple[str, int]]] = None) -> Optional[str]:
     """
     Lee archivo recursivamente resolviendo inclusiones @ y @@.
     
+    Los archivos incluidos inertes (ver MergeSourceFile.splice) se sustituyen
+    por una marca de empalme si splice_markers no es None.
+    
+    Con include_once, una inclusión repetida de un archivo ya expandido se
+    omite si la política es global o si el archivo lleva '-- msf:once' en
+    su primera línea.
+    
     Args:
         file_path: Archivo a procesar
         base_path: Ruta base para resolución
         tree_depth: Profundidad del árbol (para logging)
         verbose: Modo verbose
+        splice_markers: Delimitadores de plantilla para clasificar archivos inertes
+        resolver: Resolución de inclusiones y acceso a archivos
+        include_once: Estado include-once compartido por toda la expansión
+        origins: Si se indica, recibe el origen (archivo, línea) de cada línea
+            emitida; un archivo empalmado ocupa una línea (la de su marca)
     
     Returns:
-        Contenido expandido
+        Contenido expandido, o None si la inclusión se omite por include-once
     """
-    # Si es el archivo principal (tree_depth=0) o path absoluto, usar path directamente
-    if tree_depth == 0 or Path(file_path).is_absolute():
+    lines = _iter_file_recursive(file_path, base_path, tree_depth, verbose, splice_markers,
+                                 resolver, include_once, origins)
+    if lines is None:
+        return None
+    lines = [line + '\n' for line in lines]
+    metrics.count('string_concats', len(lines))
+    return ''.join(lines)
+
+
+class _IncludeFrame:
+    """Archivo en curso de expansión dentro de _iter_include_tree."""
+    
+    __slots__ = ('path', 'base_path', 'depth', 'once_key', 'lines', 'once_pragma',
+                 'start_size', 'include_line', 'span', 'key')
+    
+    def __init__(self, path: Path, base_path: Path, depth: int, once_key: Optional[str],
+                 lines: Iterator[Tuple[int, str]]):
+        self.path = path
+        self.base_path = base_path
+        self.depth = depth
+        self.once_key = once_key
+        self.lines = lines
+        self.once_pragma = False
+        self.start_size = 0
+        self.include_line = 0
+        self.span = None
+        self.key: Optional[str] = None
+
+
+def _open_include(file_path: str, base_path: Path, tree_depth: int,
+                  splice_markers: Optional[Sequence[str]], resolver: IncludeResolver,
+                  include_once: Optional[IncludeOnce]) -> Union[None, str, _IncludeFrame]:
+    """
+    Resuelve un archivo a expandir.
+    
+    Returns:
+        None si la inclusión se omite por include-once, la marca de empalme si
+        el archivo es inerte, o el _IncludeFrame con sus líneas por leer
+    """
+    if tree_depth == 0:
+        # Archivo principal: usar path directamente
         full_path = Path(file_path)
+        if not resolver.fs.is_file(full_path):
+            raise FileNotFoundError(f"Archivo no encontrado: {full_path}")
+        if resolver.dependencies is not None:
+            resolver.dependencies.note_read(full_path)
     else:
-        # Para archivos incluidos, resolver relativo a base_path
-        full_path = base_path / file_path
-    
-    if not full_path.exists():
-        raise FileNotFoundError(f"Archivo no encontrado: {full_path}")
+        # Archivos incluidos: relativo a base_path y, si no existe, rutas de búsqueda
+        full_path = resolver.resolve(file_path, base_path)
     
-    # Prefijo para visualizar el árbol
+    # Prefijo para visualizar el árbol (el mensaje se formatea solo si se emite)
     prefix = "    " * tree_depth + "|-- "
-    logger.info(prefix + f"{full_path.name}")
     
-    content = ""
-    for line in full_path.read_text(encoding='utf-8').splitlines():
-        line = line.rstrip()
-        logger.debug(f"Procesando línea: {line}")
-        
-        if line.startswith('@@'):
-            # @@ = relativo al directorio del archivo padre
-            nested_file = line[2:].strip()
-            logger.debug(f"Inclusión @@: {nested_file}")
-            content += _read_file_recursive(nested_file, full_path.parent, tree_depth + 1, verbose) + '\n'
-        elif line.startswith('@'):
-            # @ = relativo a base_path
-            nested_file = line[1:].strip()
-            logger.debug(f"Inclusión @: {nested_file}")
-            content += _read_file_recursive(nested_file, base_path, tree_depth + 1, verbose) + '\n'
-        else:
-            content += line + '\n'
+    once_key = None
+    if include_once is not None:
+        once_key = _once_key(full_path, resolver)
+        saved = include_once.skip(once_key)
+        if saved is not None:
+            metrics.count('includes_skipped')
+            logger.info("%s%s (ya incluido, %d bytes omitidos)", prefix, full_path.name, saved)
+            return None
     
-    return content
+    if (tree_depth > 0 and splice_markers is not None
+            and resolver.fs.is_local and not is_gzip_path(full_path)):
+        inert = classify_inert(full_path, splice_markers)
+        if inert is not None:
+            logger.info("%s%s (inerte)", prefix, full_path.name)
+            metrics.count('files_spliced')
+            metrics.count('bytes_spliced', inert[0])
+            if include_once is not None:
+                first_line = next(iter(resolver.fs.iter_lines(full_path)), '')
+                metrics.count('regex_calls')
+                include_once.record(once_key, bool(_ONCE_PRAGMA.match(first_line)), inert[0])
+            return make_marker(full_path.resolve(), *inert)
+    
+    logger.info("%s%s", prefix, full_path.name)
+    if metrics.enabled():
+        metrics.count('files_read')
+        metrics.count('bytes_in', resolver.fs.size(full_path))
+    
+    return _IncludeFrame(full_path, base_path, tree_depth, once_key,
+                         enumerate(resolver.fs.iter_lines(full_path, resolver.dependencies), 1))
 
 
-def _process_defines_with_extraction(content: str, verbose: bool) -> Tuple[str, Dict[str, str]]:
+def _iter_file_recursive(file_path: str, base_path: Path, tree_depth: int, verbose: bool,
+                         splice_markers: Optional[Sequence[str]] = None,
+                         resolver: Optional[IncludeResolver] = None,
+                         include_once: Optional[IncludeOnce] = None,
+                         origins: Optional[List[Tuple[str, int]]] = None) -> Optional[Iterator[str]]:
+    """
+    Como _read_file_recursive, pero devuelve las líneas (sin salto de línea) de
+    la expansión a medida que se leen, o None si la inclusión se omite.
+    
+    La resolución del archivo, include-once y el empalme se deciden al llamar;
+    la lectura y las inclusiones anidadas, al iterar.
+    """
+    if resolver is None:
+        resolver = IncludeResolver()
+    opened = _open_include(file_path, base_path, tree_depth, splice_markers, resolver, include_once)
+    if opened is None or isinstance(opened, str):
+        return None if opened is None else iter([opened])
+    return _iter_include_tree(opened, splice_markers, resolver, include_once, origins)
+
+
+def _iter_include_tree(root: _IncludeFrame, splice_markers: Optional[Sequence[str]],
+                       resolver: IncludeResolver, include_once: Optional[IncludeOnce],
+                       origins: Optional[List[Tuple[str, int]]]) -> Iterator[str]:
+    """
+    Expande el árbol de inclusiones con una pila explícita.
+    
+    Cada línea se emite una sola vez desde este generador, sin atravesar un
+    generador por nivel de anidamiento: el coste por línea no depende de la
+    profundidad de la inclusión. La expansión de cada inclusión va seguida de
+    una línea vacía (la del propio @ / @@).
+    
+    Raises:
+        ValueError: Si un archivo se incluye a sí mismo, directa o
+            indirectamente (inclusión circular)
+    """
+    stack = [root]
+    # Archivos en expansión (los de la pila), para detectar inclusiones circulares
+    root.key = root.once_key or _once_key(root.path, resolver)
+    active = {root.key}
+    # Bytes emitidos (con saltos de línea), para el tamaño de cada expansión en include-once
+    emitted = 0
+    track_size = include_once is not None
+    # Se consulta una vez: sin DEBUG, las líneas no pagan ni el formateo ni la llamada
+    debug = logger.isEnabledFor(logging.DEBUG)
+    try:
+        while stack:
+            frame = stack[-1]
+            for line_number, line in frame.lines:
+                line = line.rstrip()
+                if debug:
+                    logger.debug("Procesando línea: %s", line)
+                
+                if line_number == 1:
+                    metrics.count('regex_calls')
+                    frame.once_pragma = bool(_ONCE_PRAGMA.match(line))
+                
+                if line.startswith('@@'):
+                    # @@ = relativo al directorio del archivo padre
+                    nested_file = line[2:].strip()
+                    if debug:
+                        logger.debug("Inclusión @@: %s", nested_file)
+                    relative_to = frame.path.parent
+                elif line.startswith('@'):
+                    # @ = relativo a base_path
+                    nested_file = line[1:].strip()
+                    if debug:
+                        logger.debug("Inclusión @: %s", nested_file)
+                    relative_to = frame.base_path
+                else:
+                    if origins is not None:
+                        origins.append((str(frame.path), line_number))
+                    if track_size:
+                        emitted += len(line.encode('utf-8')) + 1
+                    yield line
+                    continue
+                
+                span = metrics.span(nested_file, depth=frame.depth + 1)
+                span.__enter__()
+                opened = _open_include(nested_file, relative_to, frame.depth + 1,
+                                       splice_markers, resolver, include_once)
+                if isinstance(opened, _IncludeFrame):
+                    opened.key = opened.once_key or _once_key(opened.path, resolver)
+                    if opened.key in active:
+                        span.__exit__(None, None, None)
+                        chain = ' -> '.join(str(f.path) for f in stack + [opened])
+                        raise ValueError(f"Inclusión circular: {chain}")
+                    active.add(opened.key)
+                    opened.span, opened.include_line, opened.start_size = span, line_number, emitted
+                    stack.append(opened)
+                    break
+                span.__exit__(None, None, None)
+                if opened is not None:
+                    # Marca de empalme de un archivo inerte, seguida de la línea vacía
+                    if origins is not None:
+                        origins.append((str(frame.path), line_number))
+                    emitted += len(opened.encode('utf-8')) + 2
+                    yield opened
+                    yield ''
+            else:
+                # Archivo terminado
+                stack.pop()
+                active.discard(frame.key)
+                if include_once is not None:
+                    include_once.record(frame.once_key, frame.once_pragma, emitted - frame.start_size)
+                if frame.span is not None:
+                    frame.span.__exit__(None, None, None)
+                if stack:
+                    if origins is not None:
+                        origins.append((str(stack[-1].path), frame.include_line))
+                    emitted += 1
+                    yield ''
+    finally:
+        for frame in stack:
+            if frame.span is not None:
+                frame.span.__exit__(None, None, None)
+
+
+def _once_key(full_path: Path, resolver: IncludeResolver) -> str:
+    """Clave que identifica un archivo resuelto a efectos de include-once."""
+    if resolver.fs.is_local:
+        return os.path.normcase(str(full_path.resolve()))
+    return os.path.normpath(str(full_path))
+
+
+def _process_defines_with_extraction(content: str, verbose: bool,
+                                     removed: Optional[List[int]] = None) -> Tuple[str, Dict[str, str]]:
     """
     Procesa variables DEFINE y UNDEFINE, extrayendo las variables para Jinja2.
     
     Args:
         content: Contenido a procesar
         verbose: Modo verbose
+        removed: Si se indica, recibe los índices (base 0) de las líneas eliminadas
     
     Returns:
         Tuple[contenido_con_variables_sustituidas, variables_extraidas]
     """
+    replaced_lines, defines, replacement_count = _substitute_defines(content.splitlines(), removed=removed)
+    metrics.count('substitutions', sum(replacement_count.values()))
+    _log_substitution_summary(replacement_count)
+    return "\n".join(replaced_lines), defines
+
+
+def _log_substitution_summary(replacement_count: Dict[str, int]) -> None:
+    """Muestra el resumen de sustituciones por variable."""
+    logger.info("\nResumen de sustituciones:")
+    if replacement_count:
+        max_var_length = max(len(var) for var in replacement_count)
+        for var, count in replacement_count.items():
+            logger.info(f"{var.ljust(max_var_length)}\t{count}")
+    else:
+        logger.info("No se realizaron sustituciones de variables.")
+
+
+def _substitute_defines(
+    lines: List[str],
+    on_undefined: Optional[Callable[[str], str]] = None,
+    removed: Optional[List[int]] = None
+) -> Tuple[List[str], Dict[str, str], Dict[str, int]]:
+    """
+    Aplica DEFINE / UNDEFINE y sustituye las variables &var línea a línea.
+    
+    Args:
+        lines: Líneas a procesar
+        on_undefined: Si se indica, devuelve el texto que sustituye a una
+            variable no definida en lugar de lanzar ValueError
+        removed: Si se indica, recibe los índices (base 0) de las líneas
+            DEFINE / UNDEFINE eliminadas
+    
+    Returns:
+        Tuple[líneas_resultantes, variables_definidas, sustituciones_por_variable]
+    """
     defines: Dict[str, str] = {}
-    replaced_lines = []
     replacement_count: Dict[str, int] = {}
+    replaced_lines = list(_iter_substitute_defines(lines, defines, replacement_count, on_undefined, removed))
+    return replaced_lines, defines, replacement_count
+
+
+def _iter_substitute_defines(
+    lines: Iterable[str],
+    defines: Dict[str, str],
+    replacement_count: Dict[str, int],
+    on_undefined: Optional[Callable[[str], str]] = None,
+    removed: Optional[List[int]] = None
+) -> Iterator[str]:
+    """
+    Versión en streaming de _substitute_defines: consume y emite líneas.
     
+    defines y replacement_count se rellenan a medida que se itera y están
+    completos al agotar el iterador.
+    """
     # Patrones regex
     define_pattern = re.compile(r'^define\s+(\w+)\s*=\s*(?:\'(.*?)\'|([^\s;]+))\s*;?\s*$', re.IGNORECASE)
     undefine_pattern = re.compile(r'^undefine\s+(\w+)\s*;\s*$', re.IGNORECASE)
     variable_pattern = re.compile(r"(&\w+)(\.\.)?")
+    regex_calls = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
     
-    for line_number, line in enumerate(content.splitlines(), 1):
+    for line_number, line in enumerate(lines, 1):
         clean = line.rstrip()
         
         # Comentarios se preservan sin procesar
         if clean.lstrip().startswith('--'):
-            replaced_lines.append(line)
+            yield line
             continue
         
         # Detectar líneas DEFINE
         if clean.lstrip().upper().startswith('DEFINE '):
+            regex_calls += 1
             match = define_pattern.match(clean)
             if match:
                 var_name = match.group(1)
@@ -218,59 +899,64 @@ def _process_defines_with_extraction(content: str, verbose: bool) -> Tuple[str,
                     raise ValueError(f"Error: DEFINE con valor inválido en línea {line_number}: '{clean.strip()}'")
                 
                 defines[var_name] = var_value
-                logger.debug(f"Definiendo variable: {var_name} = {var_value}")
+                if debug:
+                    logger.debug("Definiendo variable: %s = %s", var_name, var_value)
                 
                 # Inicializar contador
                 if var_name not in replacement_count:
                     replacement_count[var_name] = 0
+                if removed is not None:
+                    removed.append(line_number - 1)
                 continue
             else:
                 # Sintaxis DEFINE inválida - ignorar
-                logger.debug(f"Ignorando DEFINE con sintaxis inválida en línea {line_number}: '{clean.strip()}'")
+                if debug:
+                    logger.debug("Ignorando DEFINE con sintaxis inválida en línea %d: '%s'",
+                                 line_number, clean.strip())
         
         # Detectar líneas UNDEFINE
+        regex_calls += 1
         match_undefine = undefine_pattern.match(clean)
         if match_undefine:
             var_name = match_undefine.group(1)
             if var_name in defines:
                 del defines[var_name]
-            logger.debug(f"Variable indefinida: {var_name}")
+            if debug:
+                logger.debug("Variable indefinida: %s", var_name)
+            if removed is not None:
+                removed.append(line_number - 1)
             continue
         
         # Reemplazar variables en la línea
+        regex_calls += 1
         all_matches = variable_pattern.findall(clean)
         replaced_line = clean
         
         for match in all_matches:
             var_name = match[0][1:]  # Sin el símbolo '&'
-            if var_name not in defines:
+            if var_name in defines:
+                value = defines[var_name]
+            elif on_undefined is not None:
+                value = on_undefined(var_name)
+            else:
                 raise ValueError(
                     f"Error: La variable '{var_name}' se usa antes de ser definida (línea {line_number})."
                 )
             
-            value = defines[var_name]
-            
             # Reemplazar
             if match[1]:  # Tiene concatenación '..'
                 replaced_line = replaced_line.replace(match[0] + "..", value + ".")
             else:
                 replaced_line = replaced_line.replace(match[0], value)
             
-            logger.debug(f"Reemplazando variable {var_name} con valor {value} en línea {line_number}")
-            replacement_count[var_name] += 1
+            if debug:
+                logger.debug("Reemplazando variable %s con valor %s en línea %d",
+                             var_name, value, line_number)
+            replacement_count[var_name] = replacement_count.get(var_name, 0) + 1
         
-        replaced_lines.append(replaced_line)
+        yield replaced_line
     
-    # Mostrar resumen de sustituciones
-    logger.info("\nResumen de sustituciones:")
-    if replacement_count:
-        max_var_length = max(len(var) for var in replacement_count)
-        for var, count in replacement_count.items():
-            logger.info(f"{var.ljust(max_var_length)}\t{count}")
-    else:
-        logger.info("No se realizaron sustituciones de variables.")
-    
-    return "\n".join(replaced_lines), defines
+    metrics.count('regex_calls', regex_calls)
 
 
 def _process_defines(content: str, verbose: bool) -> str:
@@ -292,6 +978,7 @@ def _process_defines(content: str, verbose: bool) -> str:
     define_pattern = re.compile(r'^define\s+(\w+)\s*=\s*(?:\'(.*?)\'|([^\s;]+))\s*;?\s*$', re.IGNORECASE)
     undefine_pattern = re.compile(r'^undefine\s+(\w+)\s*;\s*$', re.IGNORECASE)
     variable_pattern = re.compile(r"(&\w+)(\.\.)?")
+    debug = logger.isEnabledFor(logging.DEBUG)
     
     for line_number, line in enumerate(content.splitlines(), 1):
         clean = line.rstrip()
@@ -313,7 +1000,8 @@ def _process_defines(content: str, verbose: bool) -> str:
                     raise ValueError(f"Error: DEFINE con valor inválido en línea {line_number}: '{clean.strip()}'")
                 
                 defines[var_name] = var_value
-                logger.debug(f"Definiendo variable: {var_name} = {var_value}")
+                if debug:
+                    logger.debug("Definiendo variable: %s = %s", var_name, var_value)
                 
                 # Inicializar contador
                 if var_name not in replacement_count:
@@ -321,7 +1009,9 @@ def _process_defines(content: str, verbose: bool) -> str:
                 continue
             else:
                 # Sintaxis DEFINE inválida - ignorar
-                logger.debug(f"Ignorando DEFINE con sintaxis inválida en línea {line_number}: '{clean.strip()}'")
+                if debug:
+                    logger.debug("Ignorando DEFINE con sintaxis inválida en línea %d: '%s'",
+                                 line_number, clean.strip())
         
         # Detectar líneas UNDEFINE
         match_undefine = undefine_pattern.match(clean)
@@ -329,7 +1019,8 @@ def _process_defines(content: str, verbose: bool) -> str:
             var_name = match_undefine.group(1)
             if var_name in defines:
                 del defines[var_name]
-            logger.debug(f"Variable indefinida: {var_name}")
+            if debug:
+                logger.debug("Variable indefinida: %s", var_name)
             continue
         
         # Reemplazar variables en la línea
@@ -351,7 +1042,9 @@ def _process_defines(content: str, verbose: bool) -> str:
             else:
                 replaced_line = replaced_line.replace(match[0], value)
             
-            logger.debug(f"Reemplazando variable {var_name} con valor {value} en línea {line_number}")
+            if debug:
+                logger.debug("Reemplazando variable %s con valor %s en línea %d",
+                             var_name, value, line_number)
             replacement_count[var_name] += 1
         
         replaced_lines.append(replaced_line)
@@ -0,0 +1,540 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Capa de acceso a archivos fuente.
+
+Abstrae de dónde se leen los archivos incluidos para que la resolución de
+inclusiones sea intercambiable (disco, memoria, ...).
+
+Funcionalidades:
+- SourceFS: interfaz mínima (existencia, tamaño, lectura por líneas)
+- LocalFS: disco local con caché de listados de directorio vía os.scandir
+- MemoryFS: archivos en memoria (pruebas, fuentes generadas)
+- ZipFS: lectura directa desde un paquete .zip usando su directorio central
+- SourceFSLoader: loader de Jinja2 sobre cualquier SourceFS
+- Descompresión transparente en streaming de archivos .gz
+- IncludeResolver: resolución de inclusiones con rutas de búsqueda tipo SQLPATH
+- Dependencies: registro de los archivos que determinan un resultado
+"""
+
+import os
+import sys
+import gzip
+import mmap
+import hashlib
+import logging
+import zipfile
+import posixpath
+import threading
+from pathlib import Path, PurePath
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from jinja2 import BaseLoader, TemplateNotFound
+from jinja2.loaders import split_template_path
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Tamaño a partir del cual los archivos se leen mediante mmap
+MMAP_THRESHOLD = 32 * 1024 * 1024
+
+# En sistemas de archivos que no distinguen mayúsculas, los nombres se comparan normalizados
+_CASE_INSENSITIVE = sys.platform in ('win32', 'darwin')
+
+
+def _name_key(name: str) -> str:
+    return name.casefold() if _CASE_INSENSITIVE else name
+
+
+def is_gzip_path(path: PurePath) -> bool:
+    """Indica si la ruta corresponde a un archivo comprimido con gzip."""
+    return PurePath(path).suffix.lower() == '.gz'
+
+
+def file_digest(data: bytes) -> str:
+    """Hash (sha256) del contenido almacenado de un archivo, como lo anota Dependencies."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class _HashingReader:
+    """Envuelve un archivo binario y acumula en hasher los bytes que se leen de él."""
+
+    def __init__(self, raw, hasher) -> None:
+        self.raw = raw
+        self.hasher = hasher
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.hasher.update(data)
+        return data
+
+
+class SourceFS:
+    """
+    Interfaz de acceso a archivos fuente.
+
+    Las rutas son objetos Path tal como los construye la resolución de
+    inclusiones; cada implementación decide cómo interpretarlas.
+    """
+
+    #: Los archivos son rutas reales del disco (permite empalmar bytes)
+    is_local = False
+
+    def is_file(self, path: PurePath) -> bool:
+        """Indica si la ruta existe y es un archivo."""
+        raise NotImplementedError
+
+    def size(self, path: PurePath) -> int:
+        """Tamaño del archivo en bytes."""
+        raise NotImplementedError
+
+    def read_bytes(self, path: PurePath) -> bytes:
+        """Contenido completo del archivo, tal como está almacenado."""
+        raise NotImplementedError
+
+    def _read(self, path: PurePath) -> Tuple[bytes, Optional[Tuple[int, int]]]:
+        """Contenido almacenado y (mtime_ns, tamaño) tomado antes de leerlo, si la fuente lo tiene."""
+        return self.read_bytes(path), None
+
+    def _decoded(self, path: PurePath, dependencies: Optional['Dependencies'] = None) -> str:
+        """
+        Contenido en UTF-8, descomprimido si el archivo es .gz.
+
+        Con dependencies, anota el archivo con el hash de los bytes leídos.
+        """
+        if dependencies is None:
+            data = self.read_bytes(path)
+        else:
+            data, stat = self._read(path)
+            dependencies.note_read(path, file_digest(data), stat)
+        if is_gzip_path(path):
+            data = gzip.decompress(data)
+        metrics.count('bytes_decoded', len(data))
+        return data.decode('utf-8')
+
+    def read_text(self, path: PurePath, dependencies: Optional['Dependencies'] = None) -> str:
+        """Contenido decodificado en UTF-8 con saltos de línea universales (ver _decoded)."""
+        return self._decoded(path, dependencies).replace('\r\n', '\n').replace('\r', '\n')
+
+    def iter_lines(self, path: PurePath, dependencies: Optional['Dependencies'] = None) -> Iterator[str]:
+        """
+        Itera las líneas del archivo con la semántica de str.splitlines().
+
+        Con dependencies, el archivo se anota con el hash de los bytes leídos
+        cuando la iteración termina.
+        """
+        yield from self._decoded(path, dependencies).splitlines()
+
+
+class LocalFS(SourceFS):
+    """
+    Acceso al disco local con caché de listados de directorio.
+
+    La primera consulta sobre un directorio lo lista con os.scandir y las
+    comprobaciones de existencia posteriores se responden desde la caché,
+    evitando una llamada stat por cada inclusión. La caché vive lo que viva
+    la instancia (normalmente una ejecución).
+    """
+
+    is_local = True
+
+    def __init__(self, mmap_threshold: int = MMAP_THRESHOLD):
+        self.mmap_threshold = mmap_threshold
+        self._listings: Dict[str, Dict[str, bool]] = {}
+        self._lock = threading.Lock()
+
+    def _listing(self, directory: str) -> Dict[str, bool]:
+        """Nombres del directorio -> es_archivo, cacheado por directorio."""
+        listing = self._listings.get(directory)
+        if listing is not None:
+            metrics.count('listing_cache_hits')
+            return listing
+
+        listing = {}
+        metrics.count('dir_scans')
+        try:
+            with os.scandir(directory or '.') as it:
+                for entry in it:
+                    try:
+                        listing[_name_key(entry.name)] = entry.is_file()
+                    except OSError:
+                        listing[_name_key(entry.name)] = False
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            pass
+
+        with self._lock:
+            self._listings[directory] = listing
+        return listing
+
+    def is_file(self, path: PurePath) -> bool:
+        path = Path(path)
+        return self._listing(str(path.parent)).get(_name_key(path.name), False)
+
+    def size(self, path: PurePath) -> int:
+        metrics.count('stat_calls')
+        return os.stat(path).st_size
+
+    def read_bytes(self, path: PurePath) -> bytes:
+        metrics.count('file_opens')
+        return Path(path).read_bytes()
+
+    def _read(self, path: PurePath) -> Tuple[bytes, Optional[Tuple[int, int]]]:
+        metrics.count('file_opens')
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            return f.read(), (st.st_mtime_ns, st.st_size)
+
+    def iter_lines(self, path: PurePath, dependencies: Optional['Dependencies'] = None) -> Iterator[str]:
+        """
+        Itera las líneas con la misma semántica que splitlines().
+
+        Los archivos .gz se descomprimen en streaming línea a línea. Los
+        archivos de tamaño igual o superior a mmap_threshold se proyectan
+        en memoria con mmap y cada línea se decodifica solo al consumirla, de
+        modo que nunca se materializa el archivo completo ni su lista de líneas.
+
+        En ambos casos el texto se corta justo después de cada b'\n' (nunca
+        parte una secuencia UTF-8) y cada segmento conserva su salto: tras un
+        \n siempre termina una línea, así que splitlines() por segmentos da
+        las mismas líneas que sobre el texto completo, también con \r, \x0c o
+        separadores Unicode junto al \n.
+
+        Con dependencies, el hash se calcula sobre los bytes a medida que se
+        leen (los comprimidos, en los .gz) y el stat se toma al abrir el archivo.
+        """
+        path = Path(path)
+        decoded = 0
+        hasher = hashlib.sha256() if dependencies is not None else None
+        try:
+            if is_gzip_path(path):
+                metrics.count('file_opens')
+                with open(path, 'rb') as raw:
+                    st = os.fstat(raw.fileno())
+                    source = _HashingReader(raw, hasher) if hasher is not None else raw
+                    with gzip.GzipFile(fileobj=source, mode='rb') as f:
+                        for line in f:
+                            decoded += len(line)
+                            yield from line.decode('utf-8').splitlines()
+                    if hasher is not None:
+                        # Restos tras el flujo comprimido (gzip los ignora)
+                        while source.read(1024 * 1024):
+                            pass
+                        dependencies.note_read(path, hasher.hexdigest(), (st.st_mtime_ns, st.st_size))
+                return
+            
+            metrics.count('stat_calls')
+            size = path.stat().st_size
+            if size == 0 or size < self.mmap_threshold:
+                yield from self._decoded(path, dependencies).splitlines()
+                return
+
+            metrics.count('file_opens')
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                st = os.fstat(f.fileno())
+                size = len(mm)
+                pos = 0
+                while pos < size:
+                    end = mm.find(b'\n', pos) + 1 or size
+                    segment = mm[pos:end]
+                    if hasher is not None:
+                        hasher.update(segment)
+                    yield from segment.decode('utf-8').splitlines()
+                    decoded += end - pos
+                    pos = end
+                if hasher is not None:
+                    dependencies.note_read(path, hasher.hexdigest(), (st.st_mtime_ns, st.st_size))
+        finally:
+            # Solo cuenta lo consumido si el llamador deja de iterar antes del final
+            if decoded:
+                metrics.count('bytes_decoded', decoded)
+
+
+class MemoryFS(SourceFS):
+    """Archivos en memoria indexados por ruta."""
+
+    def __init__(self, files: Optional[Dict[str, bytes]] = None):
+        self.files: Dict[str, bytes] = {}
+        for name, data in (files or {}).items():
+            self.add(name, data)
+
+    @staticmethod
+    def _key(path: PurePath) -> str:
+        return PurePath(os.path.normpath(str(path))).as_posix()
+
+    def add(self, path: str, data) -> None:
+        """Añade o reemplaza un archivo (bytes o str en UTF-8)."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self.files[self._key(PurePath(path))] = data
+
+    def is_file(self, path: PurePath) -> bool:
+        return self._key(path) in self.files
+
+    def size(self, path: PurePath) -> int:
+        return len(self.files[self._key(path)])
+
+    def read_bytes(self, path: PurePath) -> bytes:
+        try:
+            return self.files[self._key(path)]
+        except KeyError:
+            raise FileNotFoundError(f"Archivo no encontrado: {path}")
+
+
+class ZipFS(SourceFS):
+    """
+    Archivos leídos directamente de un paquete .zip.
+
+    El directorio central del zip se usa como índice: las comprobaciones de
+    existencia son búsquedas en un diccionario y cada lectura accede solo al
+    miembro pedido, sin extraer el paquete. Las rutas se interpretan
+    relativas a la raíz del paquete.
+    """
+
+    def __init__(self, bundle_path: str):
+        self.bundle_path = Path(bundle_path)
+        self._zip = zipfile.ZipFile(self.bundle_path)
+        self._index: Dict[str, zipfile.ZipInfo] = {
+            info.filename: info for info in self._zip.infolist() if not info.is_dir()
+        }
+        self._lock = threading.Lock()
+        logger.debug(f"Paquete de fuentes abierto: {self.bundle_path} ({len(self._index)} archivos)")
+
+    @staticmethod
+    def _member_name(path: PurePath) -> Optional[str]:
+        """Nombre del miembro dentro del zip, o None si la ruta queda fuera."""
+        posix = PurePath(path).as_posix()
+        if posixpath.isabs(posix) or PurePath(path).anchor:
+            return None
+        name = posixpath.normpath(posix)
+        if name == '..' or name.startswith('../'):
+            return None
+        return name
+
+    def _info(self, path: PurePath) -> zipfile.ZipInfo:
+        name = self._member_name(path)
+        info = self._index.get(name) if name is not None else None
+        if info is None:
+            raise FileNotFoundError(f"Archivo no encontrado en {self.bundle_path}: {path}")
+        return info
+
+    def is_file(self, path: PurePath) -> bool:
+        name = self._member_name(path)
+        return name is not None and name in self._index
+
+    def size(self, path: PurePath) -> int:
+        return self._info(path).file_size
+
+    def read_bytes(self, path: PurePath) -> bytes:
+        metrics.count('file_opens')
+        info = self._info(path)
+        # ZipFile comparte un único descriptor entre lecturas
+        with self._lock:
+            return self._zip.read(info)
+
+    def close(self) -> None:
+        self._zip.close()
+
+
+# Paquetes abiertos: ruta -> (mtime_ns, tamaño, ZipFS)
+_open_bundles: Dict[str, Tuple[int, int, ZipFS]] = {}
+_open_bundles_lock = threading.Lock()
+
+
+def open_source_fs(bundle: Optional[str] = None, mmap_threshold: int = MMAP_THRESHOLD) -> SourceFS:
+    """
+    Devuelve el SourceFS adecuado para la configuración.
+
+    Sin paquete se usa el disco local. Con paquete, el ZipFS se reutiliza
+    mientras el archivo .zip no cambie, de modo que el directorio central se
+    lee una sola vez aunque varios componentes (extensión, loader) lo usen.
+
+    Args:
+        bundle: Ruta a un paquete .zip con las fuentes, o None
+        mmap_threshold: Umbral de mmap para el disco local
+    """
+    if not bundle:
+        return LocalFS(mmap_threshold=mmap_threshold)
+
+    key = str(Path(bundle).resolve())
+    st = os.stat(key)
+    with _open_bundles_lock:
+        cached = _open_bundles.get(key)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            metrics.count('bundle_cache_hits')
+            return cached[2]
+        bundle_fs = ZipFS(key)
+        _open_bundles[key] = (st.st_mtime_ns, st.st_size, bundle_fs)
+        return bundle_fs
+
+
+class SourceFSLoader(BaseLoader):
+    """
+    Loader de Jinja2 que lee plantillas de un SourceFS.
+
+    Equivale a FileSystemLoader con un único directorio de búsqueda, pero
+    sobre cualquier fuente (por ejemplo, un paquete .zip). Con dependencies,
+    cada plantilla se anota con el hash de los bytes leídos.
+    """
+
+    def __init__(self, source_fs: SourceFS, searchpath: str = '.',
+                 dependencies: Optional['Dependencies'] = None):
+        self.source_fs = source_fs
+        self.searchpath = Path(searchpath)
+        self.dependencies = dependencies
+
+    def get_source(self, environment, template):
+        path = self.searchpath.joinpath(*split_template_path(template))
+        if not self.source_fs.is_file(path):
+            raise TemplateNotFound(template)
+        # Cada ejecución crea su propio entorno: la plantilla no se recarga
+        return self.source_fs.read_text(path, self.dependencies), str(path), lambda: True
+
+
+class DependencyLoader(BaseLoader):
+    """Loader de Jinja2 que delega en otro y anota en dependencies cada plantilla leída."""
+
+    def __init__(self, loader: BaseLoader, dependencies: 'Dependencies'):
+        self.loader = loader
+        self.dependencies = dependencies
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = self.loader.get_source(environment, template)
+        if filename:
+            self.dependencies.note_read(Path(filename))
+        return source, filename, uptodate
+
+
+class Dependencies:
+    """
+    Archivos y variables de los que depende un resultado.
+
+    read: archivos leídos; missing: rutas consultadas que no existían (si
+    aparecen, la resolución de una inclusión puede cambiar); variables:
+    nombres de variables de plantilla que el resultado consulta. Ver
+    MergeSourceFile.extension_cache y MergeSourceFile.incremental.
+
+    snapshots guarda, para los archivos que SourceFS leyó con dependencies,
+    el hash de los bytes leídos y el (mtime_ns, tamaño) tomado antes de
+    leerlos (None fuera del disco local). Si el archivo cambia después, el
+    registro sigue describiendo lo que se usó y la siguiente comprobación
+    detecta el cambio.
+    """
+
+    def __init__(self) -> None:
+        self.read: List[str] = []
+        self.missing: List[str] = []
+        self.variables: Set[str] = set()
+        self.snapshots: Dict[str, Tuple[str, Optional[Tuple[int, int]]]] = {}
+        self._seen: set = set()
+
+    def update(self, other: 'Dependencies') -> None:
+        """Añade las dependencias de other."""
+        for path in other.read:
+            self.note_read(PurePath(path), *other.snapshots.get(path, (None, None)))
+        for path in other.missing:
+            self.note_missing(PurePath(path))
+        self.variables.update(other.variables)
+
+    def note_read(self, path: PurePath, digest: Optional[str] = None,
+                  stat: Optional[Tuple[int, int]] = None) -> None:
+        """Anota un archivo leído y, si se indica, el hash de los bytes leídos (la primera lectura manda)."""
+        key = ('r', str(path))
+        if key not in self._seen:
+            self._seen.add(key)
+            self.read.append(str(path))
+        if digest is not None:
+            self.snapshots.setdefault(str(path), (digest, stat))
+
+    def note_missing(self, path: PurePath) -> None:
+        key = ('m', str(path))
+        if key not in self._seen:
+            self._seen.add(key)
+            self.missing.append(str(path))
+
+
+class IncludeResolver:
+    """
+    Resuelve nombres de inclusión a rutas dentro de un SourceFS.
+
+    Orden de búsqueda para rutas relativas:
+    1. El directorio de referencia (base_path para @, directorio del padre para @@)
+    2. Cada directorio de search_paths, en orden (equivalente a SQLPATH)
+    
+    En cada ubicación, si el archivo no existe se prueba su versión
+    comprimida (nombre + '.gz').
+
+    Con dependencies, cada ruta resuelta se anota como leída y cada
+    candidata anterior que no existía, como ausente.
+    """
+
+    def __init__(self, fs: Optional[SourceFS] = None, search_paths: Iterable[str] = (),
+                 dependencies: Optional[Dependencies] = None):
+        self.fs = fs if fs is not None else LocalFS()
+        self.search_paths: List[Path] = [Path(p) for p in search_paths]
+        self.dependencies = dependencies
+
+    def candidates(self, name: str, relative_to: Path) -> Iterator[Path]:
+        """Rutas candidatas para una inclusión, en orden de prioridad."""
+        if PurePath(name).is_absolute():
+            directories = [None]
+        else:
+            directories = [relative_to] + self.search_paths
+        
+        for directory in directories:
+            path = Path(name) if directory is None else directory / name
+            yield path
+            if not is_gzip_path(path):
+                yield path.with_name(path.name + '.gz')
+
+    def resolve(self, name: str, relative_to: Path) -> Path:
+        """
+        Devuelve la primera ruta candidata que existe.
+
+        Raises:
+            FileNotFoundError: Si ninguna candidata existe
+        """
+        first = None
+        for candidate in self.candidates(name, relative_to):
+            if first is None:
+                first = candidate
+            if self.fs.is_file(candidate):
+                if self.dependencies is not None:
+                    self.dependencies.note_read(candidate)
+                return candidate
+            if self.dependencies is not None:
+                self.dependencies.note_missing(candidate)
+        raise FileNotFoundError(f"Archivo no encontrado: {first}")
+
+
+def search_paths_from_config(config: Dict, environ: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Construye la lista de rutas de búsqueda a partir de la configuración.
+
+    Combina `search_paths` y, si `use_sqlpath_env` está activo, las rutas de
+    la variable de entorno SQLPATH (separadas por os.pathsep).
+    """
+    environ = os.environ if environ is None else environ
+    paths: List[str] = list(config.get('search_paths', []))
+    if config.get('use_sqlpath_env', False):
+        paths.extend(p for p in environ.get('SQLPATH', '').split(os.pathsep) if p)
+    return paths
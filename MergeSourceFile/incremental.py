@@ -0,0 +1,185 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+Reconstrucción incremental por objetivo, a nivel de variable.
+
+Cada salida (objetivo) guarda junto a ella, en <salida>.deps.json, de qué
+depende su último renderizado:
+
+- Los archivos leídos (entrada, inclusiones SQLPlus, {% include %} de
+  Jinja2), con su hash, y las rutas de inclusión consultadas que no existían
+- Las variables que la plantilla referencia: las que jinja2.meta encuentra
+  en la plantilla compilada más las que el renderizado consultó (includes y
+  ramas incluidos), con el hash de su valor o null si no estaban definidas
+- La huella de la configuración y el stat de la salida escrita
+
+Con [project] incremental = true, un objetivo se vuelve a renderizar solo si
+cambió alguna de sus fuentes o de sus propias variables: cambiar una clave
+del YAML compartido no reconstruye los objetivos que no la usan.
+"""
+
+import json
+import hashlib
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterator, Mapping, Optional, Set, Union
+
+from . import __version__
+from .extension_cache import files_unchanged, snapshot_files
+from .fs import Dependencies, SourceFS
+from .output import write_if_changed
+
+logger = logging.getLogger(__name__)
+
+STATE_FORMAT = 1
+STATE_SUFFIX = '.deps.json'
+
+
+def state_path_for(output: Union[str, Path]) -> Path:
+    """Ruta del estado incremental de un archivo de salida."""
+    return Path(str(output) + STATE_SUFFIX)
+
+
+def _sha256(data: str) -> str:
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def value_hash(value: Any) -> str:
+    """Hash estable del valor de una variable (JSON con claves ordenadas)."""
+    return _sha256(json.dumps(value, sort_keys=True, default=repr))
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """Huella de la configuración y de la versión del paquete."""
+    return _sha256(json.dumps({'version': __version__, 'config': config}, sort_keys=True, default=repr))
+
+
+class VariableRecorder(Mapping):
+    """
+    Vista de solo lectura de unas variables que anota cada nombre consultado.
+    
+    Jinja2 pregunta por cada nombre que resuelve en tiempo de ejecución
+    ('in' y después []), también los que no existen; read los reúne.
+    """
+    
+    def __init__(self, variables: Mapping[str, Any]):
+        self.variables = variables
+        self.read: Set[str] = set()
+    
+    def __getitem__(self, key: str) -> Any:
+        self.read.add(key)
+        return self.variables[key]
+    
+    def __contains__(self, key: object) -> bool:
+        self.read.add(key)
+        return key in self.variables
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.variables)
+    
+    def __len__(self) -> int:
+        return len(self.variables)
+
+
+def up_to_date(state_path: Path, config: Dict[str, Any], variables: Mapping[str, Any],
+               output_path: Path, fs: SourceFS) -> bool:
+    """
+    Comprueba si la salida sigue vigente según el estado guardado.
+    
+    Args:
+        state_path: Estado escrito por save_state()
+        config: Configuración normalizada
+        variables: Variables actuales (sin envolver)
+        output_path: Archivo de salida
+        fs: Fuente de archivos con la que comprobar las dependencias
+    
+    Returns:
+        True si no cambió la configuración, la salida, ninguna fuente ni
+        ninguna de las variables que el objetivo referencia
+    """
+    try:
+        state = json.loads(state_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return False
+    if not isinstance(state, dict) or state.get('format') != STATE_FORMAT:
+        return False
+    
+    reason = None
+    if state['config'] != config_hash(config):
+        reason = "configuración"
+    elif _output_stat(output_path) is None or state['output'] != _output_stat(output_path):
+        reason = f"salida {output_path}"
+    elif not files_unchanged(state['files'], state['missing'], fs):
+        reason = "fuentes"
+    else:
+        for name, digest in state['variables'].items():
+            current = value_hash(variables[name]) if name in variables else None
+            if current != digest:
+                reason = f"variable '{name}'"
+                break
+    if reason is not None:
+        logger.info(f"Reconstrucción necesaria: cambió {reason}")
+        return False
+    return True
+
+
+def save_state(state_path: Path, config: Dict[str, Any], dependencies: Dependencies,
+               variables: Mapping[str, Any], output_path: Path, fs: SourceFS) -> None:
+    """
+    Guarda las dependencias de un renderizado completo de output_path.
+    
+    Args:
+        state_path: Archivo de estado (ver state_path_for)
+        config: Configuración normalizada
+        dependencies: Archivos leídos y variables referenciadas; si variables
+            es un VariableRecorder se añaden también las que consultó
+        variables: Variables del renderizado
+        output_path: Archivo de salida ya escrito
+        fs: Fuente de archivos de la que se leyeron las dependencias
+    """
+    names = set(dependencies.variables)
+    if isinstance(variables, VariableRecorder):
+        names |= variables.read
+        variables = variables.variables
+    state = {
+        'format': STATE_FORMAT,
+        'config': config_hash(config),
+        'output': _output_stat(output_path),
+        'files': snapshot_files(dependencies, fs),
+        'missing': list(dependencies.missing),
+        'variables': {
+            name: value_hash(variables[name]) if name in variables else None
+            for name in sorted(names)
+        },
+    }
+    write_if_changed(state_path, [json.dumps(state, ensure_ascii=False, indent=1)], counter='sidecar_bytes_out')
+
+
+def _output_stat(output_path: Path) -> Optional[list]:
+    try:
+        st = output_path.stat()
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
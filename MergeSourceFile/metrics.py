@@ -0,0 +1,262 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Instrumentación de etapas y contadores de una ejecución.
+
+Funcionalidades:
+- Tiempo de reloj y de CPU por etapa (carga de configuración, extensiones,
+  compilación y renderizado Jinja2, escritura de la salida...)
+- Contadores (archivos leídos, bytes de entrada/salida, sustituciones, aciertos de caché)
+- Recuentos deterministas de operaciones de las rutas calientes (aperturas,
+  stat, bytes decodificados, expresiones regulares, concatenaciones,
+  compilaciones Jinja2), usados en los presupuestos de benchmarks.opcounts
+- Informe JSON
+- Traza opcional en formato Chrome trace-event (chrome://tracing, Perfetto):
+  un span por etapa y por archivo incluido, anidados en el tiempo
+
+La recolección solo está activa dentro de collect_metrics(). Fuera de ella
+stage() devuelve un gestor de contexto nulo compartido y count() retorna de
+inmediato, de modo que la instrumentación no tiene coste apreciable.
+
+El recolector es único por proceso: con varios hilos renderizando a la vez
+(un TemplateEngine compartido) sus etapas y contadores se acumulan bajo un
+lock, y cada hilo tiene su propio carril en la traza.
+"""
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+_NULL_STAGE = nullcontext()
+
+
+class Metrics:
+    """Acumula tiempos por etapa y contadores de una ejecución."""
+
+    def __init__(self, trace: bool = False):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, int] = {}
+        self.trace_events: Optional[List[Dict[str, Any]]] = [] if trace else None
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, trace: bool = True) -> Iterator[None]:
+        """
+        Mide el tiempo de reloj y de CPU de un bloque, acumulándolo en la etapa.
+
+        Args:
+            name: Nombre de la etapa
+            trace: Si es False la etapa no genera span en la traza (para
+                etapas muy frecuentes, como cada fragmento renderizado)
+        """
+        # CPU del hilo: con varios hilos, process_time() sumaría la de todos
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.add_stage(name, end - wall, time.thread_time() - cpu)
+            if trace and self.trace_events is not None:
+                self._add_span(name, 'stage', wall, end, None)
+
+    def add_stage(self, name: str, wall_s: float, cpu_s: float, calls: int = 1) -> None:
+        """Acumula en la etapa tiempos medidos fuera de stage()."""
+        with self._lock:
+            entry = self.stages.setdefault(name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            entry['calls'] += calls
+            entry['wall_s'] += wall_s
+            entry['cpu_s'] += cpu_s
+
+    def begin_stream(self, name: str) -> Any:
+        """
+        Se llama una vez al empezar una etapa en streaming (ver timed).
+
+        Las subclases que miden algo más que el tiempo lo hacen aquí y en
+        end_stream, no por elemento. Devuelve el estado a pasar a end_stream.
+        """
+        return None
+
+    def end_stream(self, name: str, state: Any) -> None:
+        """Se llama una vez al terminar una etapa en streaming, con el estado de begin_stream."""
+
+    @contextmanager
+    def span(self, name: str, category: str, args: Optional[Dict[str, Any]] = None) -> Iterator[None]:
+        """Registra un span en la traza sin acumularlo como etapa."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_span(name, category, start, time.perf_counter(), args)
+
+    def _add_span(self, name: str, category: str, start: float, end: float,
+                  args: Optional[Dict[str, Any]]) -> None:
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self._start_wall) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        self.trace_events.append(event)
+
+    def set_lane(self, label: str) -> None:
+        """Nombra el carril (hilo actual) de la traza, p. ej. con el destino que construye."""
+        if self.trace_events is not None:
+            self.trace_events.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': {'name': label},
+            })
+
+    def write_trace(self, path: str) -> None:
+        """Escribe la traza en formato JSON de Chrome trace-event."""
+        trace = {'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}
+        Path(path).write_text(json.dumps(trace) + '\n', encoding='utf-8')
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Incrementa un contador."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Informe serializable: etapas, contadores y tiempo total."""
+        return {
+            'total': {
+                'wall_s': time.perf_counter() - self._start_wall,
+                'cpu_s': time.process_time() - self._start_cpu,
+            },
+            'stages': self.stages,
+            'counters': dict(sorted(self.counters.items())),
+        }
+
+    def write_json(self, path: str) -> None:
+        """Escribe el informe en formato JSON."""
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2) + '\n', encoding='utf-8')
+
+
+# Recolector activo (None = instrumentación desactivada)
+_active: Optional[Metrics] = None
+
+
+@contextmanager
+def collect_metrics(collector: Optional[Metrics] = None) -> Iterator[Metrics]:
+    """
+    Activa la recolección de métricas durante el bloque.
+
+    Args:
+        collector: Recolector a activar (por defecto, uno nuevo)
+    """
+    global _active
+    previous, _active = _active, collector if collector is not None else Metrics()
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def enabled() -> bool:
+    """Indica si hay una recolección de métricas activa."""
+    return _active is not None
+
+
+def stage(name: str, trace: bool = True):
+    """Gestor de contexto que mide una etapa si la recolección está activa."""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name, trace)
+
+
+def timed(name: str, iterable: Iterable) -> Iterable:
+    """
+    Mide como etapa el tiempo de producir cada elemento de un iterador.
+
+    Para etapas en streaming, que se ejecutan intercaladas con su consumidor:
+    solo cuenta el tiempo dentro de next() (que incluye el de los iteradores
+    que la etapa consume a su vez). Sin recolección activa devuelve iterable
+    sin envolver. El valor de retorno de un generador se conserva, de modo
+    que funciona con 'yield from'.
+    """
+    if _active is None:
+        return iterable
+    return _timed(_active, name, iter(iterable))
+
+
+def _timed(collector: Metrics, name: str, iterator: Iterator) -> Iterator:
+    # Los tiempos se acumulan aquí y se registran una sola vez al terminar: un
+    # stage() por elemento costaría demasiado con recolectores caros (--profile mem),
+    # que miden entre begin_stream y end_stream.
+    # En la traza, un único span desde el primer elemento hasta el último.
+    start = time.perf_counter()
+    state = collector.begin_stream(name)
+    perf_counter, thread_time = time.perf_counter, time.thread_time
+    calls, wall, cpu = 0, 0.0, 0.0
+    try:
+        while True:
+            wall_start, cpu_start = perf_counter(), thread_time()
+            try:
+                item = next(iterator)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                calls += 1
+                wall += perf_counter() - wall_start
+                cpu += thread_time() - cpu_start
+            yield item
+    finally:
+        collector.add_stage(name, wall, cpu, calls)
+        collector.end_stream(name, state)
+        if collector.trace_events is not None:
+            collector._add_span(name, 'stage', start, time.perf_counter(), None)
+
+
+def span(name: str, category: str = 'include', **args: Any):
+    """Gestor de contexto que registra un span si hay una traza activa."""
+    if _active is None or _active.trace_events is None:
+        return _NULL_STAGE
+    return _active.span(name, category, args)
+
+
+def set_lane(label: str) -> None:
+    """Nombra el carril de la traza del hilo actual, si hay una traza activa."""
+    if _active is not None:
+        _active.set_lane(label)
+
+
+def count(name: str, value: int = 1) -> None:
+    """Incrementa un contador si la recolección está activa."""
+    if _active is not None:
+        _active.count(name, value)
@@ -0,0 +1,245 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Escritura del archivo de salida.
+
+Funcionalidades:
+- Escritura atómica mediante archivo temporal en el mismo directorio
+- Comparación por bloques con la salida existente (se detiene en la primera diferencia)
+- Reemplazo con os.replace solo si el contenido cambió (evita tocar el mtime)
+- Backups por renombrado con rotación de N generaciones (sin releer la salida)
+- Compresión gzip en streaming y determinista para salidas .gz
+"""
+
+import os
+import gzip
+import uuid
+import shutil
+import logging
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from . import metrics
+from .splice import SpliceRef, write_splice, write_splice_binary
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de bloque para la comparación de archivos
+COMPARE_CHUNK_SIZE = 1024 * 1024
+
+# Nivel de compresión por defecto de las salidas .gz
+DEFAULT_GZIP_LEVEL = 6
+
+
+def files_equal(path_a: Path, path_b: Path, chunk_size: int = COMPARE_CHUNK_SIZE) -> bool:
+    """
+    Compara dos archivos byte a byte por bloques.
+
+    Compara primero los tamaños y después lee ambos archivos en paralelo,
+    deteniéndose en el primer bloque distinto.
+
+    Args:
+        path_a: Primer archivo
+        path_b: Segundo archivo
+        chunk_size: Tamaño de bloque de lectura
+
+    Returns:
+        True si ambos archivos tienen exactamente el mismo contenido
+    """
+    if os.stat(path_a).st_size != os.stat(path_b).st_size:
+        return False
+
+    with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+        while True:
+            block_a = fa.read(chunk_size)
+            block_b = fb.read(chunk_size)
+            if block_a != block_b:
+                return False
+            if not block_a:
+                return True
+
+
+def _open_temp_file(output_path: Path) -> Path:
+    """
+    Crea un archivo temporal vacío junto a la salida.
+
+    Se crea con modo 0o666 para que el umask del proceso se aplique igual
+    que con una escritura normal (mkstemp crearía el archivo con 0o600).
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+    while True:
+        tmp_path = output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            os.close(os.open(tmp_path, flags, 0o666))
+            return tmp_path
+        except FileExistsError:
+            continue
+
+
+def _write_chunks(tmp_path: Path, chunks: Iterable[Union[str, SpliceRef]], encoding: str) -> None:
+    """Escribe los fragmentos como texto en el archivo temporal."""
+    with open(tmp_path, 'w', encoding=encoding) as f:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                f.write(chunk)
+            else:
+                write_splice(f, chunk)
+
+
+def _write_chunks_gzip(tmp_path: Path, chunks: Iterable[Union[str, SpliceRef]], encoding: str,
+                       level: int) -> None:
+    """
+    Escribe los fragmentos comprimiendo con gzip a medida que llegan.
+
+    La cabecera gzip se genera sin nombre de archivo y con mtime 0, de modo
+    que el mismo contenido produce siempre los mismos bytes comprimidos y la
+    comparación con la salida existente sigue detectando "sin cambios". Los
+    saltos de línea se escriben como '\n' sin traducir.
+    """
+    with open(tmp_path, 'wb') as raw, \
+            gzip.GzipFile(filename='', mode='wb', fileobj=raw, mtime=0, compresslevel=level) as gz:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                gz.write(chunk.encode(encoding))
+            else:
+                write_splice_binary(gz, chunk, encoding)
+
+
+def write_if_changed(output_path: Path, chunks: Iterable[Union[str, SpliceRef]], encoding: str = 'utf-8',
+                     before_replace: Optional[Callable[[Path], None]] = None,
+                     gzip_level: int = DEFAULT_GZIP_LEVEL, counter: str = 'bytes_out') -> bool:
+    """
+    Escribe la salida de forma atómica solo si su contenido cambió.
+
+    El contenido se escribe en un archivo temporal del mismo directorio, se
+    compara con la salida existente y solo si difiere se reemplaza con
+    os.replace. Si no hay cambios la salida existente no se toca. Si la
+    salida termina en .gz se comprime en streaming mientras se escribe.
+
+    Args:
+        output_path: Archivo de salida
+        chunks: Fragmentos de texto a escribir, en orden; los SpliceRef se
+            copian a nivel de bytes desde el archivo referenciado
+        encoding: Codificación de la salida
+        before_replace: Callback opcional invocado con la ruta de salida
+            justo antes de reemplazarla (por ejemplo, para crear backups)
+        gzip_level: Nivel de compresión (1-9) para salidas .gz
+        counter: Contador de métricas que recibe los bytes escritos (los
+            archivos auxiliares, como el mapa de origen, usan 'sidecar_bytes_out')
+
+    Returns:
+        True si la salida se escribió, False si no hubo cambios
+    """
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = _open_temp_file(output_path)
+
+    try:
+        if output_path.suffix.lower() == '.gz':
+            _write_chunks_gzip(tmp_path, chunks, encoding, gzip_level)
+        else:
+            _write_chunks(tmp_path, chunks, encoding)
+        if metrics.enabled():
+            metrics.count(counter, os.stat(tmp_path).st_size)
+
+        if output_path.exists():
+            if files_equal(tmp_path, output_path):
+                tmp_path.unlink()
+                return False
+            shutil.copymode(output_path, tmp_path)
+            if before_replace is not None:
+                before_replace(output_path)
+
+        os.replace(tmp_path, output_path)
+        return True
+
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _backup_name(output_path: Path, generation: int) -> Path:
+    """Ruta del backup de la generación indicada (0 = más reciente)."""
+    suffix = '.bak' if generation == 0 else f'.bak.{generation}'
+    return output_path.with_name(output_path.name + suffix)
+
+
+def _copy_file(src: Path, dst: Path) -> None:
+    """
+    Copia un archivo delegando en el kernel.
+
+    Usa os.copy_file_range cuando está disponible (permite reflinks en
+    sistemas de archivos con copy-on-write) y shutil.copyfile en caso
+    contrario, que a su vez usa sendfile u otras copias rápidas del sistema.
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    return
+        except OSError as e:
+            logger.debug(f"copy_file_range no disponible ({e}), usando shutil.copyfile")
+    shutil.copyfile(src, dst)
+
+
+def create_backup(output_path: Path, count: int = 1) -> Path:
+    """
+    Crea un backup de la salida existente rotando hasta `count` generaciones.
+
+    Las generaciones anteriores se desplazan por renombrado
+    (.bak -> .bak.1 -> .bak.2 ...) y la más antigua se descarta. El nuevo
+    .bak es un enlace duro a la salida actual, que sigue en su sitio hasta
+    que write_if_changed la reemplaza de forma atómica (el reemplazo crea
+    un inode nuevo, así que el backup conserva el contenido anterior). Si
+    el enlace no es posible (por ejemplo, el sistema de archivos no admite
+    enlaces duros) se copia con _copy_file. En ningún caso se decodifica
+    ni se reescribe el contenido.
+
+    Args:
+        output_path: Archivo de salida existente
+        count: Número de generaciones de backup a conservar (mínimo 1)
+
+    Returns:
+        Ruta del backup creado
+    """
+    count = max(1, count)
+
+    _backup_name(output_path, count - 1).unlink(missing_ok=True)
+    for generation in range(count - 2, -1, -1):
+        older = _backup_name(output_path, generation)
+        if older.exists():
+            os.replace(older, _backup_name(output_path, generation + 1))
+
+    backup_path = _backup_name(output_path, 0)
+    backup_path.unlink(missing_ok=True)
+    try:
+        os.link(output_path, backup_path)
+    except OSError as e:
+        logger.debug(f"No se pudo enlazar la salida para el backup ({e}), copiando")
+        _copy_file(output_path, backup_path)
+    return backup_path
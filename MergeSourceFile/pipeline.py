@@ -0,0 +1,138 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+Ejecución encadenada de etapas en hilos con colas acotadas.
+
+threaded() ejecuta un iterador (una etapa: lectura, pre-procesamiento,
+renderizado) en un hilo propio y entrega sus elementos al consumidor a través
+de una queue.Queue acotada. Encadenando varias etapas cada una trabaja en
+paralelo con la siguiente, y el tamaño de la cola limita cuánto se adelanta
+un productor a su consumidor (contrapresión).
+
+- Los elementos viajan en lotes para no pagar la sincronización de la cola
+  por cada línea.
+- Una excepción en la etapa se reenvía y se lanza en el consumidor.
+- Si el consumidor abandona el iterador (close(), excepción propia), el
+  productor se detiene en su siguiente entrega y cierra su iterador.
+"""
+
+import queue
+import threading
+from typing import Iterable, Iterator, List, TypeVar
+
+from . import metrics
+
+T = TypeVar('T')
+
+# Lotes en vuelo por etapa y elementos por lote
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_BATCH_SIZE = 512
+
+# Cada cuánto comprueba un productor bloqueado si el consumidor se ha ido
+_POLL_INTERVAL = 0.1
+
+# Fin de la etapa
+_DONE = object()
+
+
+class _Failure:
+    """Excepción de la etapa, reenviada al consumidor."""
+    
+    __slots__ = ('error',)
+    
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def threaded(iterable: Iterable[T], name: str, queue_size: int = DEFAULT_QUEUE_SIZE,
+             batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[T]:
+    """
+    Consume iterable en un hilo propio y emite sus elementos.
+    
+    El hilo arranca con la primera petición de un elemento. Con métricas
+    activas la etapa se mide como 'pipeline:<name>' y tiene su propio carril
+    en la traza.
+    
+    Args:
+        iterable: Etapa a ejecutar
+        name: Nombre de la etapa (hilo, métricas)
+        queue_size: Lotes que la etapa puede adelantar a su consumidor
+        batch_size: Elementos por lote
+    
+    Returns:
+        Iterador con los mismos elementos, en el mismo orden
+    """
+    if queue_size < 1:
+        raise ValueError(f"queue_size debe ser >= 1: {queue_size}")
+    channel: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                channel.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def produce() -> None:
+        metrics.set_lane(f"pipeline: {name}")
+        iterator = iter(iterable)
+        try:
+            with metrics.stage(f"pipeline:{name}"):
+                batch: List[T] = []
+                for item in iterator:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        if not put(batch):
+                            return
+                        batch = []
+                if batch and not put(batch):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+    
+    def consume() -> Iterator[T]:
+        worker = threading.Thread(target=produce, name=f"msf-pipeline-{name}", daemon=True)
+        worker.start()
+        try:
+            while True:
+                batch = channel.get()
+                if batch is _DONE:
+                    return
+                if isinstance(batch, _Failure):
+                    raise batch.error
+                yield from batch
+        finally:
+            stop.set()
+            worker.join()
+    
+    return consume()
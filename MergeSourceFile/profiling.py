@@ -0,0 +1,350 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Perfilado de una ejecución completa (--profile cpu|mem).
+
+Funcionalidades:
+- Perfil de CPU con cProfile, volcado en formato pstats
+- Perfil de memoria con tracemalloc: pico de memoria y principales puntos
+  de asignación por etapa (las mismas etapas que el informe de métricas)
+- Perfil de renderizado por línea de plantilla: tiempo y bytes de salida
+  atribuidos a cada línea, mapeada al archivo .sql y línea de origen
+"""
+
+import sys
+import json
+import time
+import pstats
+import cProfile
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import Metrics
+from .sourcemap import TemplateOrigins
+
+logger = logging.getLogger(__name__)
+
+# Número de funciones / puntos de asignación mostrados en los resúmenes
+TOP_ENTRIES = 10
+
+# Profundidad de pila registrada por tracemalloc
+TRACEMALLOC_FRAMES = 1
+
+# Asignaciones del propio perfilador que no interesan en el informe
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def run_cpu_profile(func: Callable[[], int], output: str) -> int:
+    """
+    Ejecuta func bajo cProfile y vuelca las estadísticas en formato pstats.
+
+    El archivo se puede analizar con `python -m pstats` o snakeviz.
+
+    Returns:
+        El valor devuelto por func
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        profiler.dump_stats(output)
+        stats = pstats.Stats(profiler).sort_stats(pstats.SortKey.CUMULATIVE)
+        logger.info(f"Perfil de CPU escrito en: {output}")
+        logger.info("Funciones con mayor tiempo acumulado:")
+        for func_key in stats.fcn_list[:TOP_ENTRIES]:
+            filename, line, name = func_key
+            _, calls, _, cumtime, _ = stats.stats[func_key]
+            logger.info(f"  {cumtime:9.4f}s  {calls:7d}  {Path(filename).name}:{line}({name})")
+
+
+class MemoryMetrics(Metrics):
+    """
+    Métricas que además registran memoria por etapa con tracemalloc.
+
+    Para cada etapa se guarda el pico de memoria trazada durante la etapa
+    (incluidas sus sub-etapas) y los puntos de asignación que más memoria
+    retienen al terminarla. Las etapas muy frecuentes (trace=False, como cada
+    fragmento renderizado) solo miden tiempo: tomar dos instantáneas por
+    fragmento haría la ejecución inviable. Las etapas en streaming
+    (metrics.timed) toman una instantánea al empezar y otra al terminar.
+    """
+
+    def __init__(self, trace: bool = False):
+        super().__init__(trace)
+        self.memory: Dict[str, Dict[str, Any]] = {}
+        # Pico acumulado de cada etapa abierta; las etapas en streaming no se
+        # cierran en orden inverso al de apertura, así que no es una pila
+        self._peaks: Dict[int, int] = {}
+        self._next_peak = 0
+        self._memory_lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, trace: bool = True) -> Iterator[None]:
+        if not trace or not tracemalloc.is_tracing():
+            with super().stage(name, trace):
+                yield
+            return
+
+        state = self._begin_memory()
+        try:
+            with super().stage(name, trace):
+                yield
+        finally:
+            self._end_memory(name, state)
+
+    def begin_stream(self, name: str) -> Any:
+        if not tracemalloc.is_tracing():
+            return None
+        return self._begin_memory()
+
+    def end_stream(self, name: str, state: Any) -> None:
+        if state is not None and tracemalloc.is_tracing():
+            self._end_memory(name, state)
+
+    def _fold_peak(self) -> None:
+        """Reparte el pico global entre las etapas abiertas y lo reinicia."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for key, value in self._peaks.items():
+            self._peaks[key] = max(value, peak)
+        tracemalloc.reset_peak()
+
+    def _begin_memory(self) -> Tuple[int, tracemalloc.Snapshot]:
+        # El pico de tracemalloc es global: antes de reiniciarlo se acumula en
+        # las etapas abiertas para que una sub-etapa no oculte su pico
+        with self._memory_lock:
+            self._fold_peak()
+            key, self._next_peak = self._next_peak, self._next_peak + 1
+            self._peaks[key] = 0
+        return key, tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    def _end_memory(self, name: str, state: Tuple[int, tracemalloc.Snapshot]) -> None:
+        key, before = state
+        with self._memory_lock:
+            self._fold_peak()
+            peak = self._peaks.pop(key)
+        after = tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+        self._record(name, peak, after.compare_to(before, 'lineno'))
+        # Las instantáneas no cuentan en el pico de las etapas que siguen abiertas
+        tracemalloc.reset_peak()
+
+    def _record(self, name: str, peak: int, diff: List[tracemalloc.StatisticDiff]) -> None:
+        top = sorted((d for d in diff if d.size_diff > 0), key=lambda d: d.size_diff, reverse=True)
+        with self._memory_lock:
+            entry = self.memory.setdefault(name, {'peak_bytes': 0, 'top_allocations': []})
+            entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+            if top:
+                entry['top_allocations'] = [
+                    {
+                        'site': f"{d.traceback[0].filename}:{d.traceback[0].lineno}",
+                        'size_bytes': d.size_diff,
+                        'count': d.count_diff,
+                    }
+                    for d in top[:TOP_ENTRIES]
+                ]
+
+    def peak_bytes(self) -> int:
+        """Pico de memoria trazada de toda la ejecución."""
+        current_peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+        return max([current_peak] + [entry['peak_bytes'] for entry in self.memory.values()])
+
+
+def run_memory_profile(func: Callable[[], int], collector: MemoryMetrics, output: str) -> int:
+    """
+    Ejecuta func con tracemalloc activo y escribe el informe de memoria en JSON.
+
+    El colector debe estar activo (metrics.collect_metrics(collector)) para
+    que las etapas instrumentadas registren su memoria.
+
+    Returns:
+        El valor devuelto por func
+    """
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        return func()
+    finally:
+        peak = collector.peak_bytes()
+        tracemalloc.stop()
+        report = {'peak_bytes': peak, 'stages': collector.memory}
+        Path(output).write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+        logger.info(f"Perfil de memoria escrito en: {output}")
+        logger.info(f"Pico de memoria: {peak / 1024:.1f} KiB")
+        for name, entry in collector.memory.items():
+            site = entry['top_allocations'][0]['site'] if entry['top_allocations'] else '-'
+            logger.info(f"  {name:<24} pico {entry['peak_bytes'] / 1024:10.1f} KiB  ({site})")
+
+
+class RenderProfiler:
+    """
+    Atribuye el tiempo de renderizado y los bytes de salida a líneas de plantilla.
+
+    Durante el renderizado se activa sys.settrace solo para los frames del
+    código que Jinja2 genera al compilar (identificados por la variable
+    global __jinja_template__), y cada evento de línea se traduce a la línea
+    de la plantilla con Template.get_corresponding_lineno(). El tiempo entre
+    dos eventos (incluidas las llamadas a filtros y funciones Python) se
+    atribuye a la línea en curso; los bytes de cada fragmento, a la línea
+    del frame más interno que lo emitió (un {% include %} reemite los
+    fragmentos de la plantilla incluida). El tiempo del consumidor de los
+    fragmentos (por ejemplo, la escritura en streaming) no se cuenta.
+
+    Las líneas de plantilla se mapean al archivo y línea originales con
+    TemplateOrigins (ver MergeSourceFile.sourcemap).
+
+    Los contadores no se protegen con locks: render_profiling activa el
+    perfilador solo en el hilo que lo llama, y los renderizados de otros
+    hilos no lo ven.
+    """
+
+    def __init__(self):
+        # (archivo, línea) -> [segundos, bytes, ejecuciones]
+        self.lines: Dict[Tuple[str, int], List[float]] = {}
+        self.origins = TemplateOrigins()
+        self._origin_cache: Dict[Tuple[int, int], Tuple[str, int]] = {}
+        self._current: Optional[Tuple[str, int]] = None
+        self._since = 0.0
+        self._last_yielded: Optional[str] = None
+
+    def register(self, template, source_file: str, origins: Optional[List[Tuple[str, int]]]) -> None:
+        """Asocia a una plantilla compilada el origen de cada una de sus líneas."""
+        self.origins.register(template, source_file, origins)
+
+    def profile(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Itera los fragmentos de un renderizado midiendo cada línea de plantilla."""
+        iterator = iter(chunks)
+        previous_trace = sys.gettrace()
+        while True:
+            self._since = time.perf_counter()
+            sys.settrace(self._trace_call)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                sys.settrace(previous_trace)
+                self._charge(time.perf_counter())
+            self._last_yielded = None
+            yield chunk
+
+    def _trace_call(self, frame, event, arg):
+        if frame.f_globals.get('__jinja_template__') is None:
+            return None
+        return self._trace_line
+
+    def _trace_line(self, frame, event, arg):
+        if event == 'line':
+            now = time.perf_counter()
+            self._charge(now)
+            key = self._origin(frame.f_globals['__jinja_template__'], frame.f_lineno)
+            entry = self.lines.setdefault(key, [0.0, 0, 0])
+            if key != self._current:
+                entry[2] += 1
+            self._current = key
+        elif event == 'return' and isinstance(arg, str) and arg is not self._last_yielded:
+            # Un yield del generador: solo cuenta el frame más interno que emite el fragmento
+            self._last_yielded = arg
+            key = self._origin(frame.f_globals['__jinja_template__'], frame.f_lineno)
+            self.lines.setdefault(key, [0.0, 0, 0])[1] += len(arg.encode('utf-8'))
+        return self._trace_line
+
+    def _charge(self, now: float) -> None:
+        if self._current is not None:
+            self.lines[self._current][0] += now - self._since
+        self._since = now
+
+    def _origin(self, template, python_lineno: int) -> Tuple[str, int]:
+        """Archivo y línea de origen de una línea del código compilado."""
+        cache_key = (id(template), python_lineno)
+        result = self._origin_cache.get(cache_key)
+        if result is None:
+            lineno = self.origins.template_line(template, python_lineno)
+            result = self._origin_cache[cache_key] = self.origins.resolve(template, lineno)
+        return result
+
+    def report(self, top: int = TOP_ENTRIES) -> List[Dict[str, Any]]:
+        """Líneas ordenadas por tiempo de renderizado, de mayor a menor."""
+        total = sum(entry[0] for entry in self.lines.values()) or 1.0
+        rows = sorted(self.lines.items(), key=lambda item: item[1][0], reverse=True)
+        return [
+            {
+                'file': source_file,
+                'line': line,
+                'time_s': entry[0],
+                'time_pct': 100.0 * entry[0] / total,
+                'bytes': entry[1],
+                'hits': entry[2],
+            }
+            for (source_file, line), entry in rows[:top]
+        ]
+
+
+# Perfilador de renderizado activo en cada hilo (sin atributo = desactivado)
+_render_profiler_state = threading.local()
+
+
+def active_render_profiler() -> Optional[RenderProfiler]:
+    """Perfilador de renderizado activo en el hilo actual, si lo hay."""
+    return getattr(_render_profiler_state, 'profiler', None)
+
+
+@contextmanager
+def render_profiling(profiler: Optional[RenderProfiler] = None) -> Iterator[RenderProfiler]:
+    """Activa el perfil de renderizado de TemplateEngine en el hilo actual durante el bloque."""
+    previous = active_render_profiler()
+    _render_profiler_state.profiler = profiler if profiler is not None else RenderProfiler()
+    try:
+        yield _render_profiler_state.profiler
+    finally:
+        _render_profiler_state.profiler = previous
+
+
+def run_render_profile(func: Callable[[], int], output: str, top: int = 20) -> int:
+    """
+    Ejecuta func con el perfil de renderizado activo y escribe la tabla de
+    líneas más costosas en JSON.
+
+    Returns:
+        El valor devuelto por func
+    """
+    with render_profiling() as profiler:
+        try:
+            return func()
+        finally:
+            rows = profiler.report(top)
+            Path(output).write_text(json.dumps({'hot_lines': rows}, indent=2) + '\n', encoding='utf-8')
+            logger.info(f"Perfil de renderizado escrito en: {output}")
+            logger.info("Líneas de plantilla más costosas:")
+            for row in rows:
+                logger.info(
+                    f"  {row['time_s'] * 1000:9.2f} ms {row['time_pct']:5.1f}%  {row['bytes']:9d} B  "
+                    f"{row['hits']:6d}x  {Path(row['file']).name}:{row['line']}"
+                )
@@ -0,0 +1,400 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Mapa de origen de la salida: línea de salida -> archivo y línea originales.
+
+Funcionalidades:
+- Traducción de las líneas del código compilado por Jinja2 a la línea de
+  plantilla y, a través de la expansión de inclusiones, al archivo original
+- Construcción del mapa durante el renderizado, fragmento a fragmento
+- Representación compacta por tramos (arrays de enteros): cada tramo cubre
+  líneas de salida consecutivas cuyo origen avanza 0 o 1 línea por línea
+- Consulta en O(log n) por búsqueda binaria, sin volver a renderizar
+- Herramienta de consulta: msf-sourcemap salida.sql 48213 (o python -m MergeSourceFile.sourcemap)
+
+El mapa se guarda junto a la salida como <salida>.map.json.
+"""
+
+import sys
+import json
+import logging
+import argparse
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from jinja2 import Environment, nodes
+from jinja2.compiler import CodeGenerator
+
+logger = logging.getLogger(__name__)
+
+SOURCE_MAP_VERSION = 1
+SOURCE_MAP_SUFFIX = '.map.json'
+
+# Variable local con la que el código compilado de {% include %} itera la plantilla incluida
+_INCLUDE_GENERATOR = 'gen'
+
+
+def map_path_for(output: Union[str, Path]) -> Path:
+    """Ruta del mapa de origen de un archivo de salida."""
+    return Path(str(output) + SOURCE_MAP_SUFFIX)
+
+
+class OriginCodeGenerator(CodeGenerator):
+    """
+    Generador de código Jinja2 que registra también la línea del texto literal.
+
+    Jinja2 solo anota en debug_info la línea de los nodos evaluados en tiempo
+    de ejecución; el yield de un bloque de texto literal hereda la del nodo
+    anterior. Aquí se anota la línea del primer nodo de cada bloque literal,
+    para que get_corresponding_lineno() sea exacto también para el texto.
+    """
+
+    def visit_Output(self, node: nodes.Output, frame) -> None:
+        # Mismo criterio que CodeGenerator.visit_Output para agrupar constantes
+        finalize = self._make_finalize()
+        group_starts = []
+        previous_const = False
+        for child in node.nodes:
+            try:
+                if not (finalize.const or isinstance(child, nodes.TemplateData)):
+                    raise nodes.Impossible()
+                self._output_child_to_const(child, frame, finalize)
+                is_const = True
+            except (nodes.Impossible, Exception):
+                is_const = False
+            if is_const and not previous_const:
+                group_starts.append(child)
+            previous_const = is_const
+        self._literal_starts = iter(group_starts)
+        super().visit_Output(node, frame)
+
+    def _output_const_repr(self, group) -> str:
+        start = next(self._literal_starts, None)
+        if start is not None:
+            self.newline(start)
+        return super()._output_const_repr(group)
+
+
+class OriginEnvironment(Environment):
+    """Entorno Jinja2 cuyas plantillas mapean también el texto literal a su línea."""
+
+    code_generator_class = OriginCodeGenerator
+
+
+class TemplateOrigins:
+    """
+    Traduce líneas del código que Jinja2 genera al compilar a (archivo, línea).
+
+    La línea de plantilla se obtiene con Template.get_corresponding_lineno().
+    Si la plantilla se registró con los orígenes devueltos por las extensiones
+    (o su loader los conoce, como el de inclusiones diferidas de SQLPlus), la
+    línea de plantilla se traduce al archivo y línea originales.
+    """
+
+    def __init__(self):
+        self._registered: Dict[Any, Tuple[str, Optional[List[Tuple[str, int]]]]] = {}
+        self._lineno_cache: Dict[Tuple[int, int], int] = {}
+
+    def register(self, template, source_file: str, origins: Optional[List[Tuple[str, int]]]) -> None:
+        """Asocia a una plantilla compilada el origen de cada una de sus líneas."""
+        self._registered[template] = (source_file, origins)
+
+    def template_line(self, template, python_lineno: int) -> int:
+        """Línea de plantilla correspondiente a una línea del código compilado."""
+        cache_key = (id(template), python_lineno)
+        lineno = self._lineno_cache.get(cache_key)
+        if lineno is None:
+            lineno = self._lineno_cache[cache_key] = template.get_corresponding_lineno(python_lineno)
+        return lineno
+
+    def resolve(self, template, lineno: int) -> Tuple[str, int]:
+        """Archivo y línea de origen de una línea de plantilla."""
+        if template in self._registered:
+            source_file, origins = self._registered[template]
+        else:
+            # Plantillas incluidas: el loader puede conocer sus orígenes
+            source_file = template.filename or template.name or '<template>'
+            loader_origins = getattr(template.environment.loader, 'line_origins', {})
+            origins = loader_origins.get(template.filename)
+
+        if origins is not None and 0 < lineno <= len(origins):
+            return origins[lineno - 1]
+        return source_file, lineno
+
+
+class SourceMap:
+    """
+    Mapa de origen por tramos, consultable en O(log n).
+
+    El tramo i empieza en la línea de salida out_start[i]; la línea de salida
+    o del tramo procede de files[file_ids[i]], línea
+    src_start[i] + steps[i] * (o - out_start[i]).
+    """
+
+    def __init__(self, files: List[str], out_start: array, file_ids: array,
+                 src_start: array, steps: array, lines: int):
+        self.files = files
+        self.out_start = out_start
+        self.file_ids = file_ids
+        self.src_start = src_start
+        self.steps = steps
+        self.lines = lines
+
+    def lookup(self, line: int) -> Optional[Tuple[str, int]]:
+        """
+        Origen de una línea de salida (numerada desde 1).
+
+        Returns:
+            (archivo, línea) o None si la línea está fuera de la salida
+        """
+        if not 1 <= line <= self.lines:
+            return None
+        i = bisect_right(self.out_start, line) - 1
+        return self.files[self.file_ids[i]], self.src_start[i] + self.steps[i] * (line - self.out_start[i])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación serializable del mapa."""
+        return {
+            'version': SOURCE_MAP_VERSION,
+            'lines': self.lines,
+            'files': self.files,
+            'segments': {
+                'out': self.out_start.tolist(),
+                'file': self.file_ids.tolist(),
+                'src': self.src_start.tolist(),
+                'step': self.steps.tolist(),
+            },
+        }
+
+    def to_json(self) -> str:
+        """Mapa en JSON compacto."""
+        return json.dumps(self.to_dict(), separators=(',', ':')) + '\n'
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> 'SourceMap':
+        """
+        Carga un mapa guardado con to_json().
+
+        Raises:
+            ValueError: Si el archivo no es un mapa de origen de una versión soportada
+        """
+        data = json.loads(Path(path).read_text(encoding='utf-8'))
+        if data.get('version') != SOURCE_MAP_VERSION:
+            raise ValueError(f"Versión de mapa de origen no soportada en {path}: {data.get('version')}")
+        segments = data['segments']
+        return cls(
+            data['files'],
+            array('L', segments['out']),
+            array('L', segments['file']),
+            array('L', segments['src']),
+            array('B', segments['step']),
+            data['lines'],
+        )
+
+
+class SourceMapBuilder:
+    """
+    Construye el mapa de origen a partir de los fragmentos renderizados.
+
+    Cada línea de salida toma el origen del fragmento en el que empieza. En
+    los fragmentos de texto literal de la plantilla cada salto de línea
+    avanza una línea de origen; en los producidos por expresiones (valores de
+    variables, filtros...) todas sus líneas apuntan a la línea de la expresión.
+    """
+
+    def __init__(self):
+        self.origins = TemplateOrigins()
+        self._files: List[str] = []
+        self._file_index: Dict[str, int] = {}
+        self._out_start = array('L')
+        self._file_ids = array('L')
+        self._src_start = array('L')
+        self._steps = array('B')
+        self._open_len = 0  # Líneas del último tramo
+        self._next_line = 1
+        self._at_line_start = True
+        self._const_ids: Dict[Any, frozenset] = {}
+
+    def track(self, chunks: Iterator[str]) -> Iterator[str]:
+        """
+        Registra el origen de cada fragmento de Template.generate() y lo reemite.
+
+        Args:
+            chunks: Generador devuelto por Template.generate(); se inspecciona
+                la cadena de generadores suspendidos (incluidas las plantillas
+                de {% include %}) para localizar el frame que emitió cada fragmento
+        """
+        for chunk in chunks:
+            frame = _innermost_template_frame(chunks)
+            if frame is None:
+                self.add(chunk, '<unknown>', 0, False)
+            else:
+                template = frame.f_globals['__jinja_template__']
+                lineno = self.origins.template_line(template, frame.f_lineno)
+                literal = id(chunk) in self._literals(frame.f_code)
+                if literal:
+                    self._add_literal(chunk, template, lineno)
+                else:
+                    self.add(chunk, *self.origins.resolve(template, lineno), False)
+            yield chunk
+
+    def _literals(self, code) -> frozenset:
+        """Identidades de las constantes de texto de un código compilado."""
+        ids = self._const_ids.get(code)
+        if ids is None:
+            ids = self._const_ids[code] = frozenset(id(c) for c in code.co_consts if isinstance(c, str))
+        return ids
+
+    def _add_literal(self, text: str, template, lineno: int) -> None:
+        """Texto literal: cada línea se mapea por separado (puede venir de otra inclusión)."""
+        start = 0
+        while True:
+            end = text.find('\n', start)
+            piece = text[start:] if end < 0 else text[start:end + 1]
+            if piece:
+                self.add(piece, *self.origins.resolve(template, lineno), False)
+            if end < 0:
+                return
+            start = end + 1
+            lineno += 1
+
+    def add(self, text: str, source_file: str, source_line: int, sequential: bool = True) -> None:
+        """
+        Añade texto de salida con su origen.
+
+        Args:
+            text: Texto emitido
+            source_file: Archivo de origen del inicio del texto
+            source_line: Línea de origen del inicio del texto
+            sequential: Si cada salto de línea del texto avanza una línea de origen
+        """
+        if not text:
+            return
+        ends_line = text.endswith('\n')
+        starts = text.count('\n') - ends_line
+        file_id = self._file_id(source_file)
+        if self._at_line_start:
+            self._push(file_id, source_line, 1, 1)
+        if starts:
+            step = 1 if sequential else 0
+            self._push(file_id, source_line + step, starts, step)
+        self._at_line_start = ends_line
+
+    def _file_id(self, source_file: str) -> int:
+        file_id = self._file_index.get(source_file)
+        if file_id is None:
+            file_id = self._file_index[source_file] = len(self._files)
+            self._files.append(source_file)
+        return file_id
+
+    def _push(self, file_id: int, source_line: int, count: int, step: int) -> None:
+        """Añade count líneas de salida con origen source_line, source_line + step, ..."""
+        while count:
+            if self._open_len and self._file_ids[-1] == file_id:
+                start = self._src_start[-1]
+                if self._open_len == 1 and source_line - start in (0, 1):
+                    self._steps[-1] = source_line - start
+                segment_step = self._steps[-1]
+                if source_line == start + segment_step * self._open_len:
+                    taken = count if count == 1 or step == segment_step else 1
+                    self._open_len += taken
+                    self._next_line += taken
+                    source_line += step * taken
+                    count -= taken
+                    continue
+            self._out_start.append(self._next_line)
+            self._file_ids.append(file_id)
+            self._src_start.append(source_line)
+            self._steps.append(step if count > 1 else 1)
+            self._open_len = count
+            self._next_line += count
+            return
+
+    def build(self) -> SourceMap:
+        """Mapa de origen de todo el texto añadido."""
+        lines = self._next_line - 1
+        return SourceMap(list(self._files), array('L', self._out_start), array('L', self._file_ids),
+                         array('L', self._src_start), array('B', self._steps), lines)
+
+
+def _innermost_template_frame(generator):
+    """
+    Frame de plantilla más interno de una cadena de generadores suspendidos.
+
+    Template.generate() delega con yield from en la función de renderizado,
+    y el código de {% include %} itera la plantilla incluida desde la
+    variable local 'gen' (que queda cerrada al terminar la inclusión).
+    """
+    frame = None
+    while generator is not None:
+        inner = getattr(generator, 'gi_yieldfrom', None)
+        if inner is not None:
+            generator = inner
+            continue
+        current = getattr(generator, 'gi_frame', None)
+        if current is None:
+            break
+        if '__jinja_template__' in current.f_globals:
+            frame = current
+        if _INCLUDE_GENERATOR not in current.f_code.co_varnames:
+            break
+        generator = current.f_locals.get(_INCLUDE_GENERATOR)
+    return frame
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Consulta el origen de líneas de una salida a partir de su mapa.
+
+    Returns:
+        0 si todas las líneas se encontraron, 1 si alguna está fuera de la salida
+    """
+    parser = argparse.ArgumentParser(
+        prog='msf-sourcemap',
+        description="Indica el archivo y línea originales de líneas de una salida generada."
+    )
+    parser.add_argument('map', help=f"Mapa de origen ({SOURCE_MAP_SUFFIX}) o archivo de salida")
+    parser.add_argument('lines', nargs='+', type=int, help="Líneas de la salida (desde 1)")
+    args = parser.parse_args(argv)
+
+    path = Path(args.map)
+    if not path.name.endswith(SOURCE_MAP_SUFFIX):
+        path = map_path_for(path)
+    source_map = SourceMap.load(path)
+
+    exit_code = 0
+    for line in args.lines:
+        origin = source_map.lookup(line)
+        if origin is None:
+            print(f"{line}: fuera de la salida ({source_map.lines} líneas)")
+            exit_code = 1
+        else:
+            print(f"{line}: {origin[0]}:{origin[1]}")
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,290 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Empalme (splice) de archivos inertes a nivel de bytes.
+
+Un archivo es inerte cuando ni la extensión SQLPlus ni Jinja2 pueden
+modificarlo: sin inclusiones @, sin variables &, sin DEFINE/UNDEFINE y sin
+delimitadores de plantilla. En lugar de su contenido, la extensión inserta
+una marca que atraviesa Jinja2 sin cambios y que el escritor de la salida
+sustituye copiando los bytes del archivo original.
+
+Funcionalidades:
+- Clasificación de archivos inertes con caché por mtime
+- Codificación y detección de marcas en el texto renderizado
+- Copia de bytes con os.copy_file_range / os.sendfile
+- Copia por bloques hacia flujos binarios (salida comprimida)
+"""
+
+import os
+import re
+import shutil
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Delimitadores de inicio de Jinja2 por defecto
+DEFAULT_TEMPLATE_MARKERS = ('{{', '{%', '{#')
+
+# Rechazo rápido: caracteres que SQLPlus o splitlines() tratarían de forma especial,
+# espacios al final de línea (rstrip) e inclusiones @ al inicio de línea
+_NOT_INERT_PATTERN = re.compile(
+    rb'[\r\x00\x0b\x0c\x1c-\x1e&]'
+    rb'|[ \t\x1f](?:\n|\Z)'
+    rb'|(?:\A|\n)@'
+    rb'|(?:\A|\n)\s*(?:un)?define\b',
+    re.IGNORECASE
+)
+
+# Separadores de línea Unicode reconocidos por str.splitlines()
+_UNICODE_LINE_BREAKS = ('\x85', '\u2028', '\u2029')
+
+_MARKER_PATTERN = re.compile(r'\x00MSF:SPLICE:([0-9a-f]+):(\d+):([01])\x00')
+
+
+class SpliceRef(NamedTuple):
+    """Referencia a un archivo inerte a copiar en la salida."""
+    path: str
+    size: int
+    ends_with_newline: bool
+    line_end: bool  # La marca iba seguida de salto de línea
+
+
+# Caché de clasificación: ruta -> (mtime_ns, tamaño, marcadores, resultado)
+_inert_cache: Dict[str, Tuple[int, int, Tuple[str, ...], Optional[Tuple[int, bool]]]] = {}
+_inert_cache_lock = threading.Lock()
+
+
+def _is_inert_bytes(data: bytes, markers: Sequence[str]) -> bool:
+    """Determina si el contenido pasa sin cambios por SQLPlus y Jinja2."""
+    metrics.count('regex_calls')
+    if _NOT_INERT_PATTERN.search(data):
+        return False
+    if any(marker.encode('utf-8') in data for marker in markers):
+        return False
+    if data.isascii():
+        return True
+
+    # Contenido no ASCII: validar UTF-8 y espacios / saltos de línea Unicode
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return False
+    if any(br in text for br in _UNICODE_LINE_BREAKS):
+        return False
+    return all(line == line.rstrip() for line in text.split('\n'))
+
+
+def classify_inert(path: Path, markers: Sequence[str] = DEFAULT_TEMPLATE_MARKERS) -> Optional[Tuple[int, bool]]:
+    """
+    Clasifica un archivo como inerte, con caché por mtime y tamaño.
+
+    Args:
+        path: Archivo a clasificar
+        markers: Delimitadores de inicio de plantilla a considerar
+
+    Returns:
+        (tamaño, termina_en_salto_de_línea) si el archivo es inerte, None si no
+    """
+    key = str(path)
+    markers = tuple(markers)
+    metrics.count('stat_calls')
+    st = os.stat(path)
+
+    cached = _inert_cache.get(key)
+    if cached is not None and cached[:3] == (st.st_mtime_ns, st.st_size, markers):
+        metrics.count('inert_cache_hits')
+        return cached[3]
+
+    metrics.count('file_opens')
+    data = Path(path).read_bytes()
+    result = None
+    # Un archivo vacío no se empalma: su expansión no aporta ni una línea, y
+    # la marca (con su salto) sí lo haría al final de la salida
+    if data and len(data) == st.st_size and _is_inert_bytes(data, markers):
+        result = (st.st_size, data.endswith(b'\n'))
+
+    with _inert_cache_lock:
+        _inert_cache[key] = (st.st_mtime_ns, st.st_size, markers, result)
+    return result
+
+
+def make_marker(path: Path, size: int, ends_with_newline: bool) -> str:
+    """Construye la marca de empalme que sustituye al contenido de un archivo inerte."""
+    encoded = str(path).encode('utf-8').hex()
+    return f"\x00MSF:SPLICE:{encoded}:{size}:{int(ends_with_newline)}\x00"
+
+
+def iter_splices(chunks: Iterable[str]) -> Iterator[Union[str, SpliceRef]]:
+    """
+    Separa las marcas de empalme del texto renderizado.
+
+    Cada marca, junto con el salto de línea que la sigue, se convierte en un
+    SpliceRef; el resto del texto se emite sin cambios.
+
+    Raises:
+        RuntimeError: Si una marca fue alterada durante el renderizado
+    """
+    pending: Optional[Tuple[str, int, bool]] = None
+
+    for chunk in chunks:
+        if pending is not None:
+            line_end = chunk.startswith('\n')
+            yield SpliceRef(*pending, line_end)
+            pending = None
+            if line_end:
+                chunk = chunk[1:]
+
+        if '\x00' not in chunk:
+            if chunk:
+                yield chunk
+            continue
+
+        pos = 0
+        for match in _MARKER_PATTERN.finditer(chunk):
+            if match.start() > pos:
+                yield chunk[pos:match.start()]
+            ref = (bytes.fromhex(match.group(1)).decode('utf-8'), int(match.group(2)), match.group(3) == '1')
+            end = match.end()
+            if end == len(chunk):
+                pending = ref
+            else:
+                line_end = chunk[end] == '\n'
+                yield SpliceRef(*ref, line_end)
+                if line_end:
+                    end += 1
+            pos = end
+
+        rest = chunk[pos:]
+        if '\x00' in rest:
+            raise RuntimeError(
+                "Marca de empalme alterada durante el renderizado Jinja2 "
+                "(¿inclusión dentro de un filtro?). Desactive 'splice_inert_files'."
+            )
+        if rest:
+            yield rest
+
+    if pending is not None:
+        yield SpliceRef(*pending, False)
+
+
+def _splice_range(ref: SpliceRef) -> Tuple[int, str]:
+    """Bytes a copiar del archivo y sufijo a añadir para equivaler al texto expandido."""
+    if ref.ends_with_newline:
+        return (ref.size, '') if ref.line_end else (ref.size - 1, '')
+    return ref.size, '\n' if ref.line_end else ''
+
+
+def splice_text(ref: SpliceRef) -> str:
+    """Devuelve como texto el contenido que representa un SpliceRef."""
+    count, suffix = _splice_range(ref)
+    metrics.count('file_opens')
+    metrics.count('bytes_decoded', count)
+    with open(ref.path, 'rb') as f:
+        return f.read(count).decode('utf-8') + suffix
+
+
+def resolve_text(chunks: Iterable[str]) -> Iterator[str]:
+    """Sustituye las marcas de empalme por el contenido de los archivos, como texto."""
+    for item in iter_splices(chunks):
+        yield item if isinstance(item, str) else splice_text(item)
+
+
+def _copy_range(src_fd: int, dst_fd: int, count: int) -> None:
+    """Copia count bytes entre descriptores usando el kernel cuando es posible."""
+    copy_funcs = []
+    if hasattr(os, 'copy_file_range'):
+        copy_funcs.append(lambda n: os.copy_file_range(src_fd, dst_fd, n))
+    if hasattr(os, 'sendfile'):
+        copy_funcs.append(lambda n: os.sendfile(dst_fd, src_fd, None, n))
+
+    for copy in copy_funcs:
+        try:
+            while count > 0:
+                copied = copy(count)
+                if copied == 0:
+                    break
+                count -= copied
+            if count == 0:
+                return
+        except OSError as e:
+            logger.debug(f"Copia por kernel no disponible ({e})")
+
+    with os.fdopen(os.dup(src_fd), 'rb') as fsrc, os.fdopen(os.dup(dst_fd), 'wb') as fdst:
+        while count > 0:
+            block = fsrc.read(min(count, shutil.COPY_BUFSIZE))
+            if not block:
+                break
+            fdst.write(block)
+            count -= len(block)
+
+
+def write_splice(f, ref: SpliceRef) -> None:
+    """
+    Escribe en un archivo de texto abierto el contenido de un SpliceRef.
+
+    Si la salida es UTF-8 con saltos de línea '\\n' se copian los bytes
+    directamente entre descriptores; en otro caso se escribe como texto.
+    """
+    encoding = (getattr(f, 'encoding', None) or '').lower().replace('_', '-')
+    fileno = getattr(f, 'fileno', None)
+    if os.linesep != '\n' or encoding not in ('utf-8', 'utf8') or fileno is None:
+        f.write(splice_text(ref))
+        return
+
+    count, suffix = _splice_range(ref)
+    f.flush()
+    metrics.count('file_opens')
+    with open(ref.path, 'rb') as src:
+        _copy_range(src.fileno(), fileno(), count)
+    if suffix:
+        f.write(suffix)
+
+
+def write_splice_binary(out, ref: SpliceRef, encoding: str = 'utf-8') -> None:
+    """
+    Escribe el contenido de un SpliceRef en un flujo binario (p. ej. GzipFile).
+
+    Los bytes se copian por bloques sin decodificar cuando la salida es UTF-8;
+    en otro caso se recodifican como texto.
+    """
+    if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+        out.write(splice_text(ref).encode(encoding))
+        return
+
+    count, suffix = _splice_range(ref)
+    metrics.count('file_opens')
+    with open(ref.path, 'rb') as src:
+        while count > 0:
+            block = src.read(min(count, shutil.COPY_BUFSIZE))
+            if not block:
+                break
+            out.write(block)
+            count -= len(block)
+    if suffix:
+        out.write(suffix.encode(encoding))
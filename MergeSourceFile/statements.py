@@ -0,0 +1,423 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Índice de sentencias del script generado.
+
+Funcionalidades:
+- Detección incremental de los límites de sentencia con las reglas de
+  SQL*Plus: ';' al final de línea para SQL, línea con '/' para bloques
+  PL/SQL (DECLARE, BEGIN, CREATE PROCEDURE/FUNCTION/PACKAGE/TRIGGER/TYPE...)
+  y comandos SQL*Plus de una línea (con continuación '-')
+- Cadenas ('...', q'[...]'), identificadores entre comillas y comentarios
+  (--, /* */, REM) no cortan sentencias
+- Offsets de bytes (codificados), líneas y tipo de cada sentencia
+- Se alimenta con los fragmentos mientras se escribe la salida: no hay una
+  segunda pasada sobre el archivo generado
+
+El índice se guarda junto a la salida como <salida>.stmts.json. Los offsets
+se refieren al texto sin comprimir (también para salidas .gz).
+"""
+
+import re
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .splice import SpliceRef, splice_text
+
+STATEMENT_INDEX_VERSION = 1
+STATEMENT_INDEX_SUFFIX = '.stmts.json'
+
+# Tipos de sentencia
+SQL = 'sql'
+PLSQL = 'plsql'
+SQLPLUS = 'sqlplus'
+
+# Inicio de bloques PL/SQL (terminados por una línea con '/')
+_PLSQL_START = re.compile(
+    r'(DECLARE|BEGIN)\b'
+    r'|CREATE\s+(OR\s+REPLACE\s+)?((NON)?EDITIONABLE\s+|EDITIONING\s+)?'
+    r'(FUNCTION|PROCEDURE|PACKAGE|TRIGGER|TYPE|LIBRARY|JAVA)\b',
+    re.IGNORECASE
+)
+
+# CREATE OR REPLACE puede partir la cabecera en varias líneas
+_CREATE_HEAD = re.compile(r'CREATE(\s+OR(\s+REPLACE)?)?((\s+(NON)?EDITIONABLE)|(\s+EDITIONING))?\s*$', re.IGNORECASE)
+
+# Comandos SQL*Plus (y abreviaturas habituales): sentencias de una línea
+_SQLPLUS_COMMANDS = frozenset((
+    'ACC', 'ACCEPT', 'APPEND', 'ARCHIVE', 'BRE', 'BREAK', 'BTI', 'BTITLE', 'CL', 'CLEAR',
+    'COL', 'COLUMN', 'COMP', 'COMPUTE', 'CONN', 'CONNECT', 'COPY', 'DEF', 'DEFINE', 'DESC',
+    'DESCRIBE', 'DISC', 'DISCONNECT', 'EXEC', 'EXECUTE', 'EXIT', 'HO', 'HOST', 'PASSW',
+    'PASSWORD', 'PAU', 'PAUSE', 'PRI', 'PRINT', 'PRO', 'PROMPT', 'QUIT', 'REPF', 'REPFOOTER',
+    'REPH', 'REPHEADER', 'SAVE', 'SET', 'SHO', 'SHOW', 'SHUTDOWN', 'SPO', 'SPOOL', 'STA',
+    'START', 'STARTUP', 'TIMI', 'TIMING', 'TTI', 'TTITLE', 'UNDEF', 'UNDEFINE', 'VAR',
+    'VARIABLE', 'WHENEVER',
+))
+
+# SET seguido de estas palabras es SQL (SET TRANSACTION, SET ROLE...)
+_SQL_SET = frozenset(('TRANSACTION', 'ROLE', 'CONSTRAINT', 'CONSTRAINTS'))
+
+_FIRST_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_$#]*')
+
+# Tokens que cambian el estado del análisis: comentarios, cadenas e identificadores
+_TOKEN = re.compile(r"--|/\*|(?<![\w$#])[nN]?[qQ]'|'|\"")
+
+# Tokens que impiden decidir el estado por la paridad de comillas simples
+_COMPLEX = re.compile(r"--|/\*|[qQ]'|\"")
+
+# Línea con '/' sola, con el salto de línea que la precede: termina un bloque
+# PL/SQL (o una sentencia SQL sin ';'). Sin anclas ni alternativas, que impiden
+# a re localizar rápido el primer carácter
+_SLASH_LINE = re.compile(r'\n[ \t]*/[ \t]*\r?\n')
+
+# ';' al final de línea (con comentario opcional): candidato a terminar una sentencia SQL
+_SEMI_END = re.compile(r';[ \t]*(?:--[^\n]*)?\r?\n')
+
+# Sentencia SQL completa en una sola línea, sin comentarios ni comillas dobles y
+# con cadenas simples cerradas en la línea (caso habitual de los scripts de datos)
+_ONE_LINE_SQL = re.compile(
+    r"[ \t]*([A-Za-z][A-Za-z0-9_$#]*)"
+    r"(?:[^\n'\";\-/]++|(?<![qQ])'[^'\n]*+'|-(?!-)|/(?!\*)|;(?![ \t]*\r?\n))*+"
+    r";[ \t]*\r?\n"
+)
+
+# Palabras iniciales que no admiten el atajo de sentencia de una línea
+_NOT_ONE_LINE = _SQLPLUS_COMMANDS | {'REM', 'REMARK', 'DECLARE', 'BEGIN'}
+
+_Q_CLOSING = {'[': ']', '{': '}', '(': ')', '<': '>'}
+
+
+def index_path_for(output: Union[str, Path]) -> Path:
+    """Ruta del índice de sentencias de un archivo de salida."""
+    return Path(str(output) + STATEMENT_INDEX_SUFFIX)
+
+
+def _scan(text: str, start: int, end: int, state: Optional[str]) -> Optional[str]:
+    """
+    Estado de cadenas y comentarios de SQL al final de text[start:end].
+
+    Args:
+        state: Estado al inicio: None (código), "'" (cadena), 'q' + cierre
+            (cadena q'[...]'), '"' (identificador) o '*' (comentario /* */)
+
+    Returns:
+        Estado al final del tramo; '-' si termina dentro de un comentario --
+    """
+    # Caso habitual: solo cadenas simples, basta la paridad de comillas
+    if state in (None, "'") and not _COMPLEX.search(text, start, end):
+        if text.count("'", start, end) % 2:
+            return None if state else "'"
+        return state
+
+    pos = start
+    while pos < end:
+        if state is None:
+            match = _TOKEN.search(text, pos, end)
+            if match is None:
+                return None
+            token = match.group(0)
+            pos = match.end()
+            if token == '--':
+                newline = text.find('\n', pos, end)
+                if newline < 0:
+                    return '-'
+                pos = newline + 1
+            elif token == '/*':
+                state = '*'
+            elif token in ("'", '"'):
+                state = token
+            elif pos < end:
+                state = 'q' + _Q_CLOSING.get(text[pos], text[pos])
+                pos += 1
+            else:
+                state = "'"
+        else:
+            closing = {'*': '*/', "'": "'", '"': '"'}.get(state) or state[1] + "'"
+            found = text.find(closing, pos, end)
+            if found < 0:
+                return state
+            if state == "'" and text.startswith("''", found) and found + 1 < end:
+                pos = found + 2
+            else:
+                state, pos = None, found + len(closing)
+    return state
+
+
+class StatementIndexer:
+    """
+    Construye el índice de sentencias a partir del texto, por fragmentos.
+
+    Cada sentencia queda registrada con su offset de bytes inicial y final
+    (exclusivo, incluido el terminador y su salto de línea), sus líneas
+    inicial y final (desde 1), su tipo (sql, plsql, sqlplus) y su primera
+    palabra en mayúsculas (SELECT, CREATE, SET...). Las líneas en blanco y
+    los comentarios entre sentencias no forman parte de ninguna.
+
+    Solo el inicio de cada sentencia se analiza línea a línea; dentro de una
+    sentencia se buscan con expresiones regulares las líneas candidatas a
+    terminarla y el estado de cadenas y comentarios se actualiza por tramos.
+    """
+
+    def __init__(self, encoding: str = 'utf-8'):
+        self.encoding = encoding
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        self.lines: List[int] = []
+        self.end_lines: List[int] = []
+        self.kinds: List[str] = []
+        self.keywords: List[str] = []
+        self._offset = 0
+        self._line = 0
+        # Texto pendiente, precedido del salto de línea centinela
+        self._buffer = '\n'
+        # Sentencia en curso: (offset, línea, tipo, palabra clave) o None
+        self._current: Optional[Tuple[int, int, str, str]] = None
+        self._head = ''
+        self._state: Optional[str] = None
+        self._comment = False
+
+    def observe(self, chunks: Iterable[Union[str, SpliceRef]]) -> Iterator[Union[str, SpliceRef]]:
+        """
+        Reemite los fragmentos de la salida indexándolos por el camino.
+
+        Los SpliceRef se indexan con el texto del archivo referenciado; el
+        escritor sigue copiando sus bytes directamente.
+        """
+        for chunk in chunks:
+            self.feed(chunk if isinstance(chunk, str) else splice_text(chunk))
+            yield chunk
+        self.finish()
+
+    def feed(self, text: str) -> None:
+        """Añade texto de la salida."""
+        self._buffer = self._drain(self._buffer + text)
+
+    def finish(self) -> None:
+        """Procesa la última línea (sin salto de línea) y cierra la sentencia en curso."""
+        if len(self._buffer) > 1:
+            self._drain(self._buffer + '\n')
+            self._buffer = '\n'
+            # El salto de línea añadido no existe en la salida
+            self._offset -= 1
+            if self.ends and self.ends[-1] > self._offset:
+                self.ends[-1] = self._offset
+        if self._current is not None:
+            self._close()
+
+    def _drain(self, text: str) -> str:
+        """
+        Procesa las líneas completas de text y devuelve el resto.
+
+        text empieza siempre con un salto de línea centinela (el final de la
+        línea anterior), de modo que una línea '/' se reconoce por el salto de
+        línea que la precede y la búsqueda no necesita anclas de inicio de línea.
+        """
+        pos, n = 1, len(text)
+        slash = _SLASH_LINE.search(text, 0)
+        while pos < n:
+            current = self._current
+            if current is None:
+                match = _ONE_LINE_SQL.match(text, pos)
+                if match is not None:
+                    keyword = match.group(1).upper()
+                    if keyword not in _NOT_ONE_LINE and not (
+                            keyword == 'CREATE' and _PLSQL_START.match(text, match.start(1))):
+                        self._current = (self._offset, self._line + 1, SQL, keyword)
+                        self._advance(text, pos, match.end())
+                        self._close()
+                        pos = match.end()
+                        continue
+            if current is None or self._head or current[2] == SQLPLUS:
+                end = text.find('\n', pos)
+                if end < 0:
+                    break
+                closes = self._line_start(text, pos, end)
+                if closes is not None:
+                    self._advance(text, pos, end + 1)
+                    pos = end + 1
+                    if closes:
+                        self._close()
+                continue
+
+            # Siguiente línea '/' (la búsqueda se reutiliza mientras siga por delante)
+            if slash is not None and slash.start() < pos - 1:
+                slash = _SLASH_LINE.search(text, pos - 1)
+
+            if current[2] == PLSQL:
+                if slash is None:
+                    break
+                self._advance(text, pos, slash.end())
+                pos = slash.end()
+                self._close()
+                continue
+
+            semi = _SEMI_END.search(text, pos)
+            if slash is not None and (semi is None or slash.start() < semi.start()):
+                boundary, line_end = slash.start() + 1, slash.end()
+            elif semi is not None:
+                boundary, line_end = semi.start() + 1, semi.end()
+            else:
+                break
+            if _scan(text, pos, boundary, self._state) is None:
+                self._advance(text, pos, line_end)
+                self._close()
+            else:
+                self._state = _scan(text, pos, line_end, self._state)
+                self._advance(text, pos, line_end)
+            pos = line_end
+
+        # Dentro de una sentencia SQL o PL/SQL se consumen ya las líneas completas
+        current = self._current
+        if current is not None and not self._head and current[2] != SQLPLUS:
+            last = text.rfind('\n', pos) + 1
+            if last > pos:
+                if current[2] == SQL:
+                    self._state = _scan(text, pos, last, self._state)
+                self._advance(text, pos, last)
+                pos = last
+        return text[pos - 1:]
+
+    def _advance(self, text: str, start: int, end: int) -> None:
+        """Avanza el offset de bytes y el número de línea sobre text[start:end]."""
+        segment = text[start:end]
+        self._offset += len(segment) if segment.isascii() else len(segment.encode(self.encoding))
+        self._line += segment.count('\n')
+
+    def _line_start(self, text: str, pos: int, end: int) -> Optional[bool]:
+        """
+        Procesa una línea fuera de sentencia, de comando SQL*Plus o de cabecera CREATE.
+
+        Returns:
+            None si empieza una sentencia SQL o PL/SQL cuyo final se buscará
+            desde esta misma línea; si no, la línea queda consumida y el
+            resultado indica si termina la sentencia en curso
+        """
+        line = text[pos:end].rstrip('\r')
+        stripped = line.strip()
+        current = self._current
+
+        if current is not None:
+            if current[2] == SQLPLUS:
+                return not stripped.endswith('-')
+            # Cabecera CREATE partida en varias líneas
+            self._retype(stripped)
+            self._state = _scan(text, pos, end + 1, self._state)
+            return (self._current[2] == SQL and self._state is None
+                    and (stripped == '/' or stripped.endswith(';')))
+
+        if self._comment:
+            close = stripped.find('*/')
+            if close < 0:
+                return False
+            self._comment = False
+            stripped = stripped[close + 2:].strip()
+        elif stripped.startswith('/*'):
+            close = stripped.find('*/', 2)
+            if close < 0:
+                self._comment = True
+                return False
+            stripped = stripped[close + 2:].strip()
+        if not stripped or stripped == '/' or stripped.startswith('--'):
+            return False
+        return self._begin(line, stripped)
+
+    def _begin(self, line: str, stripped: str) -> Optional[bool]:
+        """Inicia una sentencia en la línea actual (stripped, sin comentarios iniciales)."""
+        match = _FIRST_WORD.match(stripped)
+        keyword = match.group(0).upper() if match else stripped[:1]
+        if keyword in ('REM', 'REMARK'):
+            return False
+
+        start = self._offset
+        line_number = self._line + 1
+        if stripped[0] in '@!' or (keyword in _SQLPLUS_COMMANDS and not self._is_sql_set(keyword, stripped)):
+            self._current = (start, line_number, SQLPLUS, keyword)
+            return not stripped.endswith('-')
+
+        if _PLSQL_START.match(stripped):
+            self._current = (start, line_number, PLSQL, keyword)
+            return None
+
+        self._current = (start, line_number, SQL, keyword)
+        self._state = None
+        if keyword == 'CREATE' and _CREATE_HEAD.match(stripped):
+            self._head = stripped
+            return False
+        return None
+
+    @staticmethod
+    def _is_sql_set(keyword: str, stripped: str) -> bool:
+        if keyword != 'SET':
+            return False
+        words = stripped.split(None, 2)
+        return len(words) > 1 and words[1].upper().rstrip(';') in _SQL_SET
+
+    def _retype(self, stripped: str) -> None:
+        """Cabecera CREATE partida en varias líneas: decide si es un bloque PL/SQL."""
+        head = f"{self._head} {stripped}"
+        if _PLSQL_START.match(head):
+            start, line, _, keyword = self._current
+            self._current = (start, line, PLSQL, keyword)
+            self._head = ''
+        elif _CREATE_HEAD.match(head):
+            self._head = head
+        else:
+            self._head = ''
+
+    def _close(self) -> None:
+        start, line, kind, keyword = self._current
+        self.starts.append(start)
+        self.ends.append(self._offset)
+        self.lines.append(line)
+        self.end_lines.append(self._line)
+        self.kinds.append(kind)
+        self.keywords.append(keyword)
+        self._current = None
+        self._head = ''
+        self._state = None
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Índice serializable, por columnas."""
+        return {
+            'version': STATEMENT_INDEX_VERSION,
+            'encoding': self.encoding,
+            'bytes': self._offset,
+            'lines': self._line,
+            'statements': {
+                'start': self.starts,
+                'end': self.ends,
+                'line': self.lines,
+                'end_line': self.end_lines,
+                'kind': self.kinds,
+                'keyword': self.keywords,
+            },
+        }
+
+    def to_json(self) -> str:
+        """Índice en JSON compacto."""
+        return json.dumps(self.to_dict(), separators=(',', ':')) + '\n'
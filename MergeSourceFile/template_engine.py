@@ -29,9 +29,18 @@ Incluye registro central de extensiones y gestor unificado.
 
 import importlib
 import logging
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Any, Tuple, Optional, Callable
-from jinja2 import Environment, BaseLoader, FileSystemLoader, StrictUndefined, TemplateError
+from typing import Dict, List, Any, Tuple, Optional, Callable, Iterable, Iterator, Mapping, Union
+from jinja2 import Environment, BaseLoader, FileSystemLoader, StrictUndefined, TemplateError, Template, meta
+
+from . import extension_index, metrics, profiling
+from .extension_cache import get_cache
+from .fs import Dependencies, DependencyLoader, SourceFSLoader, open_source_fs
+from .pipeline import DEFAULT_QUEUE_SIZE, threaded
+from .sourcemap import OriginEnvironment, SourceMapBuilder
+from .splice import SpliceRef, iter_splices, resolve_text
+from .variables import generate, render, with_layer
 
 logger = logging.getLogger(__name__)
 
@@ -42,11 +51,21 @@ logger = logging.getLogger(__name__)
 # 1. Añadir entrada en EXTENSION_REGISTRY
 # 2. Implementar el módulo correspondiente
 # 3. Agregar configuración en TOML si es necesario
+#
+# Las extensiones de otros paquetes no se registran aquí: se declaran como
+# entry points del grupo 'mergesourcefile.extensions' (ver extension_index).
+#
+# "function" recibe el contenido completo (str) y devuelve el resultado
+# completo. Opcionalmente, "stream_function" implementa el contrato en
+# streaming: un generador que recibe los fragmentos del contenido, una línea
+# por fragmento, emite los del resultado del mismo modo y retorna las
+# variables extraídas (ver ExtensionManager.process_stream).
 
 EXTENSION_REGISTRY: Dict[str, Dict[str, Any]] = {
     "sqlplus": {
         "module": "MergeSourceFile.extensions.sqlplus",
         "function": "process_sqlplus",
+        "stream_function": "stream_sqlplus",
         "priority": 10,
         "namespace": "sql",  # Variables disponibles como sql_variable
         "description": "SQLPlus compatibility extension (@includes, DEFINE variables)"
@@ -82,6 +101,10 @@ class ExtensionManager:
     Gestor centralizado de extensiones.
     
     Carga extensiones desde el registro central y las ejecuta en orden de prioridad.
+    
+    Tras __init__ su estado (extensiones, configuración, handlers y fábricas de
+    loader) es de solo lectura: process_content y get_custom_loader pueden
+    llamarse desde varios hilos a la vez.
     """
     
     def __init__(self, jinja_config: Dict[str, Any]):
@@ -93,8 +116,27 @@ class ExtensionManager:
         """
         self.jinja_config = jinja_config
         self.loaded_extensions: List[Dict[str, Any]] = []
+        # Caché de resultados por huella de la entrada (ver extension_cache)
+        self.result_cache = None
+        if jinja_config.get('extension_cache', False):
+            self.result_cache = get_cache(jinja_config.get('extension_cache_dir') or None)
         self._load_enabled_extensions()
     
+    def _shared_settings(self) -> Dict[str, Any]:
+        """
+        Ajustes de [jinja2] que se propagan a la configuración de cada extensión.
+        
+        - template_markers: delimitadores de inicio de Jinja2 configurados
+        - variable_delimiters: delimitadores de variable (inicio, fin)
+        - source_bundle: paquete .zip del que leer las fuentes, si lo hay
+        """
+        variable_start = self.jinja_config.get('variable_start_string', '{{')
+        return {
+            'template_markers': (variable_start, '{%', '{#'),
+            'variable_delimiters': (variable_start, self.jinja_config.get('variable_end_string', '}}')),
+            'source_bundle': self.jinja_config.get('source_bundle'),
+        }
+    
     def _load_enabled_extensions(self):
         """Carga las extensiones habilitadas desde la configuración."""
         extensions = self.jinja_config.get('extensions', [])
@@ -103,17 +145,25 @@ class ExtensionManager:
             logger.debug("No hay extensiones habilitadas")
             return
         
-        # Cargar y validar cada extensión directamente
+        # Cargar y validar cada extensión directamente; solo se importan las habilitadas
         for ext_name in extensions:
-            if ext_name not in EXTENSION_REGISTRY:
-                available = ", ".join(EXTENSION_REGISTRY.keys())
+            if ext_name not in EXTENSION_REGISTRY and ext_name not in extension_index.discover():
+                available = ", ".join(sorted({*EXTENSION_REGISTRY, *extension_index.discover()}))
                 logger.error(f"Extensión '{ext_name}' no está registrada. Extensiones disponibles: {available}")
                 raise ValueError(f"Extensión no registrada: {ext_name}")
             
             try:
-                ext_info = EXTENSION_REGISTRY[ext_name].copy()
+                if ext_name in EXTENSION_REGISTRY:
+                    ext_info = EXTENSION_REGISTRY[ext_name].copy()
+                else:
+                    # Extensión externa (entry point): importa su módulo
+                    ext_info = extension_index.load_extension(ext_name)
                 ext_info['name'] = ext_name
-                ext_info['config'] = self.jinja_config.get(ext_name, {})
+                ext_info['config'] = dict(self.jinja_config.get(ext_name, {}))
+                # Ajustes globales del motor que las extensiones necesitan conocer
+                for key, value in self._shared_settings().items():
+                    ext_info['config'].setdefault(key, value)
+                ext_info['config'].setdefault('variable_namespace', ext_info.get('namespace', ext_name))
                 
                 # Importar función de procesamiento directamente
                 module = importlib.import_module(ext_info['module'])
@@ -121,6 +171,13 @@ class ExtensionManager:
                     logger.error(f"Función '{ext_info['function']}' no encontrada en módulo '{ext_info['module']}'")
                     raise ImportError(f"Función no encontrada: {ext_info['function']}")
                 ext_info['handler'] = getattr(module, ext_info['function'])
+                ext_info['stream_handler'] = (
+                    getattr(module, ext_info['stream_function']) if 'stream_function' in ext_info else None
+                )
+                # Fábrica de loader opcional (get_<extensión>_loader), resuelta una sola vez
+                ext_info['loader_factory'] = getattr(module, f"get_{ext_name}_loader", None)
+                # Etapas opcionales para el modo pipeline (get_<extensión>_pipeline)
+                ext_info['pipeline_factory'] = getattr(module, f"get_{ext_name}_pipeline", None)
                 
                 self.loaded_extensions.append(ext_info)
                 logger.debug(f"Extensión '{ext_name}' cargada desde {ext_info['module']}")
@@ -139,21 +196,30 @@ class ExtensionManager:
 
     
     def process_content(self, content: str, input_file: str, base_path: str, 
-                       variables: Dict[str, Any], verbose: bool = False) -> Tuple[str, Dict[str, Any]]:
+                       variables: Mapping[str, Any], verbose: bool = False,
+                       track_origins: bool = False) -> Tuple:
         """
         Procesa contenido a través de todas las extensiones cargadas.
         
+        Con track_origins=True cada extensión recibe track_line_origins=True en
+        su configuración y puede devolver un tercer elemento con el origen
+        (archivo, línea) de cada línea de su resultado. Si una extensión no lo
+        devuelve, el origen de las líneas pasa a ser desconocido (None).
+        
         Args:
             content: Contenido a procesar
             input_file: Archivo de entrada
             base_path: Ruta base
             variables: Variables Jinja2 originales
             verbose: Modo verbose
+            track_origins: Seguir el origen de las líneas
             
         Returns:
-            Tuple[contenido_procesado, variables_extraídas_con_namespace]
+            Tuple[contenido_procesado, variables_extraídas_con_namespace], más
+            la lista de orígenes (o None) si track_origins=True
         """
         extracted_variables = {}
+        origins = None
         
         for ext_info in self.loaded_extensions:
             ext_name = ext_info['name']
@@ -161,16 +227,19 @@ class ExtensionManager:
             
             try:
                 # Ejecutar extensión
-                result = ext_info['handler'](
-                    content=content,
-                    input_file=input_file,
-                    base_path=base_path,
-                    config=ext_info['config'],
-                    verbose=verbose
-                )
+                ext_config = ext_info['config']
+                if track_origins:
+                    ext_config = dict(ext_config, track_line_origins=True)
+                with metrics.stage(f"extension:{ext_name}"):
+                    result = self._call_handler(ext_info, ext_config, content, input_file, base_path, verbose)
                 
                 # Procesar resultado (simplificado)
-                if isinstance(result, tuple) and len(result) == 2:
+                origins = None
+                if isinstance(result, tuple) and len(result) == 3:
+                    content, ext_vars, origins = result
+                    namespaced_vars = self._apply_namespace_to_variables(ext_vars, ext_info, variables)
+                    extracted_variables.update(namespaced_vars)
+                elif isinstance(result, tuple) and len(result) == 2:
                     content, ext_vars = result
                     namespaced_vars = self._apply_namespace_to_variables(ext_vars, ext_info, variables)
                     extracted_variables.update(namespaced_vars)
@@ -184,10 +253,174 @@ class ExtensionManager:
                 if verbose:
                     raise
         
+        if track_origins:
+            return content, extracted_variables, origins
         return content, extracted_variables
     
+    def process_stream(self, chunks: Iterable[str], input_file: str, base_path: str,
+                       variables: Mapping[str, Any], verbose: bool = False,
+                       track_origins: bool = False,
+                       dependencies: Optional[Dependencies] = None) -> 'ExtensionStream':
+        """
+        Procesa contenido en streaming a través de todas las extensiones cargadas.
+        
+        El contenido viaja como fragmentos de una línea (con su salto de línea,
+        salvo quizá la última) y las extensiones se encadenan de forma perezosa:
+        cada una consume los fragmentos de la anterior a medida que los emite.
+        Las extensiones con stream_function no construyen el documento; las que
+        solo tienen function se adaptan reuniendo su entrada en una cadena y
+        emitiendo su resultado por líneas, de modo que cada una retiene como
+        mucho una copia completa.
+        
+        Un handler en streaming es un generador con los argumentos de
+        process_content, salvo que recibe chunks en lugar de content. Su valor
+        de retorno son las variables extraídas (o None), o con
+        track_line_origins=True, Tuple[variables, orígenes].
+        
+        Los errores siguen la política de process_content: con verbose se
+        propagan; sin verbose se registran y la extensión que falla deja su
+        entrada sin procesar. Para poder hacerlo, sin verbose cada extensión
+        en streaming retiene la entrada que consume y su salida hasta
+        terminar, y la cadena solo es perezosa entre extensiones con verbose.
+        
+        Args:
+            chunks: Contenido a procesar, por líneas
+            input_file: Archivo de entrada
+            base_path: Ruta base
+            variables: Variables Jinja2 originales
+            verbose: Modo verbose
+            track_origins: Seguir el origen de las líneas
+            dependencies: Si se indica, las extensiones anotan en él los
+                archivos que leen (config['dependencies'])
+            
+        Returns:
+            ExtensionStream; sus variables y orígenes están completos cuando
+            se agota
+        """
+        stream = ExtensionStream()
+        for ext_info in self.loaded_extensions:
+            chunks = self._stream_extension(ext_info, chunks, stream, input_file, base_path,
+                                            variables, verbose, track_origins, dependencies)
+        stream.chunks = iter(chunks)
+        return stream
+    
+    def _stream_extension(self, ext_info: Dict[str, Any], chunks: Iterable[str], stream: 'ExtensionStream',
+                          input_file: str, base_path: str, variables: Mapping[str, Any],
+                          verbose: bool, track_origins: bool,
+                          dependencies: Optional[Dependencies] = None) -> Iterator[str]:
+        """Ejecuta una extensión como etapa de process_stream."""
+        ext_name = ext_info['name']
+        logger.info(f"Aplicando extensión: {ext_name}")
+        ext_config = ext_info['config']
+        if track_origins:
+            ext_config = dict(ext_config, track_line_origins=True)
+        
+        if ext_info.get('stream_handler') is None or self.result_cache is not None:
+            # Adaptador para handlers de cadena completa (y extensiones con
+            # caché, cuya huella necesita la entrada completa)
+            content = _join_chunks(chunks)
+            try:
+                with metrics.stage(f"extension:{ext_name}"):
+                    result = self._call_handler(ext_info, ext_config, content, input_file, base_path,
+                                                verbose, dependencies)
+            except Exception as e:
+                logger.error(f"Error ejecutando extensión '{ext_name}': {e}")
+                if verbose:
+                    raise
+                result = content
+            if isinstance(result, tuple):
+                content, *result = result
+            else:
+                content, result = result, None
+            yield from _iter_text_lines(content)
+            del content
+        else:
+            if dependencies is not None:
+                ext_config = dict(ext_config, dependencies=dependencies)
+            source = iter(chunks)
+            consumed = []
+            if not verbose:
+                # Conservar la entrada consumida para poder emitirla sin procesar
+                chunks = _iter_recorded(source, consumed)
+            handler = metrics.timed(f"extension:{ext_name}", ext_info['stream_handler'](
+                chunks,
+                input_file=input_file,
+                base_path=base_path,
+                config=ext_config,
+                verbose=verbose
+            ))
+            try:
+                if verbose:
+                    result = yield from handler
+                else:
+                    output = []
+                    result = _drain(handler, output)
+            except Exception as e:
+                logger.error(f"Error ejecutando extensión '{ext_name}': {e}")
+                if verbose:
+                    raise
+                # Como en process_content: seguir con la entrada sin procesar
+                output, result = chain(consumed, source), None
+            del consumed
+            if not verbose:
+                yield from output
+                del output
+            if isinstance(result, tuple):
+                result = list(result)
+            elif result is not None:
+                result = [result]
+        
+        # result: [variables] o [variables, orígenes], como en process_content
+        ext_vars = result[0] if result else None
+        stream.origins = result[1] if result and len(result) > 1 else None
+        stream.variables.update(self._apply_namespace_to_variables(ext_vars, ext_info, variables))
+        logger.debug(f"Extensión '{ext_name}' completada")
+    
+    def _call_handler(self, ext_info: Dict[str, Any], ext_config: Dict[str, Any], content: str,
+                      input_file: str, base_path: str, verbose: bool,
+                      dependencies: Optional[Dependencies] = None) -> Any:
+        """
+        Ejecuta el handler de cadena completa, o reutiliza su resultado de la caché.
+        
+        Sin caché solo llama al handler (con dependencies, si se indica, en
+        config['dependencies']). Con caché, la extensión recibe en
+        config['dependencies'] un fs.Dependencies donde anotar los archivos
+        que lee, y el resultado se guarda junto con ellos; dependencies
+        recibe los de la ejecución o los guardados en la caché.
+        """
+        cache = self.result_cache
+        if cache is None:
+            if dependencies is not None:
+                ext_config = dict(ext_config, dependencies=dependencies)
+            return ext_info['handler'](
+                content=content,
+                input_file=input_file,
+                base_path=base_path,
+                config=ext_config,
+                verbose=verbose
+            )
+        
+        key = cache.key(ext_info['name'], ext_config, input_file, base_path, content)
+        result = cache.get(key, ext_config, dependencies)
+        if result is not None:
+            logger.info(f"Resultado de la extensión '{ext_info['name']}' reutilizado de la caché")
+            return result
+        
+        read = Dependencies()
+        result = ext_info['handler'](
+            content=content,
+            input_file=input_file,
+            base_path=base_path,
+            config=dict(ext_config, dependencies=read),
+            verbose=verbose
+        )
+        cache.put(key, result, read, ext_config)
+        if dependencies is not None:
+            dependencies.update(read)
+        return result
+    
     def _apply_namespace_to_variables(self, ext_vars: Dict[str, Any], ext_info: Dict[str, Any], 
-                                    variables: Dict[str, Any]) -> Dict[str, Any]:
+                                    variables: Mapping[str, Any]) -> Dict[str, Any]:
         """Aplica namespace a variables extraídas por extensiones."""
         if not ext_vars:
             return {}
@@ -209,12 +442,17 @@ class ExtensionManager:
         
         return namespaced_vars
     
-    def get_custom_loader(self) -> Optional[BaseLoader]:
+    def get_custom_loader(self, track_origins: bool = False,
+                          dependencies: Optional[Dependencies] = None) -> Optional[BaseLoader]:
         """
         Obtiene loader personalizado de extensiones.
         
-        Busca función get_EXTENSION_loader en cada extensión cargada.
-        Retorna el primer loader encontrado.
+        Usa la función get_EXTENSION_loader de cada extensión cargada
+        (resuelta al cargarla). Retorna el primer loader encontrado.
+        
+        Args:
+            track_origins: Seguir el origen de las líneas (ver process_content)
+            dependencies: Dónde anotar los archivos que lea el loader (ver process_stream)
         
         Returns:
             Loader personalizado o None
@@ -222,40 +460,163 @@ class ExtensionManager:
         for ext_info in self.loaded_extensions:
             ext_name = ext_info['name']
             
+            loader_func = ext_info.get('loader_factory')
+            if loader_func is None:
+                continue
+            
             try:
-                # Buscar función get_{extension}_loader
-                module = importlib.import_module(ext_info['module'])
-                loader_func_name = f"get_{ext_name}_loader"
+                ext_config = ext_info['config']
+                if track_origins:
+                    ext_config = dict(ext_config, track_line_origins=True)
+                if dependencies is not None:
+                    ext_config = dict(ext_config, dependencies=dependencies)
+                loader = loader_func(ext_config)
                 
-                if hasattr(module, loader_func_name):
-                    loader_func = getattr(module, loader_func_name)
-                    loader = loader_func(ext_info['config'])
+                if loader:
+                    logger.info(f"Usando loader personalizado de extensión '{ext_name}'")
+                    return loader
                     
-                    if loader:
-                        logger.info(f"Usando loader personalizado de extensión '{ext_name}'")
-                        return loader
-                        
             except Exception as e:
                 logger.debug(f"No se pudo obtener loader de extensión '{ext_name}': {e}")
                 
         return None
     
+    def get_pipeline(self, track_origins: bool = False,
+                     dependencies: Optional[Dependencies] = None) -> Optional[Tuple[Dict[str, Any], Any]]:
+        """
+        Obtiene las etapas de la extensión para el modo pipeline.
+        
+        Solo hay etapas si hay exactamente una extensión cargada, esta define
+        get_EXTENSION_pipeline y la caché de resultados no está activa. Las etapas son un objeto con read(input_file,
+        base_path), que emite líneas; preprocess(lines), que emite el texto
+        pre-procesado; y los atributos variables y origins, completos cuando
+        preprocess() se agota.
+        
+        Args:
+            track_origins: Seguir el origen de las líneas (ver process_content)
+            dependencies: Dónde anotar los archivos que lean las etapas (ver process_stream)
+        
+        Returns:
+            Tuple[ext_info, etapas] o None
+        """
+        if len(self.loaded_extensions) != 1 or self.result_cache is not None:
+            return None
+        ext_info = self.loaded_extensions[0]
+        pipeline_func = ext_info.get('pipeline_factory')
+        if pipeline_func is None:
+            return None
+        ext_config = ext_info['config']
+        if track_origins:
+            ext_config = dict(ext_config, track_line_origins=True)
+        if dependencies is not None:
+            ext_config = dict(ext_config, dependencies=dependencies)
+        stages = pipeline_func(ext_config)
+        if stages is None:
+            return None
+        return ext_info, stages
+    
+    def splices_inert_files(self, track_origins: bool = False) -> bool:
+        """
+        Indica si las extensiones sustituyen archivos inertes por marcas de empalme.
+        
+        Al seguir el origen de las líneas no se empalma (ver MergeSourceFile.splice).
+        """
+        if track_origins:
+            return False
+        return any(ext['config'].get('splice_inert_files', False) for ext in self.loaded_extensions)
+    
     @property
     def has_extensions(self) -> bool:
         """Verifica si hay extensiones cargadas."""
         return bool(self.loaded_extensions)
 
 
+class ExtensionStream:
+    """
+    Resultado de ExtensionManager.process_stream.
+    
+    Iterarlo emite los fragmentos del contenido procesado. variables (con
+    namespace) y origins se completan cuando la iteración termina.
+    """
+    
+    def __init__(self) -> None:
+        self.chunks: Iterator[str] = iter(())
+        self.variables: Dict[str, Any] = {}
+        self.origins: Optional[List] = None
+    
+    def __iter__(self) -> Iterator[str]:
+        return self.chunks
+
+
+def _join_chunks(chunks: Iterable[str]) -> str:
+    """Concatena fragmentos en un único texto, contando cada uno en string_concats."""
+    # ''.join() construye la lista igualmente: materializarla antes no cuesta más
+    pieces = chunks if isinstance(chunks, list) else list(chunks)
+    metrics.count('string_concats', len(pieces))
+    return ''.join(pieces)
+
+
+def _iter_recorded(chunks: Iterator[str], into: List[str]) -> Iterator[str]:
+    """Emite chunks añadiendo a into cada fragmento emitido."""
+    for chunk in chunks:
+        into.append(chunk)
+        yield chunk
+
+
+def _drain(generator: Iterator[str], into: List[str]) -> Any:
+    """Agota generator guardando sus fragmentos en into y devuelve su valor de retorno."""
+    while True:
+        try:
+            into.append(next(generator))
+        except StopIteration as stop:
+            return stop.value
+
+
+def _iter_text_lines(text: str) -> Iterator[str]:
+    """Emite text en fragmentos de una línea (con su salto) sin copiarlo entero."""
+    start = 0
+    find = text.find
+    while True:
+        end = find('\n', start) + 1
+        if not end:
+            if start < len(text):
+                yield text[start:]
+            return
+        yield text[start:end]
+        start = end
+
+
 # ============================================================================
 # MOTOR DE PLANTILLAS
 # ============================================================================
 
 
+class _CountingEnvironment(Environment):
+    """Entorno Jinja2 que cuenta cada compilación (plantilla principal e includes)."""
+    
+    def _compile(self, source: str, filename: str):
+        metrics.count('jinja_compiles')
+        return super()._compile(source, filename)
+
+
+class _CountingOriginEnvironment(_CountingEnvironment, OriginEnvironment):
+    """_CountingEnvironment que además mapea el texto literal a su línea."""
+
+
 class TemplateEngine:
     """
     Motor de plantillas Jinja2 con soporte para extensiones.
     
     Las extensiones se ejecutan ANTES de Jinja2 para pre-procesar el contenido.
+    
+    Una instancia puede compartirse entre hilos (también en builds de Python
+    sin GIL): process_file y process_file_stream no modifican la instancia.
+    Cada llamada crea su propio entorno Jinja2, loader y estado de inclusiones,
+    y las cachés compartidas (listados de directorio, paquetes .zip abiertos,
+    clasificación de archivos inertes) se protegen con locks. Las variables
+    recibidas no se modifican. El perfil de renderizado (--profile render)
+    se activa por hilo (ver profiling.render_profiling): los renderizados de
+    otros hilos no se miden ni alteran sus contadores.
     """
     
     def __init__(self, config: Dict[str, Any]) -> None:
@@ -268,10 +629,15 @@ class TemplateEngine:
         self.config = config
         self.jinja_config = config.get('jinja2', {})
         
+        # Fuente de archivos (disco local o paquete .zip)
+        self.source_fs = open_source_fs(self.jinja_config.get('source_bundle'))
+        
         # Configurar gestor de extensiones
         self.extension_manager = ExtensionManager(self.jinja_config)
     
-    def process_file(self, input_file: str, variables: Dict[str, Any]) -> str:
+    def process_file(self, input_file: str, variables: Mapping[str, Any],
+                     source_map: Optional[SourceMapBuilder] = None,
+                     dependencies: Optional[Dependencies] = None) -> str:
         """
         Procesa un archivo con Jinja2 y extensiones.
         
@@ -283,40 +649,237 @@ class TemplateEngine:
         Args:
             input_file: Archivo de entrada
             variables: Variables para la plantilla
+            source_map: Si se indica, recibe el origen de cada línea de la salida
+            dependencies: Si se indica, recibe los archivos leídos y las
+                variables que la plantilla referencia (ver MergeSourceFile.incremental)
         
         Returns:
             Contenido procesado
         """
+        template, all_variables = self._prepare_template(input_file, variables, source_map, dependencies)
+        
+        logger.info("Procesando plantilla Jinja2")
+        render_profiler = profiling.active_render_profiler()
+        if render_profiler is not None or source_map is not None:
+            chunks = self._generate(template, all_variables, source_map)
+            if render_profiler is not None:
+                chunks = render_profiler.profile(chunks)
+            rendered_content = _join_chunks(chunks)
+        else:
+            try:
+                with metrics.stage('jinja2_render'):
+                    rendered_content = render(template, all_variables)
+            except TemplateError as e:
+                raise Exception(f"Error procesando plantilla Jinja2: {str(e)}")
+        
+        # Expandir archivos inertes empalmados por las extensiones
+        track_origins = render_profiler is not None or source_map is not None
+        if self.extension_manager.splices_inert_files(track_origins) and '\x00' in rendered_content:
+            rendered_content = ''.join(resolve_text([rendered_content]))
+        
+        logger.info(f"Procesamiento completado ({len(rendered_content)} caracteres)")
+        return rendered_content
+    
+    def process_file_stream(self, input_file: str, variables: Mapping[str, Any],
+                            source_map: Optional[SourceMapBuilder] = None,
+                            dependencies: Optional[Dependencies] = None) -> Iterator[Union[str, SpliceRef]]:
+        """
+        Procesa un archivo generando la salida por fragmentos.
+        
+        Igual que process_file, pero el renderizado Jinja2 se hace con
+        Template.generate() y los archivos inertes empalmados se emiten como
+        SpliceRef, de modo que el escritor puede copiar sus bytes directamente.
+        Las extensiones se aplican antes de devolver el iterador.
+        
+        Args:
+            input_file: Archivo de entrada
+            variables: Variables para la plantilla
+            source_map: Si se indica, recibe el origen de cada línea de la
+                salida a medida que se consumen los fragmentos
+            dependencies: Como en process_file; completo al agotar el iterador
+        
+        Returns:
+            Iterador de fragmentos de texto y SpliceRef
+        """
+        template, all_variables = self._prepare_template(input_file, variables, source_map, dependencies)
+        logger.info("Procesando plantilla Jinja2 (salida en streaming)")
+        chunks = self._generate(template, all_variables, source_map)
+        render_profiler = profiling.active_render_profiler()
+        if render_profiler is not None:
+            chunks = render_profiler.profile(chunks)
+        track_origins = render_profiler is not None or source_map is not None
+        if not self.extension_manager.splices_inert_files(track_origins):
+            return chunks
+        return iter_splices(chunks)
+    
+    def process_file_pipeline(self, input_file: str, variables: Mapping[str, Any],
+                              source_map: Optional[SourceMapBuilder] = None,
+                              queue_size: int = DEFAULT_QUEUE_SIZE,
+                              dependencies: Optional[Dependencies] = None) -> Iterator[Union[str, SpliceRef]]:
+        """
+        Procesa un archivo con las etapas encadenadas en hilos (modo pipeline).
+        
+        Lectura (E/S de las inclusiones), pre-procesamiento de la extensión y
+        renderizado Jinja2 se ejecutan cada uno en su hilo, comunicados por
+        colas acotadas (ver MergeSourceFile.pipeline); la escritura es el
+        consumidor del iterador devuelto. Jinja2 necesita la plantilla completa
+        para compilarla, así que el renderizado empieza cuando termina el
+        pre-procesamiento, pero la lectura y el pre-procesamiento se solapan
+        entre sí y el renderizado con la escritura.
+        
+        Requiere una única extensión con etapas de pipeline (ver
+        ExtensionManager.get_pipeline); si no la hay, o con el perfil de
+        renderizado activo, equivale a process_file_stream. A diferencia de
+        process_file, un error de la extensión siempre se propaga.
+        
+        Args:
+            input_file: Archivo de entrada
+            variables: Variables para la plantilla
+            source_map: Si se indica, recibe el origen de cada línea de la salida
+            queue_size: Lotes que cada etapa puede adelantar a la siguiente
+            dependencies: Como en process_file; completo al agotar el iterador
+        
+        Returns:
+            Iterador de fragmentos de texto y SpliceRef
+        """
+        stages = None
+        if profiling.active_render_profiler() is None:
+            stages = self.extension_manager.get_pipeline(track_origins=source_map is not None,
+                                                         dependencies=dependencies)
+        if stages is None:
+            return self.process_file_stream(input_file, variables, source_map, dependencies)
+        
+        ext_info, pipeline = stages
+        input_path = Path(input_file)
+        if dependencies is not None:
+            dependencies.note_read(input_path)
+        logger.info(f"Aplicando extensión: {ext_info['name']} (pipeline)")
+        lines = threaded(pipeline.read(str(input_path), str(input_path.parent)), 'read', queue_size)
+        text = threaded(pipeline.preprocess(lines), 'preprocess', queue_size)
+        chunks = self._render_pipeline(text, input_path, variables, ext_info, pipeline, source_map, dependencies)
+        chunks = threaded(chunks, 'render', queue_size)
+        if not self.extension_manager.splices_inert_files(source_map is not None):
+            return chunks
+        return iter_splices(chunks)
+    
+    def _render_pipeline(self, text: Iterator[str], input_path: Path, variables: Mapping[str, Any],
+                         ext_info: Dict[str, Any], pipeline: Any,
+                         source_map: Optional[SourceMapBuilder],
+                         dependencies: Optional[Dependencies] = None) -> Iterator[str]:
+        """Etapa de renderizado: compila el texto pre-procesado completo y lo renderiza por fragmentos."""
+        try:
+            content = _join_chunks(text)
+        except Exception as e:
+            logger.error(f"Error ejecutando extensión '{ext_info['name']}': {e}")
+            raise
+        
+        extracted_variables = self.extension_manager._apply_namespace_to_variables(
+            pipeline.variables, ext_info, variables
+        )
+        template, all_variables = self._build_template(
+            content, input_path, variables, extracted_variables, pipeline.origins, source_map,
+            dependencies=dependencies
+        )
+        logger.info("Procesando plantilla Jinja2 (pipeline)")
+        yield from self._generate(template, all_variables, source_map)
+    
+    @staticmethod
+    def _generate(template: Template, variables: Mapping[str, Any],
+                  source_map: Optional[SourceMapBuilder] = None) -> Iterator[str]:
+        """
+        Renderiza la plantilla por fragmentos, traduciendo errores de Jinja2.
+        
+        Con métricas activas solo se mide el tiempo de producir cada
+        fragmento, no el del consumidor que lo escribe.
+        """
+        try:
+            chunks = generate(template, variables)
+            if source_map is not None:
+                chunks = source_map.track(chunks)
+            yield from metrics.timed('jinja2_render', chunks)
+        except TemplateError as e:
+            raise Exception(f"Error procesando plantilla Jinja2: {str(e)}")
+    
+    def _prepare_template(self, input_file: str, variables: Mapping[str, Any],
+                          source_map: Optional[SourceMapBuilder] = None,
+                          dependencies: Optional[Dependencies] = None) -> Tuple[Template, Mapping[str, Any]]:
+        """
+        Lee el archivo, aplica las extensiones y compila la plantilla.
+        
+        Con el perfil de renderizado activo o un mapa de origen, la plantilla
+        se registra junto con el origen de cada una de sus líneas.
+        
+        Returns:
+            Tuple[plantilla_compilada, variables_combinadas]
+        """
         input_path = Path(input_file)
+        render_profiler = profiling.active_render_profiler()
+        track_origins = render_profiler is not None or source_map is not None
+        if dependencies is not None:
+            dependencies.note_read(input_path)
         
-        # 1. Leer contenido inicial
-        content = input_path.read_text(encoding='utf-8')
-        logger.debug(f"Archivo leído: {input_file} ({len(content)} caracteres)")
+        if not self.extension_manager.has_extensions:
+            content = self._read_source(input_path, dependencies)
+            return self._build_template(content, input_path, variables, {}, None, source_map,
+                                        render_profiler, dependencies)
         
-        # 2. Aplicar extensiones (pre-procesamiento)
-        content, extracted_variables = self.extension_manager.process_content(
-            content=content,
+        # 1-2. Leer el contenido inicial (solo si alguna extensión lo consume)
+        #      y aplicar las extensiones en streaming (pre-procesamiento)
+        stream = self.extension_manager.process_stream(
+            chunks=self._iter_source(input_path, dependencies),
             input_file=str(input_path),
             base_path=str(input_path.parent),
             variables=variables,
-            verbose=self.config.get('project', {}).get('verbose', False)
+            verbose=self.config.get('project', {}).get('verbose', False),
+            track_origins=track_origins,
+            dependencies=dependencies
         )
+        content = _join_chunks(stream)
+        return self._build_template(content, input_path, variables, stream.variables,
+                                    stream.origins, source_map, render_profiler, dependencies)
+    
+    def _read_source(self, input_path: Path, dependencies: Optional[Dependencies] = None) -> str:
+        """Lee el archivo de entrada (anotando en dependencies el hash de lo leído)."""
+        content = self.source_fs.read_text(input_path, dependencies)
+        logger.debug(f"Archivo leído: {input_path} ({len(content)} caracteres)")
+        if metrics.enabled():
+            metrics.count('files_read')
+            metrics.count('bytes_in', len(content.encode('utf-8')))
+        return content
+    
+    def _iter_source(self, input_path: Path, dependencies: Optional[Dependencies] = None) -> Iterator[str]:
+        """Lee el archivo de entrada al pedir el primer fragmento y lo emite por líneas."""
+        yield from _iter_text_lines(self._read_source(input_path, dependencies))
+    
+    def _build_template(self, content: str, input_path: Path, variables: Mapping[str, Any],
+                        extracted_variables: Dict[str, Any], origins: Optional[List],
+                        source_map: Optional[SourceMapBuilder] = None,
+                        render_profiler: Optional[Any] = None,
+                        dependencies: Optional[Dependencies] = None) -> Tuple[Template, Mapping[str, Any]]:
+        """
+        Combina las variables y compila el contenido pre-procesado.
         
-        # 3. Combinar variables extraídas con variables originales
-        all_variables = variables.copy()
-        all_variables.update(extracted_variables)
+        Returns:
+            Tuple[plantilla_compilada, variables_combinadas]
+        """
+        track_origins = render_profiler is not None or source_map is not None
+        
+        # 3. Las variables extraídas forman una capa sobre las originales (sin copiarlas)
+        all_variables = with_layer(variables, extracted_variables)
         
         if extracted_variables:
             logger.info(f"Variables SQLPlus extraídas con namespace sql_: {list(extracted_variables.keys())}")
         
-        # 4. Aplicar Jinja2 (procesamiento principal)
-        logger.info("Procesando plantilla Jinja2")
-        rendered_content = self._render_template(content, all_variables, str(input_path.parent))
-        
-        logger.info(f"Procesamiento completado ({len(rendered_content)} caracteres)")
-        return rendered_content
+        # 4. Compilar plantilla Jinja2
+        with metrics.stage('jinja2_compile'):
+            template = self._compile_template(content, str(input_path.parent), track_origins, dependencies)
+        if render_profiler is not None:
+            render_profiler.register(template, str(input_path), origins)
+        if source_map is not None:
+            source_map.origins.register(template, str(input_path), origins)
+        return template, all_variables
     
-    def _render_template(self, template_content: str, variables: Dict[str, Any], template_dir: str = None) -> str:
+    def _render_template(self, template_content: str, variables: Mapping[str, Any], template_dir: str = None) -> str:
         """
         Renderiza contenido con Jinja2.
         
@@ -328,6 +891,29 @@ class TemplateEngine:
         Returns:
             Contenido renderizado
         """
+        template = self._compile_template(template_content, template_dir)
+        try:
+            return render(template, variables)
+        except TemplateError as e:
+            raise Exception(f"Error procesando plantilla Jinja2: {str(e)}")
+    
+    def _compile_template(self, template_content: str, template_dir: str = None,
+                          track_origins: bool = False,
+                          dependencies: Optional[Dependencies] = None) -> Template:
+        """
+        Compila contenido como plantilla Jinja2.
+        
+        Args:
+            template_content: Contenido de la plantilla
+            template_dir: Directorio base para resolver includes
+            track_origins: Seguir el origen de las líneas de las plantillas
+                que sirva el loader de las extensiones
+            dependencies: Si se indica, recibe las variables que la plantilla
+                referencia (jinja2.meta) y las plantillas que carga el loader
+        
+        Returns:
+            Plantilla compilada
+        """
         try:
             # Configurar entorno Jinja2
             env_kwargs = {
@@ -336,27 +922,37 @@ class TemplateEngine:
             }
             
             # Obtener loader personalizado de extensiones
-            custom_loader = self.extension_manager.get_custom_loader()
+            custom_loader = self.extension_manager.get_custom_loader(track_origins, dependencies)
             
             if custom_loader:
                 env_kwargs['loader'] = custom_loader
+            elif not self.source_fs.is_local or dependencies is not None:
+                # Includes de Jinja2 desde el paquete de fuentes, o anotando el
+                # hash de lo leído (FileSystemLoader no expone los bytes)
+                env_kwargs['loader'] = SourceFSLoader(self.source_fs, template_dir or '.', dependencies)
             else:
                 # Usar FileSystemLoader para permitir includes de Jinja2
                 template_dir_path = template_dir if template_dir else str(Path.cwd())
                 env_kwargs['loader'] = FileSystemLoader(str(template_dir_path))
             
+            if dependencies is not None:
+                env_kwargs['loader'] = DependencyLoader(env_kwargs['loader'], dependencies)
+            
             if self.jinja_config.get('strict_undefined', True):
                 env_kwargs['undefined'] = StrictUndefined
             
-            env = Environment(**env_kwargs)
+            env = (_CountingOriginEnvironment if track_origins else _CountingEnvironment)(**env_kwargs)
             
             # Agregar filtros personalizados
             env.filters['sql_escape'] = self._sql_escape_filter
             env.filters['strftime'] = self._strftime_filter
             
-            # Renderizar
-            template = env.from_string(template_content)
-            return template.render(**variables)
+            if dependencies is not None:
+                # Se analiza una sola vez: el árbol sirve también para compilar
+                ast = env.parse(template_content)
+                dependencies.variables.update(meta.find_undeclared_variables(ast))
+                return env.from_string(ast)
+            return env.from_string(template_content)
             
         except TemplateError as e:
             raise Exception(f"Error procesando plantilla Jinja2: {str(e)}")
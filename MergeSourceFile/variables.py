@@ -0,0 +1,163 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+Variables de plantilla por capas.
+
+Las variables de un renderizado se consultan en capas (ChainMap), de mayor
+a menor prioridad:
+
+- Variables extraídas por las extensiones, con su namespace (sql_var)
+- Asignaciones de la línea de comandos (msf --set clave=valor)
+- Variables de entorno con prefijo (MSF_VAR_clave=valor)
+- Archivos YAML de variables, el último de la lista primero
+
+Las capas base se cargan una vez y se comparten, de solo lectura, entre
+renderizados: cada renderizado añade su capa de extensión sin copiar las
+demás, y el contexto Jinja2 consulta la cadena directamente.
+"""
+
+import os
+import yaml
+from collections import ChainMap
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional
+
+from jinja2 import Template
+
+# Prefijo por defecto de las variables de entorno que sobrescriben variables
+DEFAULT_ENV_PREFIX = 'MSF_VAR_'
+
+
+class VariableScope(ChainMap):
+    """
+    Cadena de capas de variables; la primera capa tiene prioridad.
+    
+    Las escrituras van a la primera capa, como en ChainMap; las capas
+    compartidas no deben modificarse.
+    """
+
+
+def with_layer(variables: Mapping[str, Any], layer: Dict[str, Any]) -> Mapping[str, Any]:
+    """
+    Añade una capa por encima de variables sin copiar las existentes.
+    
+    Args:
+        variables: Variables base (un VariableScope o cualquier mapping)
+        layer: Capa con prioridad sobre las variables base
+    
+    Returns:
+        VariableScope con layer delante, o variables si layer está vacía
+    """
+    if not layer:
+        return variables
+    maps = variables.maps if isinstance(variables, ChainMap) else [variables]
+    return VariableScope(layer, *maps)
+
+
+def parse_value(text: str, typed: bool = False) -> Any:
+    """
+    Interpreta el valor de una asignación (msf --set o variable de entorno).
+    
+    El valor queda como texto salvo que su sintaxis pida otro tipo, de modo
+    que "1.10", "010", "no" o "2024-01-01" no cambian. Un valor que empieza
+    por '[' o '{' es una lista o un diccionario en YAML de flujo (JSON
+    incluido). Con typed=True (forma clave:=valor de --set) se interpreta
+    como YAML: "3" da 3 y "true" da True. Si no es YAML válido se usa el
+    texto tal cual.
+    """
+    if not typed and not text.lstrip().startswith(('[', '{')):
+        return text
+    try:
+        return yaml.safe_load(text)
+    except yaml.YAMLError:
+        return text
+
+
+def parse_assignments(items: Iterable[str]) -> Dict[str, Any]:
+    """
+    Convierte asignaciones "clave=valor" (msf --set) en un diccionario.
+    
+    "clave:=valor" interpreta el valor como YAML (ver parse_value).
+    
+    Raises:
+        ValueError: Si alguna asignación no tiene '=' o la clave está vacía
+    """
+    assignments = {}
+    for item in items:
+        key, sep, value = item.partition('=')
+        typed = key.endswith(':')
+        key = (key[:-1] if typed else key).strip()
+        if not sep or not key:
+            raise ValueError(f"Asignación inválida '{item}': se esperaba clave=valor")
+        assignments[key] = parse_value(value, typed)
+    return assignments
+
+
+def env_overrides(prefix: Optional[str] = DEFAULT_ENV_PREFIX,
+                  environ: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
+    """
+    Variables definidas en el entorno con el prefijo indicado.
+    
+    MSF_VAR_schema=APP define la variable schema. Un prefijo vacío o None
+    desactiva la capa.
+    """
+    if not prefix:
+        return {}
+    if environ is None:
+        environ = os.environ
+    return {
+        name[len(prefix):]: parse_value(value)
+        for name, value in environ.items()
+        if name.startswith(prefix) and len(name) > len(prefix)
+    }
+
+
+def template_context(template: Template, variables: Mapping[str, Any]):
+    """
+    Contexto de renderizado que consulta las capas de variables sin copiarlas.
+    
+    Template.render(**variables) vuelca todas las variables en un dict nuevo
+    (y Jinja2 otro más con los globales); aquí los globales de la plantilla
+    son la última capa de la cadena.
+    """
+    maps = variables.maps if isinstance(variables, ChainMap) else [variables]
+    return template.new_context(ChainMap(*maps, template.globals), shared=True)
+
+
+def render(template: Template, variables: Mapping[str, Any]) -> str:
+    """Como Template.render, con las variables en capas."""
+    context = template_context(template, variables)
+    try:
+        return template.environment.concat(template.root_render_func(context))
+    except Exception:
+        return template.environment.handle_exception()
+
+
+def generate(template: Template, variables: Mapping[str, Any]) -> Iterator[str]:
+    """Como Template.generate, con las variables en capas."""
+    context = template_context(template, variables)
+    try:
+        yield from template.root_render_func(context)
+    except Exception:
+        yield template.environment.handle_exception()
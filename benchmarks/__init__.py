@@ -0,0 +1,38 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Benchmarks de MergeSourceFile.
+
+Genera corpus sintéticos parametrizados (cadenas de inclusión profundas,
+abanicos anchos, diamantes, miles de DEFINE, líneas densas en &var y bucles
+Jinja2 grandes), mide process_sqlplus, TemplateEngine.process_file y
+core.main de extremo a extremo y guarda los resultados en JSON para
+compararlos entre versiones. benchmarks.opcounts comprueba además cotas
+deterministas del número de operaciones sobre corpus de referencia.
+
+Uso:
+    python -m benchmarks.run --output resultados.json
+    python -m benchmarks.compare base.json resultados.json
+    python -m benchmarks.opcounts
+"""
@@ -0,0 +1,105 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Comparación de dos archivos de resultados de benchmarks.
+
+Empareja las mediciones por (corpus, objetivo) y muestra la razón entre los
+tiempos mínimos (nuevo / base). Termina con código 1 si alguna medición es
+más lenta que la base por encima del umbral, para poder usarlo en CI.
+
+Uso:
+    python -m benchmarks.compare base.json nuevo.json [--threshold 1.10]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .run import RESULTS_FORMAT
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """Carga un archivo de resultados validando su formato."""
+    document = json.loads(Path(path).read_text(encoding='utf-8'))
+    if document.get('format') != RESULTS_FORMAT:
+        raise ValueError(f"Formato de resultados no soportado en {path}: {document.get('format')}")
+    return document
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Empareja las mediciones de dos documentos de resultados.
+    
+    Las mediciones con parámetros de corpus distintos (otra escala) o que
+    solo existen en uno de los documentos se omiten.
+    
+    Returns:
+        Lista de {'corpus', 'target', 'base', 'new', 'ratio'} con los tiempos mínimos
+    """
+    base_index: Dict[Tuple[str, str], Dict[str, Any]] = {
+        (result['corpus'], result['target']): result for result in base['results']
+    }
+    rows = []
+    for result in new['results']:
+        previous = base_index.get((result['corpus'], result['target']))
+        if previous is None or previous['params'] != result['params']:
+            continue
+        rows.append({
+            'corpus': result['corpus'],
+            'target': result['target'],
+            'base': previous['min'],
+            'new': result['min'],
+            'ratio': result['min'] / previous['min'] if previous['min'] else float('inf'),
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.compare',
+                                     description="Compara dos archivos de resultados de benchmarks.")
+    parser.add_argument('base', help="Resultados de referencia")
+    parser.add_argument('new', help="Resultados nuevos")
+    parser.add_argument('--threshold', type=float, default=1.10,
+                        help="Razón nuevo/base a partir de la cual se considera regresión (por defecto: 1.10)")
+    args = parser.parse_args(argv)
+    
+    base, new = load_results(args.base), load_results(args.new)
+    print(f"base: {base['version']} ({base.get('revision') or '-'})  "
+          f"nuevo: {new['version']} ({new.get('revision') or '-'})")
+    rows = compare(base, new)
+    regressions = 0
+    for row in rows:
+        regression = row['ratio'] > args.threshold
+        regressions += regression
+        print(f"{row['corpus']:<14} {row['target']:<16} {row['base'] * 1000:9.2f} ms -> "
+              f"{row['new'] * 1000:9.2f} ms  x{row['ratio']:.2f}{'  REGRESIÓN' if regression else ''}")
+    if not rows:
+        print("No hay mediciones comparables (¿distinta escala o corpus?)")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Generador de corpus sintéticos para los benchmarks.
+
+Cada generador escribe un proyecto completo en un directorio (archivo
+principal, inclusiones y archivo de variables) y devuelve un Corpus con lo
+necesario para procesarlo. Los tamaños son parámetros; generate() aplica
+además un factor de escala al parámetro de tamaño de cada corpus.
+
+Corpus disponibles:
+- deep_chain: cadena de inclusiones @@ de profundidad configurable
+- wide_fanout: un archivo principal que incluye cientos de hojas
+- diamond: capas en las que cada archivo incluye todos los de la siguiente
+- many_defines: miles de DEFINE, cada uno referenciado después
+- dense_vars: líneas con muchas referencias &var
+- jinja_loop: bucle Jinja2 grande con variables del archivo YAML
+"""
+
+import inspect
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple
+
+
+class Corpus(NamedTuple):
+    """Proyecto generado: archivo principal, archivo de variables y parámetros."""
+    name: str
+    main: Path
+    variables_file: Path
+    params: Dict[str, int]
+
+
+def _write(path: Path, lines: List[str]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # newline='\n': mismo contenido (y mismos contadores de bytes) en todas las plataformas
+    path.write_text("\n".join(lines) + "\n", encoding='utf-8', newline='\n')
+
+
+def _body(prefix: str, lines: int) -> List[str]:
+    """Sentencias de relleno, distintas entre archivos."""
+    return [f"INSERT INTO {prefix} (id, name) VALUES ({i}, '{prefix}_{i}');" for i in range(lines)]
+
+
+def _variables(root: Path, values: Dict[str, Any]) -> Path:
+    path = root / "vars.yaml"
+    _write(path, [f"{key}: {value}" for key, value in values.items()])
+    return path
+
+
+def deep_chain(root: Path, depth: int = 200, lines: int = 20) -> Corpus:
+    """Cadena chain_000 -> chain_001 -> ... de `depth` archivos."""
+    for level in range(depth):
+        body = [f"-- nivel {level}"] + _body(f"chain_{level}", lines)
+        if level + 1 < depth:
+            body.append(f"@@chain_{level + 1:03d}.sql")
+        _write(root / f"chain_{level:03d}.sql", body)
+    return Corpus('deep_chain', root / "chain_000.sql", _variables(root, {}),
+                  {'depth': depth, 'lines': lines})
+
+
+def wide_fanout(root: Path, width: int = 500, lines: int = 20) -> Corpus:
+    """Un archivo principal que incluye `width` hojas de un subdirectorio."""
+    for leaf in range(width):
+        _write(root / "leaves" / f"leaf_{leaf:04d}.sql", _body(f"leaf_{leaf}", lines))
+    _write(root / "main.sql", [f"@@leaves/leaf_{leaf:04d}.sql" for leaf in range(width)])
+    return Corpus('wide_fanout', root / "main.sql", _variables(root, {}),
+                  {'width': width, 'lines': lines})
+
+
+def diamond(root: Path, layers: int = 10, width: int = 2, lines: int = 5) -> Corpus:
+    """
+    Inclusiones en diamante: cada archivo de una capa incluye todos los de la
+    siguiente, de modo que la última capa se expande width ** (layers - 1) veces.
+    """
+    for layer in range(layers):
+        for node in range(1 if layer == 0 else width):
+            if layer + 1 < layers:
+                body = [f"@@node_{layer + 1}_{child}.sql" for child in range(width)]
+            else:
+                body = _body(f"node_{layer}_{node}", lines)
+            _write(root / f"node_{layer}_{node}.sql", body)
+    return Corpus('diamond', root / "node_0_0.sql", _variables(root, {}),
+                  {'layers': layers, 'width': width, 'lines': lines})
+
+
+def many_defines(root: Path, count: int = 5000) -> Corpus:
+    """`count` DEFINE seguidos de una sentencia que usa cada variable."""
+    defines = [f"DEFINE v_{i} = 'value_{i}'" for i in range(count)]
+    uses = [f"SELECT '&v_{i}' AS c FROM dual;" for i in range(count)]
+    _write(root / "main.sql", defines + uses)
+    return Corpus('many_defines', root / "main.sql", _variables(root, {}),
+                  {'count': count})
+
+
+def dense_vars(root: Path, lines: int = 5000, refs_per_line: int = 10, names: int = 20) -> Corpus:
+    """`lines` líneas con `refs_per_line` referencias &var cada una."""
+    defines = [f"DEFINE d_{n} = 'x{n}'" for n in range(names)]
+    body = []
+    for line in range(lines):
+        refs = ", ".join(f"'&d_{(line + r) % names}.'" for r in range(refs_per_line))
+        body.append(f"SELECT {refs} FROM dual;")
+    _write(root / "main.sql", defines + body)
+    return Corpus('dense_vars', root / "main.sql", _variables(root, {}),
+                  {'lines': lines, 'refs_per_line': refs_per_line, 'names': names})
+
+
+def jinja_loop(root: Path, iterations: int = 20000) -> Corpus:
+    """Bucle Jinja2 de `iterations` vueltas con condicional y variables YAML."""
+    _write(root / "main.sql", [
+        "-- carga de {{ schema }}",
+        "{% for i in range(rows) %}",
+        "INSERT INTO {{ schema }}.items (id, name, flag) VALUES ({{ i }}, 'item_{{ i }}', "
+        "{% if i is even %}'Y'{% else %}'N'{% endif %});",
+        "{% endfor %}",
+        "COMMIT;",
+    ])
+    return Corpus('jinja_loop', root / "main.sql", _variables(root, {'schema': 'app', 'rows': iterations}),
+                  {'iterations': iterations})
+
+
+# Generador y parámetro de tamaño al que se aplica el factor de escala
+CORPORA: Dict[str, Tuple[Callable[..., Corpus], str]] = {
+    'deep_chain': (deep_chain, 'lines'),
+    'wide_fanout': (wide_fanout, 'width'),
+    'diamond': (diamond, 'lines'),
+    'many_defines': (many_defines, 'count'),
+    'dense_vars': (dense_vars, 'lines'),
+    'jinja_loop': (jinja_loop, 'iterations'),
+}
+
+
+def generate(name: str, root: Path, scale: float = 1.0, **params: int) -> Corpus:
+    """
+    Genera el corpus `name` en `root`.
+    
+    Args:
+        name: Nombre del corpus (clave de CORPORA)
+        root: Directorio destino (se crea si no existe)
+        scale: Factor aplicado al parámetro de tamaño del corpus
+        **params: Parámetros explícitos del generador (no se escalan)
+    
+    Returns:
+        Corpus generado
+    """
+    if name not in CORPORA:
+        raise ValueError(f"Corpus desconocido: {name}. Disponibles: {', '.join(CORPORA)}")
+    generator, size_param = CORPORA[name]
+    if size_param not in params and scale != 1.0:
+        default = inspect.signature(generator).parameters[size_param].default
+        params[size_param] = max(1, int(default * scale))
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    return generator(root, **params)
@@ -0,0 +1,154 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Presupuestos de operaciones para corpus de referencia.
+
+Los tiempos de reloj son demasiado ruidosos en CI compartido; el número de
+operaciones no. Con las métricas activas, las rutas calientes cuentan:
+
+- file_opens: aperturas de archivos fuente (y de archivos empalmados)
+- stat_calls / dir_scans: llamadas stat y listados de directorio
+- bytes_decoded: bytes decodificados de UTF-8
+- regex_calls: invocaciones de expresiones regulares por línea o por archivo
+- string_concats: fragmentos concatenados al reunir un texto completo (la
+  expansión de las inclusiones, la entrada de Jinja2 o la salida renderizada)
+- jinja_compiles: compilaciones de plantillas Jinja2 (principal e includes)
+
+Cada corpus de referencia se procesa de extremo a extremo con core.main y
+los contadores se comparan con su cota superior: un cambio que haga que
+_read_file_recursive relea un archivo o que una plantilla se recompile
+falla de forma determinista. Si una optimización reduce un contador, basta
+con bajar su cota.
+
+Uso:
+    python -m benchmarks.opcounts
+"""
+
+import argparse
+import logging
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from MergeSourceFile import metrics
+
+from .corpus import generate
+from .run import make_runner
+
+# Parámetros de cada corpus de referencia
+REFERENCE_CORPORA: Dict[str, Dict[str, int]] = {
+    'deep_chain': {'depth': 20, 'lines': 5},
+    'wide_fanout': {'width': 30, 'lines': 5},
+    'diamond': {'layers': 4, 'width': 3, 'lines': 5},
+    'many_defines': {'count': 200},
+    'dense_vars': {'lines': 100, 'refs_per_line': 10, 'names': 20},
+    'jinja_loop': {'iterations': 100},
+}
+
+# Cotas superiores por corpus. El archivo principal solo lo lee sqlplus al
+# expandir las inclusiones (una apertura por archivo); cada archivo leído
+# hace dos stat (tamaño para bytes_in y umbral de mmap). En el diamante no hay
+# include_once: cada una de las 1 + 3 + 9 + 27 inclusiones se lee de nuevo.
+# El contenido expandido se reúne una sola vez: una concatenación por línea.
+BUDGETS: Dict[str, Dict[str, int]] = {
+    'deep_chain': {
+        'file_opens': 20, 'stat_calls': 40, 'dir_scans': 1, 'bytes_decoded': 6234,
+        'regex_calls': 258, 'string_concats': 139, 'jinja_compiles': 1,
+    },
+    'wide_fanout': {
+        'file_opens': 31, 'stat_calls': 62, 'dir_scans': 2, 'bytes_decoded': 8990,
+        'regex_calls': 391, 'string_concats': 180, 'jinja_compiles': 1,
+    },
+    'diamond': {
+        'file_opens': 40, 'stat_calls': 80, 'dir_scans': 1, 'bytes_decoded': 8415,
+        'regex_calls': 388, 'string_concats': 174, 'jinja_compiles': 1,
+    },
+    'many_defines': {
+        'file_opens': 1, 'stat_calls': 2, 'dir_scans': 1, 'bytes_decoded': 11470,
+        'regex_calls': 601, 'string_concats': 200, 'jinja_compiles': 1,
+    },
+    'dense_vars': {
+        'file_opens': 1, 'stat_calls': 2, 'dir_scans': 1, 'bytes_decoded': 11580,
+        'regex_calls': 221, 'string_concats': 100, 'jinja_compiles': 1,
+    },
+    'jinja_loop': {
+        'file_opens': 1, 'stat_calls': 2, 'dir_scans': 1, 'bytes_decoded': 202,
+        'regex_calls': 9, 'string_concats': 5, 'jinja_compiles': 1,
+    },
+}
+
+
+def count_operations(name: str, workdir: Path, target: str = 'main') -> Dict[str, int]:
+    """
+    Genera el corpus de referencia `name` y devuelve los contadores de una ejecución.
+    
+    Args:
+        name: Nombre del corpus (clave de REFERENCE_CORPORA)
+        workdir: Directorio donde generar el corpus
+        target: Objetivo a ejecutar (ver benchmarks.run.TARGETS)
+    """
+    corpus = generate(name, Path(workdir) / name, **REFERENCE_CORPORA[name])
+    run = make_runner(target, corpus, Path(workdir))
+    with metrics.collect_metrics() as collector:
+        run()
+    return dict(collector.counters)
+
+
+def check_budget(counters: Dict[str, int], budget: Dict[str, int]) -> List[str]:
+    """Contadores que superan su cota, como mensajes legibles (lista vacía si ninguno)."""
+    return [
+        f"{counter}: {counters.get(counter, 0)} > {limit}"
+        for counter, limit in budget.items()
+        if counters.get(counter, 0) > limit
+    ]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.opcounts',
+                                     description="Comprueba los presupuestos de operaciones.")
+    parser.add_argument('--corpus', action='append', choices=list(REFERENCE_CORPORA),
+                        help="Corpus a comprobar (repetible; por defecto, todos)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    
+    failures = 0
+    workdir = Path(tempfile.mkdtemp(prefix='msf-opcounts-'))
+    try:
+        for name in args.corpus or list(REFERENCE_CORPORA):
+            counters = count_operations(name, workdir)
+            violations = check_budget(counters, BUDGETS[name])
+            failures += bool(violations)
+            summary = ", ".join(f"{counter}={counters.get(counter, 0)}" for counter in BUDGETS[name])
+            print(f"{name:<14} {'FALLO' if violations else 'ok':<6} {summary}")
+            for violation in violations:
+                print(f"    {violation}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
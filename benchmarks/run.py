@@ -0,0 +1,231 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Ejecución de los benchmarks.
+
+Genera cada corpus en un directorio de trabajo y mide, para cada uno:
+- process_sqlplus: la extensión sqlplus sobre el archivo principal
+- process_file: TemplateEngine.process_file (extensiones + Jinja2)
+- main: core.main de extremo a extremo (configuración, render y escritura)
+
+Los tiempos (segundos de reloj, time.perf_counter) se guardan en JSON junto
+con la versión de MergeSourceFile, la revisión git y la plataforma, para
+compararlos con benchmarks.compare.
+
+Uso:
+    python -m benchmarks.run --output resultados.json [--scale 0.5] [--repeat 5]
+        [--corpus deep_chain --corpus jinja_loop] [--target main]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+import MergeSourceFile
+from MergeSourceFile import core
+from MergeSourceFile.extensions.sqlplus import process_sqlplus
+from MergeSourceFile.template_engine import TemplateEngine
+
+from .corpus import CORPORA, Corpus, generate
+
+RESULTS_FORMAT = 1
+
+TARGETS = ('process_sqlplus', 'process_file', 'main')
+
+
+def _config(corpus: Corpus, output: Path) -> Dict[str, Any]:
+    return {
+        'project': {'input': str(corpus.main), 'output': str(output)},
+        'jinja2': {'extensions': ['sqlplus'], 'variables_file': str(corpus.variables_file)},
+    }
+
+
+def _write_toml(config: Dict[str, Any], path: Path) -> Path:
+    project, jinja2 = config['project'], config['jinja2']
+    path.write_text(
+        "[project]\n"
+        f"input = \"{project['input'].replace(chr(92), '/')}\"\n"
+        f"output = \"{project['output'].replace(chr(92), '/')}\"\n"
+        "\n[jinja2]\n"
+        "extensions = [\"sqlplus\"]\n"
+        f"variables_file = \"{jinja2['variables_file'].replace(chr(92), '/')}\"\n",
+        encoding='utf-8'
+    )
+    return path
+
+
+def make_runner(target: str, corpus: Corpus, workdir: Path) -> Callable[[], int]:
+    """Devuelve una función sin argumentos que ejecuta `target` y devuelve el tamaño de la salida."""
+    output = workdir / f"{corpus.name}.out.sql"
+    config = _config(corpus, output)
+    
+    if target == 'process_sqlplus':
+        content = corpus.main.read_text(encoding='utf-8')
+        
+        def run() -> int:
+            processed, _ = process_sqlplus(content, str(corpus.main), str(corpus.main.parent),
+                                           {'process_includes': True, 'process_defines': True})
+            return len(processed)
+    elif target == 'process_file':
+        variables = yaml.safe_load(corpus.variables_file.read_text(encoding='utf-8')) or {}
+        
+        def run() -> int:
+            return len(TemplateEngine(config).process_file(str(corpus.main), variables))
+    elif target == 'main':
+        config_file = _write_toml(config, workdir / f"{corpus.name}.toml")
+        
+        def run() -> int:
+            # Sin salida previa: cada ejecución escribe el archivo completo
+            output.unlink(missing_ok=True)
+            if core.main(str(config_file)) != 0:
+                raise RuntimeError(f"core.main falló con el corpus {corpus.name}")
+            return len(output.read_text(encoding='utf-8'))
+    else:
+        raise ValueError(f"Objetivo desconocido: {target}. Disponibles: {', '.join(TARGETS)}")
+    return run
+
+
+def measure(run: Callable[[], int], repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Mide `run` `repeat` veces tras `warmup` ejecuciones descartadas.
+    
+    Returns:
+        Diccionario con los tiempos de cada ejecución, mínimo, mediana y
+        tamaño de la salida (en caracteres)
+    """
+    output_chars = 0
+    for _ in range(warmup):
+        output_chars = run()
+    runs = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        output_chars = run()
+        runs.append(time.perf_counter() - start)
+    return {
+        'runs': runs,
+        'min': min(runs),
+        'median': statistics.median(runs),
+        'output_chars': output_chars,
+    }
+
+
+def _revision() -> Optional[str]:
+    """Revisión git del árbol (con -dirty si hay cambios), si está disponible."""
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                                text=True, cwd=Path(__file__).resolve().parent, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None if result.returncode == 0 else None
+
+
+def environment_info() -> Dict[str, Any]:
+    """Versión, revisión, intérprete y plataforma, para identificar los resultados."""
+    return {
+        'format': RESULTS_FORMAT,
+        'version': MergeSourceFile.__version__,
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def run_benchmarks(corpora: List[str], targets: List[str], workdir: Path, scale: float = 1.0,
+                   repeat: int = 5, warmup: int = 1) -> Dict[str, Any]:
+    """
+    Genera los corpus en `workdir` y mide cada objetivo sobre cada uno.
+    
+    Returns:
+        Documento de resultados (serializable a JSON)
+    """
+    results = []
+    for name in corpora:
+        corpus = generate(name, workdir / name, scale)
+        for target in targets:
+            measurement = measure(make_runner(target, corpus, workdir), repeat, warmup)
+            results.append({'corpus': name, 'params': corpus.params, 'target': target, **measurement})
+    return {
+        **environment_info(),
+        'scale': scale,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run',
+                                     description="Mide MergeSourceFile sobre corpus sintéticos.")
+    parser.add_argument('--output', default='benchmark-results.json', metavar='ARCHIVO',
+                        help="Archivo JSON de resultados (por defecto: benchmark-results.json)")
+    parser.add_argument('--corpus', action='append', choices=list(CORPORA),
+                        help="Corpus a medir (repetible; por defecto, todos)")
+    parser.add_argument('--target', action='append', choices=TARGETS,
+                        help="Objetivo a medir (repetible; por defecto, todos)")
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help="Factor de tamaño de los corpus (por defecto: 1.0)")
+    parser.add_argument('--repeat', type=int, default=5, help="Ejecuciones medidas (por defecto: 5)")
+    parser.add_argument('--warmup', type=int, default=1, help="Ejecuciones descartadas (por defecto: 1)")
+    parser.add_argument('--workdir', metavar='DIR',
+                        help="Directorio de trabajo para los corpus (por defecto, uno temporal)")
+    args = parser.parse_args(argv)
+    
+    # Los mensajes INFO por consola no forman parte de lo que se mide
+    # (core.main no reconfigura el logging si ya tiene manejadores)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix='msf-bench-'))
+    try:
+        document = run_benchmarks(args.corpus or list(CORPORA), args.target or list(TARGETS),
+                                  workdir, args.scale, args.repeat, args.warmup)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    
+    Path(args.output).write_text(json.dumps(document, indent=2), encoding='utf-8')
+    for result in document['results']:
+        print(f"{result['corpus']:<14} {result['target']:<16} "
+              f"min {result['min'] * 1000:9.2f} ms  mediana {result['median'] * 1000:9.2f} ms  "
+              f"{result['output_chars']:>10} car.")
+    print(f"Resultados: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
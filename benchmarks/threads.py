@@ -0,0 +1,150 @@
+# MIT License
+#
+# Copyright (c) 2023 Alejandro G.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+Benchmark de rendimiento con varios hilos.
+
+Un único TemplateEngine compartido procesa el archivo principal de un corpus
+`tasks` veces desde un ThreadPoolExecutor, con 1, 2, 4... hilos. Se mide el
+throughput (archivos por segundo) y la aceleración respecto a un hilo, y se
+registra si el intérprete tiene el GIL activo: con GIL el trabajo de CPU
+(extensiones y Jinja2) apenas escala; en un build free-threaded (3.13t)
+debería escalar con los núcleos disponibles.
+
+Uso:
+    python -m benchmarks.threads --output hilos.json [--corpus wide_fanout]
+        [--threads 1,2,4,8] [--tasks 32] [--scale 0.2]
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from MergeSourceFile.template_engine import TemplateEngine
+
+from .corpus import CORPORA, Corpus, generate
+from .run import environment_info
+
+
+def gil_enabled() -> bool:
+    """Indica si el GIL está activo (siempre en intérpretes anteriores a 3.13)."""
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def measure_threads(engine: TemplateEngine, corpus: Corpus, variables: Dict[str, Any],
+                    threads: int, tasks: int) -> float:
+    """
+    Procesa el corpus `tasks` veces con `threads` hilos y devuelve los segundos.
+    
+    Todas las salidas deben coincidir: un resultado distinto indicaría estado
+    compartido entre hilos.
+    """
+    main = str(corpus.main)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        outputs = list(pool.map(lambda _: engine.process_file(main, variables), range(tasks)))
+        elapsed = time.perf_counter() - start
+    if len(set(outputs)) != 1:
+        raise RuntimeError(f"Salidas distintas entre hilos con el corpus {corpus.name}")
+    return elapsed
+
+
+def run_thread_benchmark(name: str, workdir: Path, thread_counts: List[int], tasks: int = 32,
+                         scale: float = 1.0, repeat: int = 3) -> Dict[str, Any]:
+    """
+    Genera el corpus `name` y mide el throughput para cada número de hilos.
+    
+    Returns:
+        Documento de resultados (serializable a JSON)
+    """
+    corpus = generate(name, workdir / name, scale)
+    variables = yaml.safe_load(corpus.variables_file.read_text(encoding='utf-8')) or {}
+    engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+    
+    # Calentamiento: importaciones y cachés de listados / clasificación
+    engine.process_file(str(corpus.main), variables)
+    results = []
+    for threads in thread_counts:
+        seconds = min(measure_threads(engine, corpus, variables, threads, tasks) for _ in range(repeat))
+        results.append({'threads': threads, 'seconds': seconds, 'throughput': tasks / seconds})
+    base = results[0]['throughput']
+    for result in results:
+        result['speedup'] = result['throughput'] / base
+    return {
+        **environment_info(),
+        'gil_enabled': gil_enabled(),
+        'cpu_count': os.cpu_count(),
+        'corpus': name,
+        'params': corpus.params,
+        'tasks': tasks,
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.threads',
+                                     description="Mide el throughput de un TemplateEngine compartido entre hilos.")
+    parser.add_argument('--output', default='threads-results.json', metavar='ARCHIVO',
+                        help="Archivo JSON de resultados (por defecto: threads-results.json)")
+    parser.add_argument('--corpus', default='wide_fanout', choices=list(CORPORA),
+                        help="Corpus a procesar (por defecto: wide_fanout)")
+    parser.add_argument('--threads', default='1,2,4,8',
+                        help="Números de hilos separados por comas (por defecto: 1,2,4,8)")
+    parser.add_argument('--tasks', type=int, default=32, help="Archivos procesados por medición (por defecto: 32)")
+    parser.add_argument('--scale', type=float, default=0.2,
+                        help="Factor de tamaño del corpus (por defecto: 0.2)")
+    parser.add_argument('--repeat', type=int, default=3, help="Mediciones por número de hilos (por defecto: 3)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(message)s')
+    
+    thread_counts = [int(n) for n in args.threads.split(',') if n.strip()]
+    workdir = Path(tempfile.mkdtemp(prefix='msf-threads-'))
+    try:
+        document = run_thread_benchmark(args.corpus, workdir, thread_counts, args.tasks,
+                                        args.scale, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    Path(args.output).write_text(json.dumps(document, indent=2), encoding='utf-8')
+    print(f"{document['implementation']} {document['python']} "
+          f"(GIL {'activo' if document['gil_enabled'] else 'desactivado'}, {document['cpu_count']} CPU)")
+    for result in document['results']:
+        print(f"{result['threads']:>3} hilos  {result['throughput']:9.1f} archivos/s  x{result['speedup']:.2f}")
+    print(f"Resultados: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
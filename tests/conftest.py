@@ -1,7 +1,16 @@
+import json
 import pytest
 import tempfile
 import shutil
-from pathlib import Path
+from pathlib import Path, PurePath
+
+
+@pytest.fixture(autouse=True)
+def isolated_extension_index(tmp_path_factory, monkeypatch):
+    """Índice de extensiones externas en un directorio temporal, no en ~/.cache"""
+    from MergeSourceFile import extension_index
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path_factory.mktemp('cache')))
+    monkeypatch.setattr(extension_index, '_memo', None)
 
 
 @pytest.fixture
@@ -12,6 +21,48 @@ def temp_dir():
     shutil.rmtree(temp_dir)
 
 
+def _toml_value(value):
+    """Valor TOML de un texto, ruta, booleano, número o lista."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(_toml_value(item) for item in value) + ']'
+    if isinstance(value, PurePath):
+        value = value.as_posix()
+    return json.dumps(value, ensure_ascii=False)
+
+
+@pytest.fixture
+def write_config(temp_dir):
+    """
+    Fábrica de archivos de configuración TOML en temp_dir.
+
+    write_config(project={...}, jinja2={...}, sqlplus={...}, name="config.toml")
+    escribe las secciones [project], [jinja2] y [jinja2.sqlplus] (las que no
+    son None) y devuelve la ruta del archivo. input y output son por defecto
+    main.sql y out.sql de temp_dir; las rutas se escriben con '/'.
+    """
+    def write(project=None, jinja2=None, sqlplus=None, name="config.toml"):
+        sections = {
+            'project': {'input': temp_dir / "main.sql", 'output': temp_dir / "out.sql", **(project or {})},
+            'jinja2': jinja2,
+            'jinja2.sqlplus': sqlplus,
+        }
+        lines = []
+        for section, values in sections.items():
+            if values is None:
+                continue
+            lines.append(f"[{section}]")
+            lines.extend(f"{key} = {_toml_value(value)}" for key, value in values.items())
+            lines.append("")
+        config_file = temp_dir / name
+        config_file.write_text("\n".join(lines), encoding='utf-8')
+        return config_file
+    return write
+
+
 @pytest.fixture
 def sample_sql_file(temp_dir):
     """Crear un archivo SQL de ejemplo para pruebas"""
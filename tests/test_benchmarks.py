@@ -0,0 +1,80 @@
+"""
+Tests para el paquete de benchmarks.
+
+Verifica que los corpus sintéticos generan proyectos válidos, que el
+runner mide los tres objetivos y que la comparación empareja resultados.
+"""
+import json
+import pytest
+from MergeSourceFile.template_engine import TemplateEngine
+from benchmarks import compare, run, threads
+from benchmarks.corpus import CORPORA, generate
+
+
+class TestCorpus:
+    """Tests para el generador de corpus"""
+
+    def test_diamond_expansion(self, temp_dir):
+        """Test que el diamante expande la última capa width ** (layers - 1) veces"""
+        corpus = generate('diamond', temp_dir, layers=4, width=3, lines=2)
+        config = {'jinja2': {'extensions': ['sqlplus']}}
+
+        result = TemplateEngine(config).process_file(str(corpus.main), {})
+
+        assert result.count("INSERT INTO node_3_") == 27 * 2
+
+    def test_scale_applies_to_size_param(self, temp_dir):
+        """Test que la escala afecta al parámetro de tamaño y no a los explícitos"""
+        corpus = generate('jinja_loop', temp_dir / "a", scale=0.01)
+        explicit = generate('jinja_loop', temp_dir / "b", scale=0.01, iterations=7)
+
+        assert corpus.params == {'iterations': 200}
+        assert explicit.params == {'iterations': 7}
+
+    def test_unknown_corpus(self, temp_dir):
+        """Test que un corpus desconocido produce ValueError"""
+        with pytest.raises(ValueError, match="Corpus desconocido"):
+            generate('nope', temp_dir)
+
+
+class TestRun:
+    """Tests para la ejecución y comparación de benchmarks"""
+
+    def test_all_corpora_and_targets(self, temp_dir):
+        """Test que todos los corpus se procesan con los tres objetivos"""
+        output = temp_dir / "results.json"
+
+        assert run.main(["--output", str(output), "--workdir", str(temp_dir / "work"),
+                         "--scale", "0.01", "--repeat", "1", "--warmup", "0"]) == 0
+
+        document = json.loads(output.read_text(encoding='utf-8'))
+        assert document['format'] == run.RESULTS_FORMAT
+        assert {(r['corpus'], r['target']) for r in document['results']} == {
+            (name, target) for name in CORPORA for target in run.TARGETS
+        }
+        assert all(r['output_chars'] > 0 and len(r['runs']) == 1 for r in document['results'])
+
+    def test_compare_flags_regressions(self, temp_dir):
+        """Test que compare empareja por corpus y objetivo y marca regresiones"""
+        def document(seconds):
+            return {'format': run.RESULTS_FORMAT, 'version': '2.0.0', 'results': [
+                {'corpus': 'diamond', 'target': 'main', 'params': {'lines': 1}, 'min': seconds},
+                {'corpus': 'jinja_loop', 'target': 'main', 'params': {'iterations': 1}, 'min': 1.0},
+            ]}
+        base, slower = temp_dir / "base.json", temp_dir / "new.json"
+        base.write_text(json.dumps(document(1.0)), encoding='utf-8')
+        slower.write_text(json.dumps(document(1.5)), encoding='utf-8')
+
+        rows = compare.compare(compare.load_results(str(base)), compare.load_results(str(slower)))
+
+        assert [(row['corpus'], row['ratio']) for row in rows] == [('diamond', 1.5), ('jinja_loop', 1.0)]
+        assert compare.main([str(base), str(slower)]) == 1
+        assert compare.main([str(base), str(slower), "--threshold", "2"]) == 0
+
+    def test_thread_benchmark(self, temp_dir):
+        """Test que el benchmark con hilos mide cada número de hilos con un motor compartido"""
+        document = threads.run_thread_benchmark('jinja_loop', temp_dir, [1, 2], tasks=4, scale=0.01, repeat=1)
+
+        assert [r['threads'] for r in document['results']] == [1, 2]
+        assert document['results'][0]['speedup'] == 1.0
+        assert document['gil_enabled'] in (True, False)
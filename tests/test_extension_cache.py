@@ -0,0 +1,179 @@
+"""
+Tests para la caché de resultados de extensiones (extension_cache).
+
+Verifica que el resultado de la extensión SQLPlus se reutiliza con otras
+variables Jinja2 y que se invalida al cambiar una inclusión, la
+configuración o la resolución de una inclusión por rutas de búsqueda.
+"""
+import os
+import pytest
+from MergeSourceFile import extension_cache
+from MergeSourceFile.extensions import sqlplus
+from MergeSourceFile.sourcemap import SourceMapBuilder
+from MergeSourceFile.template_engine import TemplateEngine
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """Cachés compartidas vacías en cada test."""
+    monkeypatch.setattr(extension_cache, '_caches', {})
+
+
+@pytest.fixture
+def handler_spy(mocker):
+    return mocker.spy(sqlplus, 'process_sqlplus')
+
+
+def _write_tree(temp_dir):
+    (temp_dir / "lib").mkdir()
+    (temp_dir / "lib" / "grants.sql").write_text("GRANT SELECT ON &tbl TO app;\n", encoding='utf-8')
+    (temp_dir / "body.sql").write_text("SELECT * FROM &tbl WHERE env = '{{ env }}';\n", encoding='utf-8')
+    main_file = temp_dir / "main.sql"
+    main_file.write_text("DEFINE tbl = orders\n@body.sql\n@grants.sql\n", encoding='utf-8')
+    return main_file
+
+
+def _engine(temp_dir, cache_dir=None, **sqlplus_config):
+    jinja2 = {
+        'extensions': ['sqlplus'],
+        'extension_cache': True,
+        'sqlplus': {'search_paths': [str(temp_dir / "lib")], **sqlplus_config},
+    }
+    if cache_dir is not None:
+        jinja2['extension_cache_dir'] = str(cache_dir)
+    return TemplateEngine({'jinja2': jinja2})
+
+
+class TestExtensionCache:
+    """Tests para la reutilización e invalidación de resultados"""
+
+    def test_reused_with_other_variables(self, temp_dir, handler_spy):
+        """Test que con las mismas fuentes la extensión no se vuelve a ejecutar"""
+        main_file = _write_tree(temp_dir)
+        engine = _engine(temp_dir)
+
+        dev = engine.process_file(str(main_file), {'env': 'dev'})
+        prod = _engine(temp_dir).process_file(str(main_file), {'env': 'prod'})
+
+        assert handler_spy.call_count == 1
+        assert dev == prod.replace("'prod'", "'dev'")
+        assert "SELECT * FROM orders WHERE env = 'prod';" in prod
+        assert "GRANT SELECT ON orders TO app;" in prod
+
+    def test_changed_include_invalidates(self, temp_dir, handler_spy):
+        """Test que modificar un archivo incluido obliga a ejecutar la extensión"""
+        main_file = _write_tree(temp_dir)
+        engine = _engine(temp_dir)
+        engine.process_file(str(main_file), {'env': 'dev'})
+
+        (temp_dir / "lib" / "grants.sql").write_text("GRANT ALL ON &tbl TO app;\n", encoding='utf-8')
+        result = engine.process_file(str(main_file), {'env': 'dev'})
+
+        assert handler_spy.call_count == 2
+        assert "GRANT ALL ON orders TO app;" in result
+
+    def test_touched_file_with_same_content_hits(self, temp_dir, handler_spy):
+        """Test que un mtime distinto con el mismo contenido no invalida la entrada"""
+        main_file = _write_tree(temp_dir)
+        engine = _engine(temp_dir)
+        engine.process_file(str(main_file), {'env': 'dev'})
+
+        body = temp_dir / "body.sql"
+        stat = body.stat()
+        os.utime(body, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        engine.process_file(str(main_file), {'env': 'dev'})
+
+        assert handler_spy.call_count == 1
+
+    def test_change_after_read_invalidates(self, temp_dir, monkeypatch):
+        """Test que la entrada registra los bytes que leyó la extensión, no los que hay al guardarla"""
+        main_file = _write_tree(temp_dir)
+        grants = temp_dir / "lib" / "grants.sql"
+        process_sqlplus = sqlplus.process_sqlplus
+        calls = []
+
+        def edit_after_read(*args, **kwargs):
+            result = process_sqlplus(*args, **kwargs)
+            if not calls:
+                # Otro proceso modifica la inclusión antes de que se guarde la entrada
+                grants.write_text("GRANT ALL ON &tbl TO app;\n", encoding='utf-8')
+            calls.append(result)
+            return result
+
+        monkeypatch.setattr(sqlplus, 'process_sqlplus', edit_after_read)
+        first = _engine(temp_dir).process_file(str(main_file), {'env': 'dev'})
+        second = _engine(temp_dir).process_file(str(main_file), {'env': 'dev'})
+
+        assert len(calls) == 2
+        assert "GRANT SELECT ON orders TO app;" in first
+        assert "GRANT ALL ON orders TO app;" in second
+
+    def test_hit_does_not_mutate_shared_entry(self, temp_dir, handler_spy):
+        """Test que un acierto con otro mtime publica registros nuevos sin modificar los compartidos"""
+        main_file = _write_tree(temp_dir)
+        _engine(temp_dir).process_file(str(main_file), {'env': 'dev'})
+        cache = extension_cache.get_cache()
+        (key, entry), = cache._entries.items()
+        before = [list(record) for record in entry['files']]
+
+        body = temp_dir / "body.sql"
+        stat = body.stat()
+        os.utime(body, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        _engine(temp_dir).process_file(str(main_file), {'env': 'dev'})
+
+        assert handler_spy.call_count == 1
+        assert entry['files'] == before
+        refreshed = {record[0]: record for record in cache._entries[key]['files']}
+        assert refreshed[str(body)][2] == stat.st_mtime_ns + 10**9
+
+    def test_new_file_on_search_path_invalidates(self, temp_dir, handler_spy):
+        """Test que un archivo nuevo que cambia la resolución de una inclusión invalida la entrada"""
+        main_file = _write_tree(temp_dir)
+        engine = _engine(temp_dir)
+        engine.process_file(str(main_file), {'env': 'dev'})
+
+        (temp_dir / "grants.sql").write_text("-- sin permisos\n", encoding='utf-8')
+        result = engine.process_file(str(main_file), {'env': 'dev'})
+
+        assert handler_spy.call_count == 2
+        assert "-- sin permisos" in result
+
+    def test_config_is_part_of_key(self, temp_dir, handler_spy):
+        """Test que otra configuración de la extensión no reutiliza el resultado"""
+        main_file = _write_tree(temp_dir)
+        _engine(temp_dir).process_file(str(main_file), {'env': 'dev'})
+
+        result = _engine(temp_dir, process_defines=False).process_file(str(main_file), {'env': 'dev'})
+
+        assert handler_spy.call_count == 2
+        assert "&tbl" in result
+
+    def test_disk_cache_across_processes(self, temp_dir, handler_spy, monkeypatch):
+        """Test que la caché en disco se reutiliza sin la caché en memoria, también con mapa de origen"""
+        main_file = _write_tree(temp_dir)
+        cache_dir = temp_dir / ".msf-cache"
+        first_map = SourceMapBuilder()
+        first = ''.join(_engine(temp_dir, cache_dir).process_file_stream(str(main_file), {'env': 'dev'}, first_map))
+        assert len(list(cache_dir.glob("*.json"))) == 1
+
+        # Nuevo proceso: cachés en memoria vacías
+        monkeypatch.setattr(extension_cache, '_caches', {})
+        second_map = SourceMapBuilder()
+        second = ''.join(_engine(temp_dir, cache_dir).process_file_stream(str(main_file), {'env': 'dev'}, second_map))
+
+        assert handler_spy.call_count == 1
+        assert second == first
+        assert second_map.build().to_json() == first_map.build().to_json()
+
+    def test_counters(self, temp_dir):
+        """Test que aciertos y fallos se cuentan en las métricas"""
+        from MergeSourceFile import metrics
+        main_file = _write_tree(temp_dir)
+        engine = _engine(temp_dir)
+
+        with metrics.collect_metrics() as collector:
+            engine.process_file(str(main_file), {'env': 'dev'})
+            engine.process_file(str(main_file), {'env': 'prod'})
+
+        assert collector.counters['extension_cache_misses'] == 1
+        assert collector.counters['extension_cache_hits'] == 1
@@ -0,0 +1,109 @@
+"""
+Tests para el descubrimiento de extensiones externas (entry points).
+
+Instala en un directorio temporal una distribución de prueba que declara
+una extensión y verifica que se descubre, que el índice se reutiliza sin
+recorrer las distribuciones y que su módulo solo se importa al habilitarla.
+"""
+import sys
+import pytest
+from importlib import metadata
+from MergeSourceFile import extension_index
+from MergeSourceFile.template_engine import ExtensionManager, TemplateEngine
+
+
+def _install(site, name="msf_flyway", module="msf_flyway_ext", value=None):
+    """Crea una distribución mínima (dist-info + módulo) en site."""
+    dist_info = site / f"{name}-1.0.dist-info"
+    dist_info.mkdir()
+    (dist_info / "METADATA").write_text(f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n", encoding='utf-8')
+    (dist_info / "entry_points.txt").write_text(
+        f"[mergesourcefile.extensions]\nflyway = {value or module + ':EXTENSION'}\n", encoding='utf-8'
+    )
+    (site / f"{module}.py").write_text(
+        "EXTENSION = {'function': 'process_flyway', 'namespace': 'fw'}\n"
+        "\n"
+        "def process_flyway(content, input_file, base_path, config, verbose=False):\n"
+        "    return content.replace('${schema}', config.get('schema', 'public')), {'migration': 'V1'}\n",
+        encoding='utf-8'
+    )
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    site = tmp_path / "site"
+    site.mkdir()
+    monkeypatch.syspath_prepend(str(site))
+    yield site
+    sys.modules.pop('msf_flyway_ext', None)
+
+
+class TestExtensionIndex:
+    """Tests para el índice de extensiones externas"""
+
+    def test_discover_without_import(self, site):
+        """Test que el descubrimiento no importa el módulo de la extensión"""
+        _install(site)
+
+        index = extension_index.discover()
+
+        assert index['flyway']['value'] == "msf_flyway_ext:EXTENSION"
+        assert index['flyway']['distribution'] == "msf_flyway"
+        assert 'msf_flyway_ext' not in sys.modules
+
+    def test_index_reused_from_disk(self, site, monkeypatch):
+        """Test que una nueva ejecución reutiliza el índice en disco sin recorrer las distribuciones"""
+        _install(site)
+        extension_index.discover()
+        assert extension_index.index_path().is_file()
+
+        monkeypatch.setattr(extension_index, '_memo', None)
+
+        def fail(**kwargs):
+            raise AssertionError("no debe recorrer las distribuciones")
+        monkeypatch.setattr(metadata, 'entry_points', fail)
+
+        assert 'flyway' in extension_index.discover()
+
+    def test_index_rebuilt_when_packages_change(self, site):
+        """Test que instalar una distribución cambia la huella y reconstruye el índice"""
+        assert 'flyway' not in extension_index.discover()
+
+        _install(site)
+
+        assert 'flyway' in extension_index.discover()
+
+    def test_enabled_extension_loaded(self, site, temp_dir):
+        """Test que una extensión externa habilitada se importa y se ejecuta"""
+        _install(site)
+        main_file = temp_dir / "V1__init.sql"
+        main_file.write_text("CREATE TABLE ${schema}.t (id NUMBER); -- {{ fw_migration }}", encoding='utf-8')
+
+        engine = TemplateEngine({'jinja2': {'extensions': ['flyway'], 'flyway': {'schema': 'app'}}})
+
+        assert engine.process_file(str(main_file), {}) == "CREATE TABLE app.t (id NUMBER); -- V1"
+        info = engine.extension_manager.loaded_extensions[0]
+        assert info['priority'] == extension_index.DEFAULT_PRIORITY
+        assert info['description'] == "msf_flyway 1.0"
+
+    def test_builtin_extension_does_not_scan(self, monkeypatch):
+        """Test que habilitar solo extensiones integradas no recorre las distribuciones"""
+        def fail(*args, **kwargs):
+            raise AssertionError("no debe descubrir extensiones")
+        monkeypatch.setattr(extension_index, 'discover', fail)
+
+        assert ExtensionManager({'extensions': ['sqlplus']}).has_extensions
+
+    def test_unknown_extension_lists_available(self, site):
+        """Test que una extensión desconocida informa también de las externas"""
+        _install(site)
+
+        with pytest.raises(ValueError, match="Extensión no registrada: liquibase"):
+            ExtensionManager({'extensions': ['liquibase']})
+
+    def test_invalid_entry_point(self, site):
+        """Test que un entry point que no apunta a un diccionario de registro se rechaza"""
+        _install(site, value="msf_flyway_ext:process_flyway")
+
+        with pytest.raises(ValueError, match="diccionario"):
+            ExtensionManager({'extensions': ['flyway']})
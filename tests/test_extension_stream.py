@@ -0,0 +1,208 @@
+"""
+Tests para el contrato de extensiones en streaming (process_stream).
+
+Verifica que stream_sqlplus produce lo mismo que process_sqlplus, que las
+extensiones se encadenan de forma perezosa y que los handlers de cadena
+completa siguen funcionando a través del adaptador.
+"""
+import pytest
+from MergeSourceFile import template_engine
+from MergeSourceFile.template_engine import ExtensionManager, TemplateEngine
+from MergeSourceFile.extensions.sqlplus import process_sqlplus, stream_sqlplus
+
+# Registro de lo que consume y emite cada extensión de prueba, en orden
+EVENTS = []
+
+
+def stream_tag(chunks, input_file, base_path, config, verbose=False):
+    """Extensión en streaming de prueba: añade una marca al final de cada línea."""
+    for n, chunk in enumerate(chunks):
+        EVENTS.append(('tag', n))
+        yield chunk.replace('\n', ' -- tag\n')
+    return {'lines': n + 1}
+
+
+def process_tag(content, input_file, base_path, config, verbose=False):
+    """Versión de cadena completa de stream_tag (no usada: hay stream_function)."""
+    raise AssertionError("process_tag no debe llamarse")
+
+
+def process_upper(content, input_file, base_path, config, verbose=False):
+    """Extensión de cadena completa de prueba: pasa el contenido a mayúsculas."""
+    if 'FAIL' in content:
+        raise ValueError("contenido no válido")
+    EVENTS.append(('upper', len(content)))
+    return content.upper(), {'chars': len(content)}
+
+
+@pytest.fixture
+def test_extensions(monkeypatch):
+    """Registra las extensiones de prueba."""
+    EVENTS.clear()
+    monkeypatch.setitem(template_engine.EXTENSION_REGISTRY, 'tag', {
+        'module': __name__, 'function': 'process_tag', 'stream_function': 'stream_tag',
+        'priority': 20, 'namespace': 'tag', 'description': 'test',
+    })
+    monkeypatch.setitem(template_engine.EXTENSION_REGISTRY, 'upper', {
+        'module': __name__, 'function': 'process_upper',
+        'priority': 15, 'namespace': 'upper', 'description': 'test',
+    })
+
+
+def _write_tree(temp_dir):
+    (temp_dir / "inc").mkdir()
+    (temp_dir / "inc" / "body.sql").write_text("SELECT &col FROM &tbl;\n{{ extra }}\n", encoding='utf-8')
+    main_file = temp_dir / "main.sql"
+    main_file.write_text(
+        "DEFINE tbl = orders\nDEFINE col = id\n@inc/body.sql\nUNDEFINE col\n-- &tbl\nEND;",
+        encoding='utf-8'
+    )
+    return main_file
+
+
+class TestStreamSqlplus:
+    """Tests para la versión en streaming de la extensión SQLPlus"""
+
+    @pytest.mark.parametrize("config", [
+        {},
+        {'process_defines': False},
+        {'process_includes': False},
+        {'process_includes': False, 'process_defines': False},
+        {'lazy_includes': True},
+        {'track_line_origins': True},
+        {'process_includes': False, 'track_line_origins': True},
+    ])
+    def test_matches_process_sqlplus(self, temp_dir, config):
+        """Test que el contenido, las variables y los orígenes coinciden con process_sqlplus"""
+        main_file = _write_tree(temp_dir)
+        content = main_file.read_text(encoding='utf-8')
+        args = (str(main_file), str(temp_dir), config)
+
+        expected = process_sqlplus(content, *args)
+        chunks = []
+        stream = stream_sqlplus(iter(content.splitlines(keepends=True)), *args)
+        while True:
+            try:
+                chunks.append(next(stream))
+            except StopIteration as stop:
+                result = stop.value
+                break
+
+        assert ''.join(chunks) == expected[0]
+        assert all(chunk.count('\n') <= 1 for chunk in chunks)
+        if config.get('track_line_origins'):
+            assert result == expected[1:]
+        else:
+            assert result == expected[1]
+
+    def test_input_not_read_when_expanding_includes(self, temp_dir):
+        """Test que con process_includes el contenido recibido no se consume"""
+        main_file = _write_tree(temp_dir)
+
+        def unread():
+            raise AssertionError("no debe consumirse")
+            yield
+
+        assert "SELECT id FROM orders;" in ''.join(stream_sqlplus(unread(), str(main_file), str(temp_dir), {}))
+
+
+class TestProcessStream:
+    """Tests para el encadenamiento perezoso de extensiones"""
+
+    def test_streaming_extensions_interleave(self, temp_dir, test_extensions):
+        """Test que cada línea atraviesa la cadena antes de leer la siguiente"""
+        main_file = _write_tree(temp_dir)
+        manager = ExtensionManager({'extensions': ['sqlplus', 'tag']})
+
+        def source():
+            raise AssertionError("sqlplus lee el archivo por su cuenta")
+            yield
+
+        stream = manager.process_stream(source(), str(main_file), str(temp_dir), {}, verbose=True)
+        first = next(iter(stream))
+        assert first == "SELECT id FROM orders; -- tag\n"
+        assert EVENTS == [('tag', 0)]
+
+        rest = ''.join(stream)
+        expected, defines = process_sqlplus('', str(main_file), str(temp_dir), {})
+        assert first + rest == expected.replace('\n', ' -- tag\n')
+        assert [event for event, _ in EVENTS] == ['tag'] * len(expected.splitlines())
+        assert stream.variables == {
+            **{f"sql_{name}": value for name, value in defines.items()},
+            'tag_lines': len(expected.splitlines()),
+        }
+
+    def test_whole_string_adapter(self, temp_dir, test_extensions):
+        """Test que un handler de cadena completa recibe la entrada unida y su salida sigue por líneas"""
+        main_file = _write_tree(temp_dir)
+        manager = ExtensionManager({'extensions': ['sqlplus', 'upper', 'tag']})
+
+        stream = manager.process_stream(iter(()), str(main_file), str(temp_dir), {})
+        content = ''.join(stream)
+
+        expected = process_sqlplus('', str(main_file), str(temp_dir), {})[0]
+        assert content == expected.upper().replace('\n', ' -- tag\n')
+        assert EVENTS[0] == ('upper', len(expected))
+        assert stream.variables['upper_chars'] == len(expected)
+        assert stream.variables['tag_lines'] == len(expected.splitlines())
+
+    def test_whole_string_error_keeps_content(self, temp_dir, test_extensions, caplog):
+        """Test que el adaptador conserva la recuperación de process_content sin verbose"""
+        manager = ExtensionManager({'extensions': ['upper', 'tag']})
+
+        stream = manager.process_stream(iter(["FAIL\n", "x"]), 'main.sql', '.', {})
+
+        assert ''.join(stream) == "FAIL -- tag\nx"
+        assert "Error ejecutando extensión 'upper'" in caplog.text
+        with pytest.raises(ValueError):
+            ''.join(manager.process_stream(iter(["FAIL"]), 'main.sql', '.', {}, verbose=True))
+
+    def test_streaming_error_propagates_with_verbose(self, temp_dir, caplog):
+        """Test que con verbose un error de una extensión en streaming se propaga"""
+        (temp_dir / "main.sql").write_text("SELECT 1;\n@missing.sql\n", encoding='utf-8')
+        manager = ExtensionManager({'extensions': ['sqlplus']})
+
+        with pytest.raises(FileNotFoundError):
+            ''.join(manager.process_stream(iter(()), str(temp_dir / "main.sql"), str(temp_dir), {},
+                                           verbose=True))
+        assert "Error ejecutando extensión 'sqlplus'" in caplog.text
+
+    def test_streaming_error_keeps_input(self, temp_dir, test_extensions, caplog):
+        """Test que sin verbose la extensión que falla deja su entrada y la cadena sigue"""
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("SELECT 1;\n@missing.sql\n", encoding='utf-8')
+        manager = ExtensionManager({'extensions': ['sqlplus', 'tag'], 'sqlplus': {'process_includes': False}})
+
+        # La entrada de sqlplus ya se había consumido en parte cuando falla
+        stream = manager.process_stream(iter(["SELECT &x;\n", "DEFINE x = 1\n", "&x\n"]),
+                                        str(main_file), str(temp_dir), {})
+
+        assert ''.join(stream) == "SELECT &x; -- tag\nDEFINE x = 1 -- tag\n&x -- tag\n"
+        assert stream.variables == {'tag_lines': 3}
+        assert "Error ejecutando extensión 'sqlplus'" in caplog.text
+
+    def test_error_without_verbose_matches_process_content(self, temp_dir, caplog):
+        """Test que sin verbose ambos caminos registran el error y devuelven el contenido sin procesar"""
+        main_file = temp_dir / "main.sql"
+        content = "DEFINE tbl = emp\nSELECT &undefined FROM &tbl;\n"
+        main_file.write_text(content, encoding='utf-8')
+        manager = ExtensionManager({'extensions': ['sqlplus']})
+
+        assert manager.process_content(content, str(main_file), str(temp_dir), {}) == (content, {})
+        stream = manager.process_stream(iter(content.splitlines(keepends=True)),
+                                        str(main_file), str(temp_dir), {})
+        assert ''.join(stream) == content
+        assert stream.variables == {}
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+        assert engine.process_file(str(main_file), {}) == content.rstrip('\n')
+        assert caplog.text.count("Error ejecutando extensión 'sqlplus'") == 3
+
+    def test_engine_uses_stream(self, temp_dir, test_extensions):
+        """Test que TemplateEngine procesa con la cadena en streaming"""
+        main_file = _write_tree(temp_dir)
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus', 'tag']}})
+
+        result = engine.process_file(str(main_file), {'extra': 'x'})
+
+        assert result.startswith("SELECT id FROM orders; -- tag\nx -- tag\n")
+        assert result.endswith(" -- tag\nEND;")
@@ -0,0 +1,260 @@
+"""
+Tests para la capa de acceso a archivos fuente.
+
+Verifica la caché de listados de directorio, la resolución de inclusiones
+con rutas de búsqueda y el uso de fuentes en memoria.
+"""
+import os
+import gzip
+import pytest
+from pathlib import Path
+from MergeSourceFile import fs
+from MergeSourceFile.fs import LocalFS, MemoryFS, IncludeResolver, search_paths_from_config
+
+
+class TestLocalFS:
+    """Tests para el acceso al disco local con caché"""
+
+    def test_existence_answered_from_listing_cache(self, temp_dir, mocker):
+        """Test que cada directorio se lista una sola vez"""
+        for name in ("a.sql", "b.sql", "c.sql"):
+            (temp_dir / name).write_text("SELECT 1;", encoding='utf-8')
+        scandir_spy = mocker.spy(fs.os, 'scandir')
+        local = LocalFS()
+
+        assert local.is_file(temp_dir / "a.sql")
+        assert local.is_file(temp_dir / "b.sql")
+        assert not local.is_file(temp_dir / "missing.sql")
+
+        assert scandir_spy.call_count == 1
+
+    def test_directories_are_not_files(self, temp_dir):
+        """Test que un directorio no cuenta como archivo incluible"""
+        (temp_dir / "subdir").mkdir()
+
+        assert not LocalFS().is_file(temp_dir / "subdir")
+
+    def test_missing_directory(self, temp_dir):
+        """Test que un directorio inexistente no produce error"""
+        assert not LocalFS().is_file(temp_dir / "nope" / "a.sql")
+
+    def test_gzip_lines_streamed(self, temp_dir):
+        """Test que un .gz se lee por líneas con la misma semántica que sin comprimir"""
+        content = "SELECT 1;\r\nSELECT 'ñ';\n\nSELECT 3;"
+        path = temp_dir / "data.sql.gz"
+        path.write_bytes(gzip.compress(content.encode('utf-8')))
+
+        assert list(LocalFS().iter_lines(path)) == content.splitlines()
+        assert LocalFS().read_text(path) == "SELECT 1;\nSELECT 'ñ';\n\nSELECT 3;"
+
+    @pytest.mark.parametrize("name, mmap_threshold", [
+        ("data.sql", fs.MMAP_THRESHOLD),
+        ("data.sql", 1),
+        ("data.sql.gz", fs.MMAP_THRESHOLD),
+    ])
+    def test_reads_record_digest_of_bytes_read(self, temp_dir, name, mmap_threshold):
+        """Test que cada forma de lectura anota el hash de los bytes almacenados y el stat"""
+        data = "SELECT 1;\r\nSELECT 'ñ';\n".encode('utf-8')
+        path = temp_dir / name
+        path.write_bytes(gzip.compress(data) if name.endswith('.gz') else data)
+        stored = path.read_bytes()
+        st = path.stat()
+
+        lines_deps, text_deps = fs.Dependencies(), fs.Dependencies()
+        list(LocalFS(mmap_threshold=mmap_threshold).iter_lines(path, lines_deps))
+        LocalFS().read_text(path, text_deps)
+
+        expected = (fs.file_digest(stored), (st.st_mtime_ns, st.st_size))
+        assert lines_deps.snapshots == {str(path): expected}
+        assert text_deps.snapshots == {str(path): expected}
+        assert lines_deps.read == [str(path)]
+
+
+class TestIncludeResolver:
+    """Tests para la resolución de inclusiones"""
+
+    def test_relative_directory_has_priority(self, temp_dir):
+        """Test que el directorio de referencia se consulta antes que las rutas de búsqueda"""
+        lib = temp_dir / "lib"
+        lib.mkdir()
+        (temp_dir / "common.sql").write_text("local", encoding='utf-8')
+        (lib / "common.sql").write_text("lib", encoding='utf-8')
+
+        resolver = IncludeResolver(LocalFS(), [str(lib)])
+
+        assert resolver.resolve("common.sql", temp_dir) == temp_dir / "common.sql"
+
+    def test_search_paths_in_order(self, temp_dir):
+        """Test que las rutas de búsqueda se recorren en orden"""
+        first = temp_dir / "first"
+        second = temp_dir / "second"
+        first.mkdir()
+        second.mkdir()
+        (second / "pkg.sql").write_text("second", encoding='utf-8')
+
+        resolver = IncludeResolver(LocalFS(), [str(first), str(second)])
+
+        assert resolver.resolve("pkg.sql", temp_dir) == second / "pkg.sql"
+
+    def test_not_found_reports_primary_candidate(self, temp_dir):
+        """Test que el error indica la ruta principal buscada"""
+        resolver = IncludeResolver(LocalFS(), [str(temp_dir / "lib")])
+
+        with pytest.raises(FileNotFoundError, match="missing.sql"):
+            resolver.resolve("missing.sql", temp_dir)
+
+    def test_gzip_fallback(self, temp_dir):
+        """Test que una inclusión sin .gz se resuelve a su versión comprimida"""
+        (temp_dir / "data.sql.gz").write_bytes(gzip.compress(b"INSERT INTO t VALUES (1);"))
+        (temp_dir / "plain.sql").write_text("plain", encoding='utf-8')
+        (temp_dir / "plain.sql.gz").write_bytes(gzip.compress(b"gz"))
+
+        resolver = IncludeResolver(LocalFS())
+
+        assert resolver.resolve("data.sql", temp_dir) == temp_dir / "data.sql.gz"
+        assert resolver.resolve("plain.sql", temp_dir) == temp_dir / "plain.sql"
+
+    def test_sqlpath_from_environment(self):
+        """Test que SQLPATH se añade tras search_paths si está habilitado"""
+        environ = {'SQLPATH': os.pathsep.join(["/opt/sql", "/usr/share/sql"])}
+
+        assert search_paths_from_config({'search_paths': ["lib"]}, environ) == ["lib"]
+        assert search_paths_from_config(
+            {'search_paths': ["lib"], 'use_sqlpath_env': True}, environ
+        ) == ["lib", "/opt/sql", "/usr/share/sql"]
+
+
+class TestPluggableSources:
+    """Tests de inclusiones SQLPlus sobre fuentes alternativas"""
+
+    def test_includes_from_memory_fs(self):
+        """Test que las inclusiones se resuelven contra un MemoryFS"""
+        from MergeSourceFile.extensions.sqlplus import _read_file_recursive
+
+        memory = MemoryFS({
+            "/src/main.sql": "@tables/t1.sql\n@@shared.sql\nCOMMIT;",
+            "/src/tables/t1.sql": "CREATE TABLE t1 (id NUMBER);",
+            "/src/shared.sql": "SELECT 'shared' FROM dual;",
+        })
+
+        content = _read_file_recursive("/src/main.sql", Path("/src"), 0, False,
+                                       resolver=IncludeResolver(memory))
+
+        assert content == (
+            "CREATE TABLE t1 (id NUMBER);\n\n"
+            "SELECT 'shared' FROM dual;\n\n"
+            "COMMIT;\n"
+        )
+
+    def test_search_paths_in_sqlplus_config(self, temp_dir):
+        """Test integración de search_paths en la extensión SQLPlus"""
+        from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+        lib = temp_dir / "lib"
+        lib.mkdir()
+        (lib / "pkg_spec.sql").write_text("CREATE PACKAGE p AS END;", encoding='utf-8')
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("@pkg_spec.sql", encoding='utf-8')
+
+        content, _ = process_sqlplus(
+            content="",
+            input_file=str(main_file),
+            base_path=str(temp_dir),
+            config={'process_includes': True, 'process_defines': False, 'search_paths': [str(lib)]},
+            verbose=False
+        )
+
+        assert "CREATE PACKAGE p AS END;" in content
+
+
+    def test_gzip_includes_in_sqlplus(self, temp_dir):
+        """Test que @ incluye archivos .gz descomprimiéndolos al vuelo"""
+        from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+        (temp_dir / "seed.sql.gz").write_bytes(gzip.compress(b"INSERT INTO t VALUES ('&env');\n"))
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("DEFINE env='prod'\n@seed.sql\n@@seed.sql.gz", encoding='utf-8')
+
+        content, _ = process_sqlplus(
+            content="",
+            input_file=str(main_file),
+            base_path=str(temp_dir),
+            config={'process_includes': True, 'process_defines': True, 'splice_inert_files': True},
+            verbose=False
+        )
+
+        assert content.count("INSERT INTO t VALUES ('prod');") == 2
+
+
+class TestZipBundles:
+    """Tests de lectura de fuentes desde paquetes .zip"""
+
+    def _make_bundle(self, temp_dir, files):
+        import zipfile
+        bundle = temp_dir / "sources.zip"
+        with zipfile.ZipFile(bundle, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+        return bundle
+
+    def test_zip_fs_uses_central_directory(self, temp_dir):
+        """Test existencia, tamaño y lectura de miembros del paquete"""
+        from MergeSourceFile.fs import ZipFS
+
+        bundle = self._make_bundle(temp_dir, {"sql/a.sql": "SELECT 1;\r\nSELECT 2;"})
+        zip_fs = ZipFS(str(bundle))
+
+        assert zip_fs.is_file(Path("sql/a.sql"))
+        assert zip_fs.is_file(Path("sql") / ".." / "sql" / "a.sql")
+        assert not zip_fs.is_file(Path("sql"))
+        assert not zip_fs.is_file(Path("../sql/a.sql"))
+        assert zip_fs.size(Path("sql/a.sql")) == len(b"SELECT 1;\r\nSELECT 2;")
+        assert zip_fs.read_text(Path("sql/a.sql")) == "SELECT 1;\nSELECT 2;"
+        assert list(zip_fs.iter_lines(Path("sql/a.sql"))) == ["SELECT 1;", "SELECT 2;"]
+
+    def test_bundle_opened_once(self, temp_dir):
+        """Test que el paquete se reutiliza mientras no cambie"""
+        from MergeSourceFile.fs import open_source_fs
+
+        bundle = self._make_bundle(temp_dir, {"a.sql": "SELECT 1;"})
+
+        assert open_source_fs(str(bundle)) is open_source_fs(str(bundle))
+
+    def test_sqlplus_includes_from_bundle(self, temp_dir, monkeypatch):
+        """Test que la extensión SQLPlus resuelve @ y @@ dentro del paquete"""
+        from MergeSourceFile.template_engine import TemplateEngine
+
+        bundle = self._make_bundle(temp_dir, {
+            "install/main.sql": "@tables/t1.sql\n@@grants.sql\nSELECT '{{ env }}' FROM dual;",
+            "install/tables/t1.sql": "CREATE TABLE t1 (id NUMBER);",
+            "install/grants.sql": "GRANT SELECT ON t1 TO app;",
+        })
+        monkeypatch.chdir(temp_dir)
+
+        engine = TemplateEngine({
+            'project': {'input': 'install/main.sql', 'output': 'out.sql'},
+            'jinja2': {'extensions': ['sqlplus'], 'source_bundle': str(bundle),
+                       'sqlplus': {'process_defines': False}}
+        })
+        result = engine.process_file('install/main.sql', {'env': 'prod'})
+
+        assert "CREATE TABLE t1 (id NUMBER);" in result
+        assert "GRANT SELECT ON t1 TO app;" in result
+        assert "SELECT 'prod' FROM dual;" in result
+        # Nada se extrae a disco
+        assert sorted(p.name for p in temp_dir.iterdir()) == ["sources.zip"]
+
+    def test_jinja2_includes_from_bundle(self, temp_dir, monkeypatch):
+        """Test que los includes de Jinja2 se leen del paquete"""
+        from MergeSourceFile.template_engine import TemplateEngine
+
+        bundle = self._make_bundle(temp_dir, {
+            "main.sql": '{% include "parts/header.sql" %}\nSELECT 1 FROM dual;',
+            "parts/header.sql": "-- Header {{ version }}",
+        })
+        monkeypatch.chdir(temp_dir)
+
+        engine = TemplateEngine({'jinja2': {'source_bundle': str(bundle)}})
+        result = engine.process_file('main.sql', {'version': '2.0'})
+
+        assert result == "-- Header 2.0\nSELECT 1 FROM dual;"
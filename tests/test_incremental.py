@@ -0,0 +1,197 @@
+"""
+Tests para la reconstrucción incremental a nivel de variable.
+
+Verifica que un objetivo solo se vuelve a renderizar cuando cambian sus
+fuentes o las variables que referencia, en todos los modos de salida.
+"""
+import json
+import os
+import pytest
+from MergeSourceFile import incremental
+from MergeSourceFile.core import main
+from MergeSourceFile.incremental import VariableRecorder, state_path_for
+
+
+def _write_project(temp_dir, write_config, mode=None, sqlplus=None, extensions=("sqlplus",), jinja2=None):
+    (temp_dir / "main.sql").write_text(
+        "DEFINE t='emp'\n@@part.sql\nSELECT '{{ env }}' FROM {{ schema }}.&t;\n"
+        "{% if flag %}{{ only_if_flag }}{% endif %}\n",
+        encoding='utf-8'
+    )
+    (temp_dir / "part.sql").write_text("-- part {{ part_var }}", encoding='utf-8')
+    _write_vars(temp_dir)
+    return write_config(
+        project={'incremental': True, **(mode or {})},
+        jinja2={'extensions': list(extensions), 'variables_file': temp_dir / "vars.yaml", 'env_prefix': "",
+                **(jinja2 or {})},
+        sqlplus=sqlplus or {},
+    )
+
+
+def _write_vars(temp_dir, **changes):
+    values = dict(env='dev', schema='app', unused=1, flag=False, only_if_flag=0, part_var='x')
+    values.update(changes)
+    (temp_dir / "vars.yaml").write_text(
+        ''.join(f"{k}: {json.dumps(v)}\n" for k, v in values.items()), encoding='utf-8'
+    )
+
+
+def _build(config_file, caplog):
+    caplog.clear()
+    assert main(str(config_file)) == 0
+    return "Procesamiento omitido" not in caplog.text
+
+
+@pytest.fixture
+def caplog_info(caplog):
+    caplog.set_level("INFO")
+    return caplog
+
+
+class TestVariableDependencies:
+    """Tests para la dependencia de cada objetivo de sus variables"""
+
+    @pytest.mark.parametrize("mode, sqlplus", [
+        ({}, {}),
+        ({'streaming_output': True}, {}),
+        ({'pipeline_stages': True}, {}),
+        ({}, {'lazy_includes': True}),
+    ])
+    def test_only_referenced_variables_rebuild(self, temp_dir, write_config, caplog_info, mode, sqlplus):
+        """Test que cambiar una variable no referenciada no reconstruye el objetivo"""
+        config_file = _write_project(temp_dir, write_config, mode, sqlplus)
+
+        assert _build(config_file, caplog_info)
+        assert not _build(config_file, caplog_info)
+
+        _write_vars(temp_dir, unused=2)
+        assert not _build(config_file, caplog_info)
+
+        _write_vars(temp_dir, unused=2, part_var='y')
+        assert _build(config_file, caplog_info)
+        assert "cambió variable 'part_var'" in caplog_info.text
+        assert "-- part y" in (temp_dir / "out.sql").read_text(encoding='utf-8')
+
+    def test_static_and_runtime_names_recorded(self, temp_dir, write_config, caplog_info):
+        """Test que se registran los nombres de ramas no ejecutadas y de includes Jinja2"""
+        config_file = _write_project(temp_dir, write_config, extensions=())
+        (temp_dir / "main.sql").write_text(
+            "{% if flag %}{{ only_if_flag }}{% endif %}{% include 'sub.sql' %}", encoding='utf-8'
+        )
+        (temp_dir / "sub.sql").write_text("{{ env }}", encoding='utf-8')
+
+        assert _build(config_file, caplog_info)
+        state = json.loads(state_path_for(temp_dir / "out.sql").read_text(encoding='utf-8'))
+        # flag y only_if_flag (jinja2.meta), env (solo en el include, en ejecución)
+        assert {'flag', 'only_if_flag', 'env'} <= set(state['variables'])
+        assert 'unused' not in state['variables']
+        assert any(path.endswith('sub.sql') for path, *_ in state['files'])
+
+        _write_vars(temp_dir, only_if_flag=1)
+        assert _build(config_file, caplog_info)
+        _write_vars(temp_dir, only_if_flag=1, env='prod')
+        assert _build(config_file, caplog_info)
+        assert (temp_dir / "out.sql").read_text(encoding='utf-8') == "prod"
+
+    def test_recorder_tracks_lookups(self):
+        """Test que VariableRecorder anota también los nombres que no existen"""
+        recorder = VariableRecorder({'a': 1})
+
+        assert 'b' not in recorder
+        assert recorder['a'] == 1
+        assert recorder.read == {'a', 'b'}
+
+
+class TestSourceDependencies:
+    """Tests para la dependencia de cada objetivo de sus fuentes"""
+
+    def test_source_change_rebuilds(self, temp_dir, write_config, caplog_info):
+        """Test que modificar un archivo incluido reconstruye el objetivo"""
+        config_file = _write_project(temp_dir, write_config)
+        assert _build(config_file, caplog_info)
+
+        # Mismo contenido con otro mtime: no reconstruye
+        part = temp_dir / "part.sql"
+        stat = part.stat()
+        os.utime(part, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert not _build(config_file, caplog_info)
+
+        part.write_text("-- otra parte", encoding='utf-8')
+        assert _build(config_file, caplog_info)
+        assert "cambió fuentes" in caplog_info.text
+
+    @pytest.mark.parametrize("mode, sqlplus, extensions", [
+        ({}, {}, ("sqlplus",)),
+        ({'streaming_output': True}, {}, ("sqlplus",)),
+        ({'pipeline_stages': True}, {}, ("sqlplus",)),
+        ({}, {'lazy_includes': True}, ("sqlplus",)),
+        ({}, {}, ()),
+    ])
+    def test_change_after_read_rebuilds(self, temp_dir, write_config, caplog_info, monkeypatch,
+                                        mode, sqlplus, extensions):
+        """Test que el estado registra los bytes leídos, no los que hay al guardarlo"""
+        config_file = _write_project(temp_dir, write_config, mode, sqlplus, extensions)
+        if not extensions:
+            (temp_dir / "main.sql").write_text("{% include 'part.sql' %}", encoding='utf-8')
+        part = temp_dir / "part.sql"
+        save_state = incremental.save_state
+
+        def edit_then_save(*args, **kwargs):
+            # Otro proceso modifica la fuente entre la lectura y el guardado del estado
+            part.write_text("-- parte nueva", encoding='utf-8')
+            save_state(*args, **kwargs)
+
+        monkeypatch.setattr(incremental, 'save_state', edit_then_save)
+        assert _build(config_file, caplog_info)
+        assert "-- part x" in (temp_dir / "out.sql").read_text(encoding='utf-8')
+        monkeypatch.setattr(incremental, 'save_state', save_state)
+
+        assert _build(config_file, caplog_info)
+        assert "cambió fuentes" in caplog_info.text
+        assert "-- parte nueva" in (temp_dir / "out.sql").read_text(encoding='utf-8')
+
+    def test_extension_cache_hit_keeps_sources(self, temp_dir, write_config, caplog_info):
+        """Test que con la caché de extensiones las fuentes se registran también en un acierto"""
+        config_file = _write_project(temp_dir, write_config, jinja2={'extension_cache': True})
+        assert _build(config_file, caplog_info)
+
+        _write_vars(temp_dir, env='prod')
+        assert _build(config_file, caplog_info)
+        assert "reutilizado de la caché" in caplog_info.text
+        state = json.loads(state_path_for(temp_dir / "out.sql").read_text(encoding='utf-8'))
+        assert any(path.endswith('part.sql') for path, *_ in state['files'])
+
+        (temp_dir / "part.sql").write_text("-- otra parte", encoding='utf-8')
+        assert _build(config_file, caplog_info)
+
+    def test_new_include_candidate_rebuilds(self, temp_dir, write_config, caplog_info):
+        """Test que aparecer un archivo que antes no existía en la búsqueda reconstruye"""
+        lib = temp_dir / "lib"
+        lib.mkdir()
+        (lib / "part.sql").write_text("-- lib", encoding='utf-8')
+        config_file = _write_project(temp_dir, write_config, sqlplus={'search_paths': [lib]})
+        (temp_dir / "part.sql").unlink()
+        assert _build(config_file, caplog_info)
+        assert not _build(config_file, caplog_info)
+
+        (temp_dir / "part.sql").write_text("-- local", encoding='utf-8')
+        assert _build(config_file, caplog_info)
+        assert "-- local" in (temp_dir / "out.sql").read_text(encoding='utf-8')
+
+    def test_missing_output_rebuilds(self, temp_dir, write_config, caplog_info):
+        """Test que sin la salida (o con la salida modificada) se reconstruye"""
+        config_file = _write_project(temp_dir, write_config)
+        assert _build(config_file, caplog_info)
+
+        (temp_dir / "out.sql").unlink()
+        assert _build(config_file, caplog_info)
+        (temp_dir / "out.sql").write_text("editado a mano", encoding='utf-8')
+        assert _build(config_file, caplog_info)
+        assert "editado" not in (temp_dir / "out.sql").read_text(encoding='utf-8')
+
+    def test_disabled_by_default(self, temp_dir, write_config):
+        """Test que sin incremental no se escribe estado"""
+        config_file = _write_project(temp_dir, write_config, {'incremental': False})
+
+        assert main(str(config_file)) == 0
+        assert not state_path_for(temp_dir / "out.sql").exists()
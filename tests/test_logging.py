@@ -0,0 +1,115 @@
+"""
+Tests para el logging del CLI y de las rutas calientes.
+
+Verifica que --async-logging escribe el log desde un hilo y lo vacía al
+terminar, y que los mensajes DEBUG por línea no se formatean si el nivel
+DEBUG está deshabilitado.
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from logging.handlers import QueueHandler
+from MergeSourceFile import core
+from MergeSourceFile.core import cli
+from MergeSourceFile.extensions import sqlplus
+from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+
+@contextmanager
+def bare_root_logger():
+    """
+    Logger raíz sin handlers, como en una ejecución real del CLI.
+    
+    pytest instala sus handlers de captura en cada fase, así que se retiran
+    dentro del propio test y no en un fixture.
+    """
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    for handler in saved_handlers:
+        root.removeHandler(handler)
+    yield root
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    for handler in saved_handlers:
+        root.addHandler(handler)
+    root.setLevel(saved_level)
+
+
+def _write_project(temp_dir, write_config):
+    (temp_dir / "header.sql").write_text("-- Header", encoding='utf-8')
+    (temp_dir / "main.sql").write_text(
+        "DEFINE schema='app'\n@header.sql\nSELECT '&schema' FROM dual;", encoding='utf-8'
+    )
+    return write_config(jinja2={'extensions': ["sqlplus"]})
+
+
+class TestAsyncLogging:
+    """Tests para el modo --async-logging del CLI"""
+
+    def test_log_written_and_flushed(self, temp_dir, write_config, capsys):
+        """Test que el log llega completo a stdout y el listener se detiene al salir"""
+        config_file = _write_project(temp_dir, write_config)
+        threads_before = threading.active_count()
+
+        with bare_root_logger():
+            assert cli([str(config_file), "--async-logging"]) == 0
+
+        out = capsys.readouterr().out
+        assert "|-- main.sql" in out
+        assert "    |-- header.sql" in out
+        # El último mensaje de main() sale antes de que cli() termine
+        assert "Procesamiento completado" in out
+        assert core._log_queue is None and core._log_listener is None
+        assert threading.active_count() == threads_before
+
+    def test_stdout_handler_restored(self, temp_dir, write_config, capsys):
+        """Test que al terminar el logger raíz vuelve a escribir directamente en stdout"""
+        config_file = _write_project(temp_dir, write_config)
+
+        with bare_root_logger() as root:
+            assert cli([str(config_file), "--async-logging"]) == 0
+            assert root.handlers
+            assert not any(isinstance(h, QueueHandler) for h in root.handlers)
+            capsys.readouterr()
+            logging.getLogger("MergeSourceFile.test").info("después del CLI")
+        assert "después del CLI" in capsys.readouterr().out
+
+    def test_verbose_format_applied_once(self, temp_dir, write_config, capsys):
+        """Test que en modo verbose el prefijo [NIVEL] nombre: no se duplica"""
+        config_file = _write_project(temp_dir, write_config)
+        config_file.write_text(config_file.read_text(encoding='utf-8').replace(
+            "[project]\n", "[project]\nverbose = true\n"), encoding='utf-8')
+
+        with bare_root_logger():
+            assert cli([str(config_file), "--async-logging"]) == 0
+
+        lines = [l for l in capsys.readouterr().out.splitlines() if "header.sql" in l]
+        assert lines
+        assert all(l.count("[INFO]") + l.count("[DEBUG]") == 1 for l in lines)
+
+
+class TestHotPathLogging:
+    """Tests para los mensajes DEBUG por línea de la extensión SQLPlus"""
+
+    def test_debug_not_called_when_disabled(self, sql_with_includes, monkeypatch):
+        """Test que sin DEBUG no se llama a logger.debug por línea"""
+        calls = []
+        monkeypatch.setattr(sqlplus.logger, 'debug', lambda *a, **k: calls.append(a))
+        sqlplus.logger.setLevel(logging.INFO)
+        try:
+            main = sql_with_includes['main']
+            content = main.read_text(encoding='utf-8') + "DEFINE x='1'\nSELECT &x FROM dual;\n"
+            main.write_text(content, encoding='utf-8')
+            process_sqlplus(content, str(main), str(main.parent), {})
+        finally:
+            sqlplus.logger.setLevel(logging.NOTSET)
+        assert calls == []
+
+    def test_debug_messages_when_enabled(self, sample_sql_file, caplog):
+        """Test que con DEBUG los mensajes por línea siguen emitiéndose"""
+        with caplog.at_level(logging.DEBUG, logger=sqlplus.logger.name):
+            content = sample_sql_file.read_text(encoding='utf-8')
+            process_sqlplus(content, str(sample_sql_file), str(sample_sql_file.parent), {})
+        assert "Procesando línea: SELECT '&var1' as col1, '&var2' as col2 FROM dual;" in caplog.text
+        assert "Definiendo variable: var1 = valor1" in caplog.text
+        assert "Reemplazando variable var1 con valor valor1 en línea 5" in caplog.text
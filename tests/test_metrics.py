@@ -0,0 +1,123 @@
+"""
+Tests para la instrumentación de etapas y contadores.
+
+Verifica el informe JSON de --metrics y que la instrumentación
+no hace nada fuera de una recolección activa.
+"""
+import json
+import pytest
+from MergeSourceFile import metrics
+from MergeSourceFile.core import cli
+
+
+class TestMetricsCollector:
+    """Tests para el recolector de métricas"""
+
+    def test_disabled_by_default(self):
+        """Test que sin recolección activa stage() y count() no registran nada"""
+        assert not metrics.enabled()
+        assert metrics.stage("a") is metrics.stage("b")
+        metrics.count("files_read")
+
+    def test_stages_and_counters_accumulate(self):
+        """Test que las etapas y contadores se acumulan por nombre"""
+        with metrics.collect_metrics() as collected:
+            for _ in range(2):
+                with metrics.stage("render"):
+                    pass
+            metrics.count("bytes_in", 10)
+            metrics.count("bytes_in", 5)
+
+        report = collected.to_dict()
+        assert report['stages']['render']['calls'] == 2
+        assert report['counters'] == {'bytes_in': 15}
+        assert not metrics.enabled()
+
+
+class TestMetricsCLI:
+    """Tests de integración de la opción --metrics"""
+
+    def _write_project(self, temp_dir, write_config, streaming=False):
+        (temp_dir / "header.sql").write_text("-- Header", encoding='utf-8')
+        (temp_dir / "main.sql").write_text(
+            "DEFINE schema='app'\n@header.sql\nSELECT '&schema', '{{ env }}' FROM dual;",
+            encoding='utf-8'
+        )
+        (temp_dir / "vars.yaml").write_text("env: prod\n", encoding='utf-8')
+        return write_config(
+            project={'streaming_output': streaming},
+            jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+        )
+
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_metrics_report(self, temp_dir, write_config, streaming):
+        """Test que --metrics escribe tiempos por etapa y contadores"""
+        config_file = self._write_project(temp_dir, write_config, streaming)
+        report_file = temp_dir / "metrics.json"
+
+        assert cli([str(config_file), "--metrics", str(report_file)]) == 0
+
+        report = json.loads(report_file.read_text(encoding='utf-8'))
+        assert set(report['stages']) >= {
+            'config_load', 'variables_load', 'extension:sqlplus', 'include_read',
+            'define_substitution', 'jinja2_compile', 'jinja2_render', 'output_write',
+        }
+        for entry in report['stages'].values():
+            assert entry['calls'] >= 1
+            assert entry['wall_s'] >= 0 and entry['cpu_s'] >= 0
+        # main.sql y header.sql: la extensión lee el archivo principal y no se lee dos veces
+        assert report['counters']['files_read'] == 2
+        assert report['counters']['substitutions'] == 1
+        assert report['counters']['bytes_out'] == (temp_dir / "out.sql").stat().st_size
+
+    def test_sidecar_files_not_in_bytes_out(self, temp_dir, write_config):
+        """Test que bytes_out cuenta solo la salida y los archivos auxiliares van aparte"""
+        self._write_project(temp_dir, write_config)
+        config_file = write_config(
+            project={'source_map': True, 'statement_index': True, 'incremental': True},
+            jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+        )
+        report_file = temp_dir / "metrics.json"
+
+        assert cli([str(config_file), "--metrics", str(report_file)]) == 0
+
+        counters = json.loads(report_file.read_text(encoding='utf-8'))['counters']
+        sidecars = [p for p in temp_dir.iterdir() if p.name.startswith("out.sql.") and p.suffix == ".json"]
+        assert len(sidecars) == 3
+        assert counters['bytes_out'] == (temp_dir / "out.sql").stat().st_size
+        assert counters['sidecar_bytes_out'] == sum(p.stat().st_size for p in sidecars)
+
+    def test_without_metrics_option(self, temp_dir, write_config):
+        """Test que sin --metrics no se escribe ningún informe"""
+        config_file = self._write_project(temp_dir, write_config)
+
+        assert cli([str(config_file)]) == 0
+        assert not list(temp_dir.glob("*.json"))
+
+
+class TestTraceExport:
+    """Tests para la exportación de trazas Chrome trace-event"""
+
+    def test_trace_nests_includes_and_stages(self, temp_dir, write_config):
+        """Test que la traza contiene spans de inclusiones anidados y de etapas"""
+        (temp_dir / "leaf.sql").write_text("SELECT 1 FROM dual;", encoding='utf-8')
+        (temp_dir / "mid.sql").write_text("@@leaf.sql", encoding='utf-8')
+        (temp_dir / "main.sql").write_text("@mid.sql\nSELECT 2 FROM dual;", encoding='utf-8')
+        config_file = write_config(project={'streaming_output': True}, jinja2={'extensions': ["sqlplus"]})
+        trace_file = temp_dir / "trace.json"
+
+        assert cli([str(config_file), "--trace", str(trace_file)]) == 0
+
+        events = json.loads(trace_file.read_text(encoding='utf-8'))['traceEvents']
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        assert {'main.sql', 'mid.sql', 'leaf.sql', 'define_substitution',
+                'jinja2_compile', 'output_write'} <= set(spans)
+        # Cada inclusión queda dentro del intervalo de su padre
+        for child, parent in (('leaf.sql', 'mid.sql'), ('mid.sql', 'main.sql')):
+            assert spans[parent]['ts'] <= spans[child]['ts'] + 1e-3
+            assert spans[child]['ts'] + spans[child]['dur'] <= spans[parent]['ts'] + spans[parent]['dur'] + 1e-3
+        assert spans['leaf.sql']['args']['depth'] == 2
+        lanes = [e['args']['name'] for e in events if e['ph'] == 'M']
+        assert lanes == [f"msf: {str(temp_dir / 'out.sql').replace(chr(92), '/')}"]
+        # El renderizado en streaming genera un único span, no uno por fragmento
+        assert [e['name'] for e in events if e['ph'] == 'X'].count('jinja2_render') == 1
@@ -0,0 +1,64 @@
+"""
+Tests de rendimiento deterministas por número de operaciones.
+
+Procesa los corpus de referencia de benchmarks.opcounts y verifica que los
+contadores de aperturas, stat, bytes decodificados, expresiones regulares,
+concatenaciones y compilaciones Jinja2 no superan sus cotas.
+"""
+import pytest
+from MergeSourceFile import template_engine
+from MergeSourceFile.fs import LocalFS
+from MergeSourceFile.template_engine import TemplateEngine
+from benchmarks.opcounts import BUDGETS, REFERENCE_CORPORA, check_budget, count_operations
+
+
+class TestOperationBudgets:
+    """Tests para los presupuestos de operaciones"""
+
+    @pytest.mark.parametrize("name", list(REFERENCE_CORPORA))
+    def test_reference_corpus_within_budget(self, temp_dir, name):
+        """Test que cada corpus de referencia respeta su presupuesto"""
+        counters = count_operations(name, temp_dir)
+
+        assert check_budget(counters, BUDGETS[name]) == []
+        assert counters['jinja_compiles'] == 1
+
+    def test_reread_exceeds_budget(self, temp_dir, monkeypatch):
+        """Test que releer los archivos fuente supera el presupuesto de aperturas"""
+        read_bytes = LocalFS.read_bytes
+
+        def read_twice(self, path):
+            read_bytes(self, path)
+            return read_bytes(self, path)
+        monkeypatch.setattr(LocalFS, 'read_bytes', read_twice)
+
+        violations = check_budget(count_operations('deep_chain', temp_dir), BUDGETS['deep_chain'])
+
+        assert violations == ['file_opens: 40 > 20']
+
+    def test_recompile_exceeds_budget(self, temp_dir, monkeypatch):
+        """Test que recompilar la plantilla supera el presupuesto de compilaciones"""
+        compile_template = TemplateEngine._compile_template
+
+        def compile_twice(self, *args, **kwargs):
+            compile_template(self, *args, **kwargs)
+            return compile_template(self, *args, **kwargs)
+        monkeypatch.setattr(TemplateEngine, '_compile_template', compile_twice)
+
+        violations = check_budget(count_operations('jinja_loop', temp_dir), BUDGETS['jinja_loop'])
+
+        assert violations == ['jinja_compiles: 2 > 1']
+
+    def test_rejoin_exceeds_budget(self, temp_dir, monkeypatch):
+        """Test que reunir dos veces el contenido expandido supera el presupuesto de concatenaciones"""
+        join_chunks = template_engine._join_chunks
+
+        def join_twice(chunks):
+            pieces = list(chunks)
+            join_chunks(pieces)
+            return join_chunks(pieces)
+        monkeypatch.setattr(template_engine, '_join_chunks', join_twice)
+
+        violations = check_budget(count_operations('deep_chain', temp_dir), BUDGETS['deep_chain'])
+
+        assert violations == ['string_concats: 278 > 139']
@@ -0,0 +1,240 @@
+"""
+Tests para la escritura de la salida.
+
+Verifica la escritura atómica y que la salida solo se reemplaza
+cuando su contenido cambia.
+"""
+import os
+import pytest
+import yaml
+from pathlib import Path
+from MergeSourceFile.core import main
+from MergeSourceFile.output import files_equal, write_if_changed, create_backup, _copy_file
+
+
+class TestFilesEqual:
+    """Tests para la comparación por bloques"""
+
+    def test_identical_files(self, temp_dir):
+        """Test que archivos idénticos se consideran iguales"""
+        a = temp_dir / "a.sql"
+        b = temp_dir / "b.sql"
+        a.write_bytes(b"SELECT 1 FROM dual;\n" * 1000)
+        b.write_bytes(b"SELECT 1 FROM dual;\n" * 1000)
+
+        assert files_equal(a, b, chunk_size=64)
+
+    def test_same_size_different_content(self, temp_dir):
+        """Test que se detecta una diferencia en el último bloque"""
+        a = temp_dir / "a.sql"
+        b = temp_dir / "b.sql"
+        a.write_bytes(b"x" * 1000 + b"A")
+        b.write_bytes(b"x" * 1000 + b"B")
+
+        assert not files_equal(a, b, chunk_size=64)
+
+    def test_different_size(self, temp_dir):
+        """Test que archivos de distinto tamaño son distintos"""
+        a = temp_dir / "a.sql"
+        b = temp_dir / "b.sql"
+        a.write_bytes(b"SELECT 1;")
+        b.write_bytes(b"SELECT 1;\n")
+
+        assert not files_equal(a, b)
+
+
+class TestWriteIfChanged:
+    """Tests para la escritura atómica condicional"""
+
+    def test_creates_new_file(self, temp_dir):
+        """Test que se crea la salida si no existe"""
+        output = temp_dir / "build" / "out.sql"
+
+        assert write_if_changed(output, ["SELECT ", "1;"]) is True
+        assert output.read_text(encoding='utf-8') == "SELECT 1;"
+
+    def test_unchanged_content_keeps_file(self, temp_dir):
+        """Test que una salida idéntica no se reemplaza"""
+        output = temp_dir / "out.sql"
+        output.write_text("SELECT 1;", encoding='utf-8')
+        os.utime(output, ns=(1_000_000_000, 1_000_000_000))
+        inode = output.stat().st_ino
+
+        assert write_if_changed(output, ["SELECT 1;"]) is False
+        assert output.stat().st_mtime_ns == 1_000_000_000
+        assert output.stat().st_ino == inode
+        # No deben quedar temporales
+        assert [p.name for p in temp_dir.iterdir()] == ["out.sql"]
+
+    def test_changed_content_replaces_file(self, temp_dir):
+        """Test que una salida distinta se reemplaza y se invoca el callback"""
+        output = temp_dir / "out.sql"
+        output.write_text("SELECT 1;", encoding='utf-8')
+        calls = []
+
+        assert write_if_changed(output, ["SELECT 2;"], before_replace=calls.append) is True
+        assert output.read_text(encoding='utf-8') == "SELECT 2;"
+        assert calls == [output]
+
+    def test_error_while_rendering_discards_temp(self, temp_dir):
+        """Test que un error durante la escritura no deja temporales ni toca la salida"""
+        output = temp_dir / "out.sql"
+        output.write_text("original", encoding='utf-8')
+
+        def failing_chunks():
+            yield "partial"
+            raise RuntimeError("fallo de render")
+
+        with pytest.raises(RuntimeError):
+            write_if_changed(output, failing_chunks())
+
+        assert output.read_text(encoding='utf-8') == "original"
+        assert [p.name for p in temp_dir.iterdir()] == ["out.sql"]
+
+
+class TestBackups:
+    """Tests para los backups con rotación"""
+
+    def test_backup_is_linked_not_copied(self, temp_dir):
+        """Test que el backup es un enlace duro a la salida, que sigue en su sitio"""
+        output = temp_dir / "out.sql"
+        output.write_text("v1", encoding='utf-8')
+        inode = output.stat().st_ino
+
+        backup = create_backup(output)
+
+        assert backup == temp_dir / "out.sql.bak"
+        assert output.stat().st_ino == inode
+        assert backup.stat().st_ino == inode
+        assert output.stat().st_nlink == 2
+        assert backup.read_text(encoding='utf-8') == "v1"
+
+    def test_output_never_missing_during_backup(self, temp_dir):
+        """Test que la salida existe hasta el reemplazo atómico y el backup conserva la versión anterior"""
+        output = temp_dir / "out.sql"
+        output.write_text("v1", encoding='utf-8')
+        seen = []
+
+        def hook(path):
+            create_backup(path)
+            seen.append(path.read_text(encoding='utf-8'))
+
+        write_if_changed(output, ["v2"], before_replace=hook)
+
+        assert seen == ["v1"]
+        assert output.read_text(encoding='utf-8') == "v2"
+        assert (temp_dir / "out.sql.bak").read_text(encoding='utf-8') == "v1"
+        assert output.stat().st_nlink == 1
+
+    def test_link_failure_falls_back_to_copy(self, temp_dir, monkeypatch):
+        """Test que sin enlaces duros el backup se copia"""
+        output = temp_dir / "out.sql"
+        output.write_text("v1", encoding='utf-8')
+
+        def no_link(src, dst):
+            raise OSError("enlaces duros no soportados")
+
+        monkeypatch.setattr(os, 'link', no_link)
+        backup = create_backup(output)
+
+        assert backup.read_text(encoding='utf-8') == "v1"
+        assert backup.stat().st_ino != output.stat().st_ino
+
+    def test_rotation_keeps_n_generations(self, temp_dir):
+        """Test que se conservan como máximo N generaciones"""
+        output = temp_dir / "out.sql"
+
+        for version in range(1, 6):
+            write_if_changed(output, [f"v{version}"],
+                             before_replace=lambda path: create_backup(path, count=3))
+
+        assert output.read_text(encoding='utf-8') == "v5"
+        assert (temp_dir / "out.sql.bak").read_text(encoding='utf-8') == "v4"
+        assert (temp_dir / "out.sql.bak.1").read_text(encoding='utf-8') == "v3"
+        assert (temp_dir / "out.sql.bak.2").read_text(encoding='utf-8') == "v2"
+        assert not (temp_dir / "out.sql.bak.3").exists()
+
+    def test_copy_fallback_preserves_bytes(self, temp_dir):
+        """Test que la copia por kernel preserva el contenido exacto"""
+        src = temp_dir / "src.sql"
+        dst = temp_dir / "dst.sql"
+        src.write_bytes(b"SELECT 1;\r\n" * 10000 + "ñ".encode('utf-8'))
+
+        _copy_file(src, dst)
+
+        assert dst.read_bytes() == src.read_bytes()
+
+
+class TestMainWriteIfChanged:
+    """Tests de integración de main() con salida sin cambios"""
+
+    def _write_config(self, temp_dir, write_config, create_backup=False):
+        input_file = temp_dir / "input.sql"
+        input_file.write_text("SELECT {{ value }} FROM dual;", encoding='utf-8')
+        vars_file = temp_dir / "vars.yaml"
+        vars_file.write_text(yaml.dump({'value': 42}), encoding='utf-8')
+        output_file = temp_dir / "output.sql"
+        config_file = write_config(
+            project={'input': input_file, 'output': output_file, 'create_backup': create_backup},
+            jinja2={'enabled': True, 'variables_file': vars_file},
+        )
+        return config_file, output_file
+
+    def test_second_run_reports_unchanged(self, temp_dir, write_config, caplog):
+        """Test que una segunda ejecución idéntica no modifica la salida"""
+        config_file, output_file = self._write_config(temp_dir, write_config)
+
+        assert main(str(config_file)) == 0
+        os.utime(output_file, ns=(1_000_000_000, 1_000_000_000))
+
+        caplog.clear()
+        with caplog.at_level("INFO"):
+            assert main(str(config_file)) == 0
+
+        assert output_file.stat().st_mtime_ns == 1_000_000_000
+        assert "unchanged" in caplog.text
+
+    def test_no_backup_when_unchanged(self, temp_dir, write_config):
+        """Test que no se crea backup si la salida no cambia"""
+        config_file, output_file = self._write_config(temp_dir, write_config, create_backup=True)
+
+        assert main(str(config_file)) == 0
+        assert main(str(config_file)) == 0
+
+        assert not (temp_dir / "output.sql.bak").exists()
+
+
+class TestGzipOutput:
+    """Tests para salidas comprimidas .gz"""
+
+    def test_gzip_output_roundtrip(self, temp_dir):
+        """Test que la salida .gz se comprime mientras se escribe"""
+        import gzip
+        output = temp_dir / "out.sql.gz"
+
+        assert write_if_changed(output, ["SELECT 1;\n", "SELECT 2;\n"]) is True
+
+        assert gzip.decompress(output.read_bytes()) == b"SELECT 1;\nSELECT 2;\n"
+
+    def test_gzip_output_is_deterministic(self, temp_dir):
+        """Test que el mismo contenido se detecta sin cambios en la salida comprimida"""
+        output = temp_dir / "out.sql.gz"
+
+        assert write_if_changed(output, ["SELECT 1;\n"]) is True
+        assert write_if_changed(output, ["SELECT ", "1;\n"]) is False
+        assert write_if_changed(output, ["SELECT 2;\n"]) is True
+
+    def test_splice_into_gzip_output(self, temp_dir):
+        """Test que los archivos empalmados se copian dentro del flujo comprimido"""
+        import gzip
+        from MergeSourceFile.splice import SpliceRef
+        inert = temp_dir / "ddl.sql"
+        inert.write_bytes("CREATE TABLE t (n VARCHAR2(10)); -- año\n".encode('utf-8'))
+        output = temp_dir / "out.sql.gz"
+
+        chunks = ["-- inicio\n", SpliceRef(str(inert), inert.stat().st_size, True, False), "\nfin"]
+        write_if_changed(output, chunks)
+
+        assert gzip.decompress(output.read_bytes()).decode('utf-8') == (
+            "-- inicio\nCREATE TABLE t (n VARCHAR2(10)); -- año\nfin"
+        )
@@ -0,0 +1,157 @@
+"""
+Tests para el modo pipeline (pipeline_stages).
+
+Verifica el encadenamiento de etapas en hilos (orden, errores, cierre
+anticipado) y que la salida, el mapa de origen y las variables son los
+mismos que sin pipeline para las distintas opciones de la extensión SQLPlus.
+"""
+import threading
+import pytest
+from MergeSourceFile.core import main
+from MergeSourceFile.pipeline import threaded
+from MergeSourceFile.sourcemap import map_path_for
+from MergeSourceFile.template_engine import TemplateEngine
+
+
+def _write_project(temp_dir):
+    inc = temp_dir / "inc"
+    inc.mkdir()
+    (temp_dir / "main.sql").write_text(
+        "-- main\n"
+        "DEFINE tbl = orders\n"
+        "@inc/a.sql\n"
+        "SELECT * FROM &tbl;\n"
+        "{% for i in range(3) %}\n"
+        "INSERT INTO t VALUES ({{ i }});\n"
+        "{% endfor %}\n"
+        "@inc/a.sql\n"
+        "@@inc/ddl.sql\n"
+        "SELECT '{{ sql_tbl | default('-') }}' FROM dual;\n"
+        "END;",
+        encoding='utf-8'
+    )
+    (inc / "a.sql").write_text("-- msf:once\na1 &tbl\n{{ note }}\n", encoding='utf-8')
+    (inc / "ddl.sql").write_text("".join(f"CREATE TABLE t{n} (id NUMBER);\n" for n in range(2000)), encoding='utf-8')
+    (temp_dir / "vars.yaml").write_text('note: "x\\ny"\n', encoding='utf-8')
+
+
+def _run(temp_dir, write_config, name, pipeline, sqlplus, queue_size=8):
+    output_file = temp_dir / f"{name}.sql"
+    config_file = write_config(
+        project={'output': output_file, 'source_map': True, 'pipeline_stages': pipeline,
+                 'pipeline_queue_size': queue_size},
+        jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+        sqlplus=sqlplus,
+        name=f"{name}.toml",
+    )
+    assert main(str(config_file)) == 0
+    return output_file.read_bytes(), map_path_for(output_file).read_text(encoding='utf-8')
+
+
+class TestThreaded:
+    """Tests para el encadenamiento de etapas en hilos"""
+
+    def test_preserves_order_across_batches(self):
+        """Test que los elementos llegan todos y en orden, con lotes y cola pequeños"""
+        items = threaded(iter(range(10000)), 'numbers', queue_size=1, batch_size=7)
+        chained = threaded(items, 'chained', queue_size=2, batch_size=3)
+
+        assert list(chained) == list(range(10000))
+
+    def test_runs_in_own_thread(self):
+        """Test que la etapa se ejecuta fuera del hilo consumidor"""
+        def stage():
+            yield threading.current_thread().name
+
+        assert list(threaded(stage(), 'probe')) == ['msf-pipeline-probe']
+
+    def test_error_raised_in_consumer(self):
+        """Test que una excepción de la etapa se lanza en el consumidor tras los elementos previos"""
+        def stage():
+            yield 1
+            yield 2
+            raise ValueError("fallo en la etapa")
+
+        received = []
+        with pytest.raises(ValueError, match="fallo en la etapa"):
+            for item in threaded(stage(), 'failing', batch_size=1):
+                received.append(item)
+        assert received == [1, 2]
+
+    def test_early_close_stops_producer(self):
+        """Test que abandonar el iterador detiene y cierra la etapa"""
+        closed = threading.Event()
+
+        def endless():
+            try:
+                n = 0
+                while True:
+                    yield n
+                    n += 1
+            finally:
+                closed.set()
+
+        before = threading.active_count()
+        stream = threaded(endless(), 'endless', queue_size=1, batch_size=4)
+        assert next(stream) == 0
+        stream.close()
+
+        assert closed.is_set()
+        assert threading.active_count() == before
+
+    def test_invalid_queue_size(self):
+        """Test que un tamaño de cola no positivo se rechaza"""
+        with pytest.raises(ValueError):
+            threaded(iter([]), 'empty', queue_size=0)
+
+
+class TestPipelineStages:
+    """Tests para process_file_pipeline y pipeline_stages"""
+
+    @pytest.mark.parametrize("sqlplus", [
+        {},
+        {'include_once': True},
+        {'lazy_includes': True},
+        {'process_defines': False},
+        {'splice_inert_files': True},
+        {'process_includes': False, 'process_defines': True},
+    ])
+    def test_identical_to_sequential(self, temp_dir, write_config, sqlplus):
+        """Test que la salida y el mapa de origen son los mismos que sin pipeline"""
+        _write_project(temp_dir)
+
+        expected = _run(temp_dir, write_config, "sequential", False, sqlplus)
+        pipelined = _run(temp_dir, write_config, "pipelined", True, sqlplus, queue_size=1)
+
+        assert pipelined == expected
+
+    def test_streams_output_and_joins_threads(self, temp_dir):
+        """Test que la salida se entrega por fragmentos y no quedan hilos al terminar"""
+        _write_project(temp_dir)
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+        before = threading.active_count()
+
+        chunks = engine.process_file_pipeline(str(temp_dir / "main.sql"), {'note': 'n'})
+        first = next(chunks)
+        rest = ''.join(chunks)
+
+        assert first.startswith("-- main\n")
+        assert threading.active_count() == before
+        assert "CREATE TABLE t1999 (id NUMBER);\n" in rest
+        assert "SELECT 'orders' FROM dual;" in rest
+
+    def test_extension_error_propagates(self, temp_dir, caplog):
+        """Test que un error de la extensión se registra y aborta el procesamiento"""
+        (temp_dir / "main.sql").write_text("SELECT 1;\n@missing.sql\n", encoding='utf-8')
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+
+        with pytest.raises(FileNotFoundError):
+            ''.join(engine.process_file_pipeline(str(temp_dir / "main.sql"), {}))
+        assert "Error ejecutando extensión 'sqlplus'" in caplog.text
+
+    def test_falls_back_without_pipeline_extension(self, temp_dir):
+        """Test que sin extensión con etapas se usa el procesamiento en streaming"""
+        (temp_dir / "main.sql").write_text("SELECT {{ n }};\n", encoding='utf-8')
+        engine = TemplateEngine({'jinja2': {}})
+
+        assert ''.join(engine.process_file_pipeline(str(temp_dir / "main.sql"), {'n': 1})) == "SELECT 1;"
@@ -0,0 +1,168 @@
+"""
+Tests para el perfilado de ejecuciones (--profile).
+
+Verifica el volcado pstats del perfil de CPU, el informe de memoria
+por etapa del perfil con tracemalloc y el perfil por línea de plantilla.
+"""
+import json
+import time
+import pstats
+import pytest
+import tracemalloc
+from pathlib import Path
+from MergeSourceFile import metrics
+from MergeSourceFile.core import cli
+from MergeSourceFile.profiling import MemoryMetrics, RenderProfiler, render_profiling
+
+
+def _write_project(temp_dir, write_config, project=None, extensions=()):
+    (temp_dir / "main.sql").write_text("SELECT '{{ env }}' FROM dual;", encoding='utf-8')
+    (temp_dir / "vars.yaml").write_text("env: prod\n", encoding='utf-8')
+    return write_config(project=project,
+                        jinja2={'extensions': list(extensions), 'variables_file': temp_dir / "vars.yaml"})
+
+
+class TestCpuProfile:
+    """Tests para el perfil de CPU"""
+
+    def test_pstats_dump(self, temp_dir, write_config):
+        """Test que --profile cpu vuelca estadísticas legibles por pstats"""
+        config_file = _write_project(temp_dir, write_config)
+        profile_file = temp_dir / "run.prof"
+
+        assert cli([str(config_file), "--profile", "cpu", "--profile-output", str(profile_file)]) == 0
+
+        stats = pstats.Stats(str(profile_file))
+        assert any(name == "main" for _, _, name in stats.stats)
+        assert not metrics.enabled()
+
+
+class TestMemoryProfile:
+    """Tests para el perfil de memoria"""
+
+    def test_nested_stage_peaks(self):
+        """Test que el pico de una etapa incluye el de sus sub-etapas"""
+        collector = MemoryMetrics()
+
+        def work():
+            with metrics.stage("outer"):
+                with metrics.stage("inner"):
+                    data = bytearray(2 * 1024 * 1024)
+                    del data
+            return 0
+
+        with metrics.collect_metrics(collector):
+            tracemalloc.start()
+            try:
+                work()
+            finally:
+                tracemalloc.stop()
+
+        assert collector.memory["inner"]["peak_bytes"] >= 2 * 1024 * 1024
+        assert collector.memory["outer"]["peak_bytes"] >= collector.memory["inner"]["peak_bytes"]
+
+    def test_streaming_stage_snapshots_once(self, monkeypatch):
+        """Test que una etapa en streaming registra su memoria con una instantánea al empezar y otra al terminar"""
+        collector = MemoryMetrics()
+        snapshots = []
+        take_snapshot = tracemalloc.take_snapshot
+        monkeypatch.setattr(tracemalloc, 'take_snapshot', lambda: snapshots.append(1) or take_snapshot())
+
+        def produce():
+            for _ in range(50):
+                data = bytearray(256 * 1024)
+                yield len(data)
+
+        with metrics.collect_metrics(collector):
+            tracemalloc.start()
+            try:
+                with metrics.stage("outer"):
+                    total = sum(metrics.timed("stream", produce()))
+            finally:
+                tracemalloc.stop()
+
+        assert total == 50 * 256 * 1024
+        assert collector.stages["stream"]["calls"] == 51
+        assert len(snapshots) == 4
+        assert collector.memory["stream"]["peak_bytes"] >= 256 * 1024
+        assert collector.memory["outer"]["peak_bytes"] >= collector.memory["stream"]["peak_bytes"]
+
+    def test_memory_report_per_stage(self, temp_dir, write_config):
+        """Test que --profile mem escribe pico y asignaciones por etapa"""
+        config_file = _write_project(temp_dir, write_config)
+        report_file = temp_dir / "mem.json"
+        metrics_file = temp_dir / "metrics.json"
+
+        assert cli([str(config_file), "--profile", "mem", "--profile-output", str(report_file),
+                    "--metrics", str(metrics_file)]) == 0
+
+        report = json.loads(report_file.read_text(encoding='utf-8'))
+        assert report["peak_bytes"] > 0
+        assert {"config_load", "jinja2_render", "output_write"} <= set(report["stages"])
+        assert "jinja2_render" in json.loads(metrics_file.read_text(encoding='utf-8'))["stages"]
+        assert not tracemalloc.is_tracing()
+
+    def test_streaming_stages_on_large_input(self, temp_dir, write_config):
+        """Test que --profile mem no toma instantáneas por línea en las etapas en streaming"""
+        config_file = _write_project(temp_dir, write_config, {'streaming_output': True}, ["sqlplus"])
+        lines = ["DEFINE tbl='emp'"] + [f"SELECT {i} FROM &tbl; -- {{{{ env }}}}" for i in range(3000)]
+        (temp_dir / "main.sql").write_text("\n".join(lines), encoding='utf-8')
+        report_file = temp_dir / "mem.json"
+
+        start = time.perf_counter()
+        assert cli([str(config_file), "--profile", "mem", "--profile-output", str(report_file)]) == 0
+
+        # Con dos instantáneas de tracemalloc por línea tardaba varios minutos
+        assert time.perf_counter() - start < 30
+        report = json.loads(report_file.read_text(encoding='utf-8'))
+        assert {"config_load", "include_read", "define_substitution", "extension:sqlplus",
+                "jinja2_render", "output_write"} <= set(report["stages"])
+        assert (temp_dir / "out.sql").read_text(encoding='utf-8').count("FROM emp; -- prod") == 3000
+
+
+class TestRenderProfile:
+    """Tests para el perfil de renderizado por línea de plantilla"""
+
+    def _build_tree(self, temp_dir):
+        (temp_dir / "loops.sql").write_text(
+            "-- bucle pesado\n"
+            "{% for i in range(300) %}\n"
+            "INSERT INTO t VALUES ({{ i }}, '{{ 'x' * 50 }}');\n"
+            "{% endfor %}\n",
+            encoding='utf-8'
+        )
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("DEFINE owner='app'\n-- cabecera\n@loops.sql\nCOMMIT;\n", encoding='utf-8')
+        return main_file
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    def test_hot_line_mapped_through_includes(self, temp_dir, lazy):
+        """Test que la línea más costosa se atribuye al archivo incluido y su línea"""
+        from MergeSourceFile.template_engine import TemplateEngine
+
+        main_file = self._build_tree(temp_dir)
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus'], 'sqlplus': {'lazy_includes': lazy}}})
+        profiler = RenderProfiler()
+        with render_profiling(profiler):
+            result = engine.process_file(str(main_file), {})
+
+        rows = profiler.report(top=1000)
+        by_bytes = sorted(rows, key=lambda row: row['bytes'], reverse=True)
+        hot_lines = {(Path(row['file']).name, row['line']) for row in by_bytes[:2]}
+        assert hot_lines == {("loops.sql", 2), ("loops.sql", 3)}
+        loop_bytes = sum(row['bytes'] for row in rows if Path(row['file']).name == "loops.sql")
+        assert loop_bytes >= 300 * len("INSERT INTO t VALUES (0, '');") + 300 * 50
+        assert sum(row['bytes'] for row in rows) == len(result.encode('utf-8'))
+
+    def test_render_profile_cli(self, temp_dir, write_config):
+        """Test que --profile render escribe la tabla de líneas más costosas"""
+        main_file = self._build_tree(temp_dir)
+        config_file = write_config(project={'input': main_file, 'streaming_output': True},
+                                   jinja2={'extensions': ["sqlplus"]})
+        report_file = temp_dir / "render.json"
+
+        assert cli([str(config_file), "--profile", "render", "--profile-output", str(report_file)]) == 0
+
+        rows = json.loads(report_file.read_text(encoding='utf-8'))['hot_lines']
+        assert any(Path(row['file']).name == "loops.sql" for row in rows)
+        assert (temp_dir / "out.sql").read_text(encoding='utf-8').count("INSERT INTO t") == 300
@@ -0,0 +1,153 @@
+"""
+Tests para el mapa de origen de la salida (source_map).
+
+Verifica la representación por tramos y su consulta, y que cada línea de
+la salida se mapea al archivo y línea originales a través de inclusiones
+SQLPlus (previas o diferidas), bucles Jinja2 y variables multilínea.
+"""
+import os
+import subprocess
+import sys
+import pytest
+from pathlib import Path
+from MergeSourceFile.core import main
+from MergeSourceFile.sourcemap import SourceMap, SourceMapBuilder, map_path_for, main as lookup_main
+
+
+def _write_project(temp_dir, write_config, lazy=False, streaming=False, splice=False):
+    inc = temp_dir / "inc"
+    inc.mkdir()
+    (temp_dir / "main.sql").write_text(
+        "-- main\n"
+        "DEFINE tbl = orders\n"
+        "@inc/a.sql\n"
+        "SELECT * FROM &tbl;\n"
+        "{% for i in range(3) %}\n"
+        "INSERT INTO t VALUES ({{ i }});\n"
+        "{% endfor %}\n"
+        "@inc/b.sql\n"
+        "END;\n",
+        encoding='utf-8'
+    )
+    (inc / "a.sql").write_text("a1\na2\n{{ note }}\na4\n", encoding='utf-8')
+    (inc / "b.sql").write_text("b1\nb2\n", encoding='utf-8')
+    (temp_dir / "vars.yaml").write_text('note: "x\\ny"\n', encoding='utf-8')
+    return write_config(
+        project={'source_map': True, 'streaming_output': streaming},
+        jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+        sqlplus={'lazy_includes': lazy, 'splice_inert_files': splice},
+    )
+
+
+class TestSourceMapBuilder:
+    """Tests para la construcción y consulta del mapa"""
+
+    def test_literal_runs_are_compact(self):
+        """Test que las líneas consecutivas de un archivo forman un único tramo"""
+        builder = SourceMapBuilder()
+        builder.add("".join(f"line {n}\n" for n in range(1, 10001)), "big.sql", 1)
+        builder.add("tail\n", "other.sql", 7)
+
+        source_map = builder.build()
+
+        assert len(source_map.out_start) == 2
+        assert source_map.lines == 10001
+        assert source_map.lookup(1) == ("big.sql", 1)
+        assert source_map.lookup(4321) == ("big.sql", 4321)
+        assert source_map.lookup(10001) == ("other.sql", 7)
+        assert source_map.lookup(0) is None
+        assert source_map.lookup(10002) is None
+
+    def test_expression_lines_share_origin(self):
+        """Test que las líneas de un valor multilínea apuntan a la línea de la expresión"""
+        builder = SourceMapBuilder()
+        builder.add("SELECT ", "main.sql", 3)
+        builder.add("a,\nb,\nc\n", "main.sql", 3, sequential=False)
+        builder.add("FROM t;\n", "main.sql", 4)
+
+        source_map = builder.build()
+
+        assert [source_map.lookup(n) for n in range(1, 5)] == [
+            ("main.sql", 3), ("main.sql", 3), ("main.sql", 3), ("main.sql", 4)
+        ]
+
+    def test_json_roundtrip(self, temp_dir):
+        """Test que el mapa guardado en JSON se consulta igual"""
+        builder = SourceMapBuilder()
+        builder.add("a\nb\n", "x.sql", 10)
+        builder.add("c\n", "y.sql", 1)
+        path = temp_dir / "out.sql.map.json"
+        path.write_text(builder.build().to_json(), encoding='utf-8')
+
+        loaded = SourceMap.load(path)
+
+        assert loaded.lookup(2) == ("x.sql", 11)
+        assert loaded.lookup(3) == ("y.sql", 1)
+
+
+class TestSourceMapRender:
+    """Tests del mapa de origen generado por main()"""
+
+    @pytest.mark.parametrize("lazy", [False, True])
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_lines_map_to_original_files(self, temp_dir, write_config, lazy, streaming):
+        """Test que cada línea de la salida apunta a su archivo y línea originales"""
+        config_file = _write_project(temp_dir, write_config, lazy=lazy, streaming=streaming)
+
+        assert main(str(config_file)) == 0
+
+        output = (temp_dir / "out.sql").read_text(encoding='utf-8').splitlines()
+        source_map = SourceMap.load(map_path_for(temp_dir / "out.sql"))
+        origins = {text: source_map.lookup(n) for n, text in enumerate(output, 1) if text}
+        located = {text: (Path(f).relative_to(temp_dir).as_posix(), n) for text, (f, n) in origins.items()}
+
+        assert source_map.lines == len(output)
+        assert located["-- main"] == ("main.sql", 1)
+        assert located["a2"] == ("inc/a.sql", 2)
+        assert located["x"] == ("inc/a.sql", 3)
+        assert located["y"] == ("inc/a.sql", 3)
+        assert located["a4"] == ("inc/a.sql", 4)
+        assert located["SELECT * FROM orders;"] == ("main.sql", 4)
+        assert located["INSERT INTO t VALUES (2);"] == ("main.sql", 6)
+        assert located["b2"] == ("inc/b.sql", 2)
+        assert located["END;"] == ("main.sql", 9)
+
+    def test_inert_includes_are_mapped_line_by_line(self, temp_dir, write_config):
+        """Test que con mapa de origen los archivos inertes no se empalman"""
+        config_file = _write_project(temp_dir, write_config, streaming=True, splice=True)
+
+        assert main(str(config_file)) == 0
+
+        output = (temp_dir / "out.sql").read_text(encoding='utf-8').splitlines()
+        source_map = SourceMap.load(map_path_for(temp_dir / "out.sql"))
+        origin_file, origin_line = source_map.lookup(output.index("b2") + 1)
+        assert (Path(origin_file).name, origin_line) == ("b.sql", 2)
+
+    def test_lookup_tool(self, temp_dir, write_config, capsys):
+        """Test que la herramienta de consulta acepta la salida y varias líneas"""
+        config_file = _write_project(temp_dir, write_config)
+        assert main(str(config_file)) == 0
+        capsys.readouterr()
+
+        assert lookup_main([str(temp_dir / "out.sql"), "1", "999"]) == 1
+
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0].startswith("1: ") and lines[0].endswith("main.sql:1")
+        assert lines[1].startswith("999: fuera de la salida")
+
+    def test_lookup_tool_as_module(self, temp_dir, write_config):
+        """Test que python -m MergeSourceFile.sourcemap se ejecuta sin avisos de runpy"""
+        config_file = _write_project(temp_dir, write_config)
+        assert main(str(config_file)) == 0
+        package_root = str(Path(__file__).resolve().parent.parent)
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [package_root, os.environ.get('PYTHONPATH')])))
+
+        result = subprocess.run(
+            [sys.executable, "-W", "error::RuntimeWarning", "-m", "MergeSourceFile.sourcemap",
+             str(temp_dir / "out.sql"), "1"],
+            capture_output=True, text=True, env=env
+        )
+
+        assert result.returncode == 0, result.stderr
+        assert result.stderr == ""
+        assert result.stdout.strip().endswith("main.sql:1")
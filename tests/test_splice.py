@@ -0,0 +1,211 @@
+"""
+Tests para el empalme de archivos inertes.
+
+Verifica la clasificación de archivos inertes y que la salida con empalme
+es idéntica byte a byte a la salida sin empalme.
+"""
+import os
+import pytest
+from pathlib import Path
+from MergeSourceFile.core import main
+from MergeSourceFile.splice import classify_inert, iter_splices, make_marker, SpliceRef
+
+
+class TestClassifyInert:
+    """Tests para la clasificación de archivos inertes"""
+
+    @pytest.mark.parametrize("content", [
+        b"CREATE TABLE t (id NUMBER);\n",
+        b"INSERT INTO t VALUES (1);\nINSERT INTO t VALUES (2);",
+        "-- Comentario con acentos: año\nSELECT 'ñ' FROM dual;\n".encode('utf-8'),
+    ])
+    def test_inert_files(self, temp_dir, content):
+        """Test que DDL/datos sin directivas se clasifican como inertes"""
+        path = temp_dir / "inert.sql"
+        path.write_bytes(content)
+
+        assert classify_inert(path) == (len(content), content.endswith(b"\n"))
+
+    def test_empty_file_not_inert(self, temp_dir):
+        """Test que un archivo vacío no se empalma"""
+        path = temp_dir / "empty.sql"
+        path.write_bytes(b"")
+
+        assert classify_inert(path) is None
+
+    @pytest.mark.parametrize("content", [
+        b"SELECT '&var' FROM dual;\n",
+        b"@other.sql\n",
+        b"SELECT 1;\n@@other.sql\n",
+        b"DEFINE x=1\n",
+        b"  undefine x;\n",
+        b"SELECT {{ value }};\n",
+        b"{% if x %}\n",
+        b"{# comentario #}\n",
+        b"SELECT 1;\r\n",
+        b"SELECT 1;   \n",
+        b"SELECT 1;\tfoo\t\n",
+        "SELECT 1; \n".encode('utf-8'),
+        "SELECT 1; SELECT 2;\n".encode('utf-8'),
+        b"\xff\xfe invalid utf-8\n",
+    ])
+    def test_non_inert_files(self, temp_dir, content):
+        """Test que cualquier contenido que SQLPlus o Jinja2 alterarían no es inerte"""
+        path = temp_dir / "active.sql"
+        path.write_bytes(content)
+
+        assert classify_inert(path) is None
+
+    def test_custom_template_markers(self, temp_dir):
+        """Test que se respetan delimitadores de plantilla personalizados"""
+        path = temp_dir / "custom.sql"
+        path.write_bytes(b"SELECT {[ value ]} FROM dual;\n")
+
+        assert classify_inert(path) is not None
+        assert classify_inert(path, ('{[', '{%', '{#')) is None
+
+    def test_classification_cached_by_mtime(self, temp_dir):
+        """Test que la clasificación se invalida al cambiar el archivo"""
+        path = temp_dir / "file.sql"
+        path.write_bytes(b"SELECT 1;\n")
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+        assert classify_inert(path) is not None
+
+        path.write_bytes(b"SELECT &x;\n")
+        os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+        assert classify_inert(path) is None
+
+
+class TestIterSplices:
+    """Tests para la detección de marcas en el texto renderizado"""
+
+    def test_marker_followed_by_newline(self):
+        """Test que la marca y su salto de línea se convierten en SpliceRef"""
+        marker = make_marker(Path("/tmp/a.sql"), 10, True)
+        items = list(iter_splices([f"antes\n{marker}\ndespués"]))
+
+        assert items == ["antes\n", SpliceRef("/tmp/a.sql", 10, True, True), "después"]
+
+    def test_marker_split_from_newline(self):
+        """Test que el salto de línea puede llegar en el fragmento siguiente"""
+        marker = make_marker(Path("/tmp/a.sql"), 10, True)
+        items = list(iter_splices([marker, "\nresto"]))
+
+        assert items == [SpliceRef("/tmp/a.sql", 10, True, True), "resto"]
+
+    def test_marker_at_end_of_output(self):
+        """Test marca al final de la salida sin salto de línea"""
+        marker = make_marker(Path("/tmp/a.sql"), 10, True)
+
+        assert list(iter_splices(["x\n", marker])) == ["x\n", SpliceRef("/tmp/a.sql", 10, True, False)]
+
+    def test_altered_marker_raises(self):
+        """Test que una marca alterada por un filtro se detecta"""
+        marker = make_marker(Path("/tmp/a.sql"), 10, True).lower()
+
+        with pytest.raises(RuntimeError, match="splice_inert_files"):
+            list(iter_splices([marker + "\n"]))
+
+
+class TestSpliceEquivalence:
+    """Tests de equivalencia de la salida con y sin empalme"""
+
+    def _build_tree(self, temp_dir):
+        (temp_dir / "ddl.sql").write_bytes(b"CREATE TABLE t1 (id NUMBER);\nCREATE TABLE t2 (id NUMBER);\n")
+        (temp_dir / "no_newline.sql").write_bytes(b"INSERT INTO t1 VALUES (1);")
+        (temp_dir / "empty.sql").write_bytes(b"")
+        (temp_dir / "utf8.sql").write_bytes("-- año\nSELECT 'ñ' FROM dual;\n".encode('utf-8'))
+        (temp_dir / "crlf.sql").write_bytes(b"SELECT 1 FROM dual;\r\nSELECT 2 FROM dual;\r\n")
+        (temp_dir / "active.sql").write_bytes(b"SELECT '&env' FROM dual;  \n")
+        (temp_dir / "main.sql").write_text(
+            "DEFINE env='prod'\n"
+            "-- {{ title }}\n"
+            "@ddl.sql\n"
+            "{% for i in range(2) %}\n"
+            "@@no_newline.sql\n"
+            "{% endfor %}\n"
+            "@empty.sql\n"
+            "@utf8.sql\n"
+            "@crlf.sql\n"
+            "@active.sql\n"
+            "{% if false %}\n"
+            "@ddl.sql\n"
+            "{% endif %}\n"
+            "@no_newline.sql\n",
+            encoding='utf-8'
+        )
+
+    def _run(self, temp_dir, write_config, output_name, streaming, splice, pipeline=False):
+        output_file = temp_dir / output_name
+        config_file = write_config(
+            project={'output': output_file, 'streaming_output': streaming, 'pipeline_stages': pipeline},
+            jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+            sqlplus={'splice_inert_files': splice},
+            name=f"{output_name}.toml",
+        )
+        (temp_dir / "vars.yaml").write_text("title: Build\n", encoding='utf-8')
+        assert main(str(config_file)) == 0
+        return output_file.read_bytes()
+
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_output_identical_with_and_without_splice(self, temp_dir, write_config, streaming):
+        """Test que el empalme no cambia ni un byte de la salida"""
+        self._build_tree(temp_dir)
+
+        reference = self._run(temp_dir, write_config, "reference.sql", streaming=False, splice=False)
+        spliced = self._run(temp_dir, write_config, "spliced.sql", streaming=streaming, splice=True)
+
+        assert b"\x00" not in spliced
+        assert spliced == reference
+
+    @pytest.mark.parametrize("streaming, pipeline", [(True, False), (False, False), (True, True)])
+    @pytest.mark.parametrize("last_line", ["@empty.sql", "@empty.sql\n", "@@nested_empty.sql"])
+    def test_empty_include_at_end(self, temp_dir, write_config, streaming, pipeline, last_line):
+        """Test que un archivo vacío incluido en la última línea no añade un salto final"""
+        (temp_dir / "ddl.sql").write_bytes(b"CREATE TABLE t1 (id NUMBER);\n")
+        (temp_dir / "empty.sql").write_bytes(b"")
+        (temp_dir / "nested_empty.sql").write_bytes(b"@@ddl.sql\n@@empty.sql")
+        (temp_dir / "main.sql").write_text("-- {{ title }}\n@ddl.sql\n" + last_line, encoding='utf-8')
+
+        reference = self._run(temp_dir, write_config, "reference.sql", streaming=False, splice=False)
+        spliced = self._run(temp_dir, write_config, "spliced.sql", streaming, splice=True, pipeline=pipeline)
+
+        assert spliced == reference
+
+    def test_inert_files_reported_in_include_tree(self, temp_dir, write_config, caplog):
+        """Test que el árbol de inclusiones marca los archivos empalmados"""
+        self._build_tree(temp_dir)
+
+        with caplog.at_level("INFO"):
+            self._run(temp_dir, write_config, "out.sql", streaming=True, splice=True)
+
+        assert "ddl.sql (inerte)" in caplog.text
+        assert "active.sql (inerte)" not in caplog.text
+        assert "crlf.sql (inerte)" not in caplog.text
+
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_nul_bytes_kept_without_splice(self, temp_dir, write_config, streaming):
+        """Test que sin empalme un byte NUL en la entrada se copia sin interpretarlo como marca"""
+        (temp_dir / "binary.sql").write_bytes(b"SELECT 'a\x00b' FROM dual;\n")
+        (temp_dir / "main.sql").write_text("-- {{ title }}\n@binary.sql\n", encoding='utf-8')
+
+        output = self._run(temp_dir, write_config, "out.sql", streaming=streaming, splice=False)
+
+        assert output == b"-- Build\nSELECT 'a\x00b' FROM dual;"
+
+    @pytest.mark.parametrize("streaming", [True, False])
+    def test_altered_marker_reported(self, temp_dir, write_config, caplog, streaming):
+        """Test que una marca alterada por un filtro termina con error y se registra"""
+        (temp_dir / "ddl.sql").write_bytes(b"CREATE TABLE t1 (id NUMBER);\n")
+        (temp_dir / "main.sql").write_text("{% filter lower %}\n@ddl.sql\n{% endfilter %}\n", encoding='utf-8')
+        (temp_dir / "vars.yaml").write_text("title: Build\n", encoding='utf-8')
+        config_file = write_config(
+            project={'streaming_output': streaming},
+            jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+            sqlplus={'splice_inert_files': True},
+        )
+
+        with caplog.at_level("ERROR"):
+            assert main(str(config_file)) == 1
+
+        assert "Marca de empalme alterada" in caplog.text
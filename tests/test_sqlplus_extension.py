@@ -366,3 +366,261 @@ SELECT '&shared';
         )
         
         assert "SELECT 'from_include';" in content_result
+
+
+class TestSQLPlusLargeFiles:
+    """Tests para la lectura de archivos grandes mediante mmap"""
+
+    @pytest.mark.parametrize("content", [
+        "SELECT 1;\nSELECT 2;\n",
+        "SELECT 1;\nSELECT 2;",
+        "línea\r\nwindows\r\n\r\nfin",
+        "mac\rclásico\r",
+        "\n\n\n",
+        "tab\x0bvertical\x0cform\x1cfile\x85next\u2028line\u2029para\n",
+        "\ufeffBOM al inicio\n",
+        # Separadores junto a \n: cada uno cuenta como un salto propio
+        "a\x0c\nb\x0b\n\x1c\nc\x1d\x1e\n",
+        "a\x85\n\u2028\nb\u2029\n",
+        "a\r\r\nb\n\rc\n\r",
+        "\x0c\n",
+    ])
+    @pytest.mark.parametrize("suffix", [".sql", ".sql.gz"])
+    def test_mmap_lines_match_splitlines(self, temp_dir, content, suffix):
+        """Test que la lectura con mmap (o gzip) produce las mismas líneas que splitlines()"""
+        import gzip
+        from MergeSourceFile.fs import LocalFS
+        
+        path = temp_dir / f"big{suffix}"
+        data = content.encode('utf-8')
+        path.write_bytes(gzip.compress(data) if suffix.endswith('.gz') else data)
+        
+        assert list(LocalFS(mmap_threshold=1).iter_lines(path)) == content.splitlines()
+
+    def test_large_include_uses_mmap(self, temp_dir, mocker):
+        """Test que las inclusiones por encima del umbral se leen con mmap"""
+        from MergeSourceFile import fs
+        from MergeSourceFile.extensions import sqlplus
+        
+        included = temp_dir / "bulk.sql"
+        included.write_text("INSERT INTO t VALUES (1);\n" * 100, encoding='utf-8')
+        main_file = temp_dir / "main.sql"
+        main_file.write_text(f"@{included.name}\nCOMMIT;", encoding='utf-8')
+        
+        mmap_spy = mocker.spy(fs.mmap, 'mmap')
+        content_result, _ = sqlplus.process_sqlplus(
+            content="",
+            input_file=str(main_file),
+            base_path=str(temp_dir),
+            config={'process_includes': True, 'process_defines': False, 'mmap_threshold': 1024},
+            verbose=False
+        )
+        
+        assert mmap_spy.call_count == 1
+        assert content_result.count("INSERT INTO t VALUES (1);") == 100
+        assert content_result.endswith("COMMIT;\n")
+
+
+class TestSQLPlusLazyIncludes:
+    """Tests para la resolución diferida de inclusiones durante el renderizado"""
+
+    def _build_tree(self, temp_dir):
+        (temp_dir / "tables").mkdir()
+        (temp_dir / "tables" / "t1.sql").write_text(
+            "CREATE TABLE &schema..t1 (id NUMBER);\n@@grants.sql", encoding='utf-8')
+        (temp_dir / "tables" / "grants.sql").write_text("GRANT SELECT ON t1 TO app;\n", encoding='utf-8')
+        (temp_dir / "empty.sql").write_text("", encoding='utf-8')
+        (temp_dir / "prod_only.sql").write_text("-- {{ env }}\nALTER SYSTEM SET x = 1;", encoding='utf-8')
+        main_file = temp_dir / "main.sql"
+        main_file.write_text(
+            "DEFINE schema='app'\n"
+            "@tables/t1.sql\n"
+            "@empty.sql\n"
+            "{% if env == 'prod' %}\n"
+            "@prod_only.sql\n"
+            "{% endif %}\n"
+            "SELECT '&schema' FROM dual;\n",
+            encoding='utf-8'
+        )
+        return main_file
+
+    def _render(self, main_file, env, lazy):
+        from MergeSourceFile.template_engine import TemplateEngine
+
+        engine = TemplateEngine({
+            'jinja2': {'extensions': ['sqlplus'], 'sqlplus': {'lazy_includes': lazy}}
+        })
+        return engine.process_file(str(main_file), {'env': env})
+
+    @pytest.mark.parametrize("env", ["prod", "dev"])
+    def test_output_identical_to_eager_expansion(self, temp_dir, env):
+        """Test que el modo diferido produce la misma salida que la expansión previa"""
+        main_file = self._build_tree(temp_dir)
+
+        assert self._render(main_file, env, lazy=True) == self._render(main_file, env, lazy=False)
+
+    @pytest.mark.parametrize("last_line", [
+        "@tables/t1.sql",
+        "@tables/t1.sql\n",
+        "@empty.sql",
+        "@@chain.sql",
+    ])
+    def test_include_on_last_line_identical_to_eager(self, temp_dir, last_line):
+        """Test que una inclusión en la última línea no añade un salto de línea final"""
+        main_file = self._build_tree(temp_dir)
+        (temp_dir / "chain.sql").write_text("-- cadena\n@@empty.sql", encoding='utf-8')
+        main_file.write_text("DEFINE schema='app'\nSELECT 1 FROM dual;\n" + last_line, encoding='utf-8')
+
+        assert self._render(main_file, "dev", lazy=True) == self._render(main_file, "dev", lazy=False)
+
+    def test_circular_include_on_last_line(self, temp_dir):
+        """Test que una cadena circular de inclusiones en la última línea se detecta"""
+        from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("SELECT 1 FROM dual;\n@main.sql", encoding='utf-8')
+
+        with pytest.raises(ValueError, match="Inclusión circular"):
+            process_sqlplus("", str(main_file), str(temp_dir), {'lazy_includes': True})
+
+    def test_untaken_branch_not_read(self, temp_dir, mocker):
+        """Test que los archivos de ramas no ejecutadas no se leen"""
+        from MergeSourceFile import fs
+
+        main_file = self._build_tree(temp_dir)
+        (temp_dir / "prod_only.sql").unlink()
+        read_spy = mocker.spy(fs.LocalFS, 'iter_lines')
+
+        result = self._render(main_file, "dev", lazy=True)
+
+        read_files = {Path(call.args[1]).name for call in read_spy.call_args_list}
+        assert "prod_only.sql" not in read_files
+        assert "GRANT SELECT ON t1 TO app;" in result
+
+    def test_missing_include_in_taken_branch(self, temp_dir):
+        """Test que una inclusión inexistente falla al ejecutarse su rama"""
+        main_file = self._build_tree(temp_dir)
+        (temp_dir / "prod_only.sql").unlink()
+
+        with pytest.raises(Exception, match="prod_only.sql"):
+            self._render(main_file, "prod", lazy=True)
+
+    def test_jinja2_includes_still_blocked(self, temp_dir):
+        """Test que los {% include %} de Jinja2 siguen deshabilitados"""
+        main_file = temp_dir / "main.sql"
+        main_file.write_text('{% include "other.sql" %}', encoding='utf-8')
+        (temp_dir / "other.sql").write_text("SELECT 1;", encoding='utf-8')
+
+        with pytest.raises(Exception, match="deshabilitados"):
+            self._render(main_file, "dev", lazy=True)
+
+
+class TestSQLPlusIncludeOnce:
+    """Tests para la política include-once"""
+
+    def _build_tree(self, temp_dir, pragma=False):
+        spec = ("-- msf:once\n" if pragma else "") + "CREATE PACKAGE shared AS END;"
+        (temp_dir / "shared_spec.sql").write_text(spec, encoding='utf-8')
+        (temp_dir / "mod_a.sql").write_text("@@shared_spec.sql\nCREATE PACKAGE a AS END;", encoding='utf-8')
+        (temp_dir / "mod_b.sql").write_text("@@shared_spec.sql\nCREATE PACKAGE b AS END;", encoding='utf-8')
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("@mod_a.sql\n@mod_b.sql\n@./shared_spec.sql", encoding='utf-8')
+        return main_file
+
+    def _process(self, main_file, **config):
+        from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+        content, _ = process_sqlplus(
+            content="",
+            input_file=str(main_file),
+            base_path=str(main_file.parent),
+            config={'process_includes': True, 'process_defines': False, **config},
+            verbose=False
+        )
+        return content
+
+    def test_repeats_kept_by_default(self, temp_dir):
+        """Test que sin la política las inclusiones repetidas se mantienen"""
+        main_file = self._build_tree(temp_dir)
+
+        assert self._process(main_file).count("CREATE PACKAGE shared") == 3
+
+    def test_global_include_once(self, temp_dir, caplog):
+        """Test que con include_once cada archivo se emite solo la primera vez"""
+        main_file = self._build_tree(temp_dir)
+
+        with caplog.at_level("INFO"):
+            content = self._process(main_file, include_once=True)
+
+        assert content == (
+            "CREATE PACKAGE shared AS END;\n\n"
+            "CREATE PACKAGE a AS END;\n\n"
+            "CREATE PACKAGE b AS END;\n\n"
+        )
+        saved = len("CREATE PACKAGE shared AS END;\n")
+        assert f"shared_spec.sql (ya incluido, {saved} bytes omitidos)" in caplog.text
+        assert f"2 inclusiones repetidas omitidas ({2 * saved} bytes ahorrados)" in caplog.text
+
+    def test_once_pragma(self, temp_dir):
+        """Test que el pragma '-- msf:once' aplica la política solo a ese archivo"""
+        main_file = self._build_tree(temp_dir, pragma=True)
+        (temp_dir / "main.sql").write_text(
+            "@mod_a.sql\n@mod_b.sql\n@mod_b.sql", encoding='utf-8')
+
+        content = self._process(main_file)
+
+        assert content.count("CREATE PACKAGE shared") == 1
+        assert content.count("CREATE PACKAGE b") == 2
+
+    def test_once_pragma_with_inert_splice(self, temp_dir):
+        """Test que el pragma se respeta en archivos empalmados como inertes"""
+        main_file = self._build_tree(temp_dir, pragma=True)
+
+        content = self._process(main_file, splice_inert_files=True)
+
+        assert content.count("\x00MSF:SPLICE:") == 1
+
+
+class TestSQLPlusIncludeCycles:
+    """Tests para la detección de inclusiones circulares"""
+
+    def _process(self, main_file, **config):
+        from MergeSourceFile.extensions.sqlplus import process_sqlplus
+
+        return process_sqlplus(
+            content=main_file.read_text(encoding='utf-8'),
+            input_file=str(main_file),
+            base_path=str(main_file.parent),
+            config=dict({'process_includes': True, 'process_defines': False}, **config),
+            verbose=False
+        )
+
+    @pytest.mark.parametrize("include_once", [False, True])
+    def test_self_include(self, temp_dir, include_once):
+        """Test que un archivo que se incluye a sí mismo falla con la cadena de inclusión"""
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("SELECT 1;\n@@a.sql", encoding='utf-8')
+        (temp_dir / "a.sql").write_text("@@a.sql", encoding='utf-8')
+
+        with pytest.raises(ValueError, match=r"Inclusión circular: .*main\.sql -> .*a\.sql -> .*a\.sql$"):
+            self._process(main_file, include_once=include_once)
+
+    def test_indirect_cycle(self, temp_dir):
+        """Test que A -> B -> A se detecta"""
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("@@a.sql", encoding='utf-8')
+        (temp_dir / "a.sql").write_text("SELECT 'a';\n@@b.sql", encoding='utf-8')
+        (temp_dir / "b.sql").write_text("@@a.sql", encoding='utf-8')
+
+        with pytest.raises(ValueError, match=r"a\.sql -> .*b\.sql -> .*a\.sql$"):
+            self._process(main_file)
+
+    def test_repeated_include_is_not_a_cycle(self, temp_dir):
+        """Test que incluir el mismo archivo dos veces seguidas no es circular"""
+        main_file = temp_dir / "main.sql"
+        main_file.write_text("@@a.sql\n@@a.sql", encoding='utf-8')
+        (temp_dir / "a.sql").write_text("SELECT 'a';", encoding='utf-8')
+
+        content, _ = self._process(main_file)
+
+        assert content.count("SELECT 'a';") == 2
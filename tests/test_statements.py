@@ -0,0 +1,122 @@
+"""
+Tests para el índice de sentencias del script generado (statement_index).
+
+Verifica los límites y tipos de sentencia con las reglas de SQL*Plus,
+los offsets de bytes y líneas, la independencia del tamaño de los
+fragmentos y la generación del índice al escribir la salida.
+"""
+import json
+import pytest
+from MergeSourceFile.core import main
+from MergeSourceFile.statements import StatementIndexer, index_path_for
+
+SCRIPT = """-- cabecera
+SET SERVEROUTPUT ON
+PROMPT creando -
+  objetos
+CREATE TABLE t (
+  a NUMBER, -- comentario;
+  b VARCHAR2(10) DEFAULT 'x;'
+);
+
+CREATE OR REPLACE
+PACKAGE BODY p AS
+  PROCEDURE x IS BEGIN NULL; END;
+END;
+/
+INSERT INTO t VALUES (1, q'[it's;
+]');
+/* bloque
+ comentario; */
+BEGIN
+  dbms_output.put_line('año');
+END;
+/
+@otro.sql
+SET TRANSACTION READ ONLY;
+REM fin
+UPDATE t SET a = 2
+/
+SELECT "a;" FROM dual"""
+
+EXPECTED = [
+    (2, 2, 'sqlplus', 'SET'),
+    (3, 4, 'sqlplus', 'PROMPT'),
+    (5, 8, 'sql', 'CREATE'),
+    (10, 14, 'plsql', 'CREATE'),
+    (15, 16, 'sql', 'INSERT'),
+    (19, 22, 'plsql', 'BEGIN'),
+    (23, 23, 'sqlplus', '@'),
+    (24, 24, 'sql', 'SET'),
+    (26, 27, 'sql', 'UPDATE'),
+    (28, 28, 'sql', 'SELECT'),
+]
+
+
+def _index(text, chunk_size=None):
+    indexer = StatementIndexer()
+    chunk_size = chunk_size or len(text)
+    for i in range(0, len(text), chunk_size):
+        indexer.feed(text[i:i + chunk_size])
+    indexer.finish()
+    return indexer
+
+
+class TestStatementIndexer:
+    """Tests para la detección de sentencias"""
+
+    @pytest.mark.parametrize("chunk_size", [None, 1, 7, 64])
+    def test_boundaries_and_kinds(self, chunk_size):
+        """Test que las sentencias y sus tipos no dependen del tamaño de los fragmentos"""
+        indexer = _index(SCRIPT, chunk_size)
+
+        found = list(zip(indexer.lines, indexer.end_lines, indexer.kinds, indexer.keywords))
+        assert found == EXPECTED
+
+    def test_byte_offsets(self):
+        """Test que los offsets son de bytes codificados y delimitan cada sentencia"""
+        indexer = _index(SCRIPT, 5)
+        data = SCRIPT.encode('utf-8')
+
+        statements = [data[s:e].decode('utf-8') for s, e in zip(indexer.starts, indexer.ends)]
+        assert statements[5] == "BEGIN\n  dbms_output.put_line('año');\nEND;\n/\n"
+        assert statements[6] == "@otro.sql\n"
+        assert statements[-1] == 'SELECT "a;" FROM dual'
+        assert indexer.to_dict()['bytes'] == len(data)
+
+    def test_one_line_statements(self):
+        """Test que las sentencias de una línea con cadenas se separan una a una"""
+        text = "INSERT INTO t VALUES ('a;', 'b--c');\n" * 3 + "INSERT INTO t VALUES ('x', '\ny');\n"
+        indexer = _index(text)
+
+        assert indexer.lines == [1, 2, 3, 4]
+        assert indexer.end_lines == [1, 2, 3, 5]
+
+
+class TestStatementIndexOutput:
+    """Tests del índice generado por main()"""
+
+    @pytest.mark.parametrize("streaming", [False, True])
+    def test_index_written_next_to_output(self, temp_dir, write_config, streaming):
+        """Test que el índice se escribe junto a la salida, también con archivos empalmados"""
+        (temp_dir / "data.sql").write_text("INSERT INTO t VALUES (1);\nINSERT INTO t VALUES (2);\n", encoding='utf-8')
+        (temp_dir / "main.sql").write_text(
+            "BEGIN\n  NULL;\nEND;\n/\n@data.sql\nSELECT '{{ env }}' FROM dual;\n", encoding='utf-8'
+        )
+        (temp_dir / "vars.yaml").write_text("env: prod\n", encoding='utf-8')
+        config_file = write_config(
+            project={'statement_index': True, 'streaming_output': streaming},
+            jinja2={'extensions': ["sqlplus"], 'variables_file': temp_dir / "vars.yaml"},
+            sqlplus={'splice_inert_files': True},
+        )
+
+        assert main(str(config_file)) == 0
+
+        data = (temp_dir / "out.sql").read_bytes()
+        index = json.loads(index_path_for(temp_dir / "out.sql").read_text(encoding='utf-8'))
+        statements = index['statements']
+        texts = [data[s:e].decode('utf-8') for s, e in zip(statements['start'], statements['end'])]
+        assert statements['kind'] == ['plsql', 'sql', 'sql', 'sql']
+        assert texts[2] == "INSERT INTO t VALUES (2);\n"
+        assert texts[3].startswith("SELECT 'prod' FROM dual;")
+        assert index['bytes'] == len(data)
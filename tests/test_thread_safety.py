@@ -0,0 +1,82 @@
+"""
+Tests de uso concurrente del motor de plantillas.
+
+Verifica que un TemplateEngine compartido entre hilos produce las mismas
+salidas que en secuencia y que las métricas no pierden actualizaciones.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from MergeSourceFile import metrics
+from MergeSourceFile.template_engine import TemplateEngine
+
+
+def _write_projects(temp_dir, count):
+    """Proyectos independientes con inclusiones, DEFINE y variables Jinja2."""
+    mains = []
+    for n in range(count):
+        project = temp_dir / f"p{n}"
+        (project / "inc").mkdir(parents=True)
+        (project / "inc" / "body.sql").write_text(
+            f"DEFINE tabla = 't{n}'\nSELECT * FROM &tabla WHERE env = '{{{{ env }}}}';\n", encoding='utf-8'
+        )
+        (project / "main.sql").write_text(
+            f"-- proyecto {n}\n@@inc/body.sql\n{{% for i in range(3) %}}INSERT INTO t{n} VALUES ({{{{ i }}}});\n{{% endfor %}}",
+            encoding='utf-8'
+        )
+        mains.append(str(project / "main.sql"))
+    return mains
+
+
+class TestSharedTemplateEngine:
+    """Tests para un TemplateEngine compartido entre hilos"""
+
+    def test_concurrent_matches_sequential(self, temp_dir):
+        """Test que procesar en paralelo da las mismas salidas que en secuencia"""
+        mains = _write_projects(temp_dir, 8)
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+        variables = {'env': 'prod'}
+        expected = [engine.process_file(main, variables) for main in mains]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda main: engine.process_file(main, variables), mains * 4))
+
+        assert results == expected * 4
+        assert "SELECT * FROM t3 WHERE env = 'prod';" in expected[3]
+        assert variables == {'env': 'prod'}
+
+    def test_metrics_from_threads(self, temp_dir):
+        """Test que los contadores y etapas acumulan todas las actualizaciones de todos los hilos"""
+        def work():
+            for _ in range(2000):
+                metrics.count('ops')
+                with metrics.stage('step', trace=False):
+                    pass
+
+        with metrics.collect_metrics() as collector:
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        assert collector.counters['ops'] == 16000
+        assert collector.stages['step']['calls'] == 16000
+
+    def test_render_profile_only_sees_its_thread(self, temp_dir):
+        """Test que el perfil de renderizado no mezcla los renderizados de otros hilos"""
+        from MergeSourceFile.profiling import RenderProfiler, active_render_profiler, render_profiling
+
+        mains = _write_projects(temp_dir, 2)
+        engine = TemplateEngine({'jinja2': {'extensions': ['sqlplus']}})
+        profiler = RenderProfiler()
+
+        with render_profiling(profiler):
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                seen = list(pool.map(lambda _: active_render_profiler(), range(4)))
+                list(pool.map(lambda main: engine.process_file(main, {'env': 'dev'}), [mains[1]] * 8))
+            result = engine.process_file(mains[0], {'env': 'prod'})
+
+        rows = profiler.report(top=1000)
+        assert seen == [None] * 4
+        assert {row['file'] for row in rows} <= {mains[0], str(temp_dir / "p0" / "inc" / "body.sql")}
+        assert sum(row['bytes'] for row in rows) == len(result.encode('utf-8'))
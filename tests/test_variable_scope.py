@@ -0,0 +1,154 @@
+"""
+Tests para las variables de plantilla por capas.
+
+Verifica la prioridad entre archivos YAML, entorno, --set y variables de
+extensión, y que los renderizados no copian ni modifican las capas base.
+"""
+import pytest
+from MergeSourceFile.core import _load_variables, cli
+from MergeSourceFile.template_engine import TemplateEngine
+from MergeSourceFile.variables import VariableScope, env_overrides, parse_assignments, with_layer
+
+
+class NoCopyDict(dict):
+    """Capa que falla si alguien la recorre para copiarla."""
+
+    def keys(self):
+        raise AssertionError("la capa se ha copiado")
+
+    def __iter__(self):
+        raise AssertionError("la capa se ha copiado")
+
+    def copy(self):
+        raise AssertionError("la capa se ha copiado")
+
+
+class TestVariableLayers:
+    """Tests para la carga de capas de variables"""
+
+    def test_priority(self, temp_dir, monkeypatch):
+        """Test que --set > entorno > último YAML > primer YAML"""
+        (temp_dir / "base.yaml").write_text("a: base\nb: base\nc: base\nd: base\n", encoding='utf-8')
+        (temp_dir / "prod.yaml").write_text("b: prod\nc: prod\nd: prod\n", encoding='utf-8')
+        monkeypatch.setenv("MSF_VAR_c", "env")
+        monkeypatch.setenv("MSF_VAR_d", "env")
+        config = {'jinja2': {'variables_file': [str(temp_dir / "base.yaml"), str(temp_dir / "prod.yaml")]}}
+
+        scope = _load_variables(config, {'d': 'cli'})
+
+        assert isinstance(scope, VariableScope)
+        assert dict(scope) == {'a': 'base', 'b': 'prod', 'c': 'env', 'd': 'cli'}
+
+    def test_single_file_and_missing_file(self, temp_dir):
+        """Test que variables_file acepta una cadena y un archivo ausente no es un error"""
+        (temp_dir / "vars.yaml").write_text("env: dev\n", encoding='utf-8')
+
+        assert dict(_load_variables({'jinja2': {'variables_file': str(temp_dir / "vars.yaml")}})) == {'env': 'dev'}
+        assert dict(_load_variables({'jinja2': {'variables_file': str(temp_dir / "none.yaml")}})) == {}
+
+    def test_env_prefix(self, monkeypatch):
+        """Test que env_prefix cambia el prefijo y una cadena vacía desactiva la capa"""
+        monkeypatch.setenv("MSF_VAR_port", "1521")
+        monkeypatch.setenv("APP_port", "1522")
+
+        assert _load_variables({})['port'] == '1521'
+        assert _load_variables({'jinja2': {'env_prefix': 'APP_'}})['port'] == '1522'
+        assert 'port' not in _load_variables({'jinja2': {'env_prefix': ''}})
+        assert env_overrides('MSF_VAR_', {'MSF_VAR_': 'x', 'OTHER': 'y'}) == {}
+
+    def test_parse_assignments(self):
+        """Test que los valores de --set son texto salvo con clave:=valor o una colección"""
+        assert parse_assignments(["n=3", "flag=true", "schema=APP", "dsn=a=b", "empty="]) == {
+            'n': '3', 'flag': 'true', 'schema': 'APP', 'dsn': 'a=b', 'empty': '',
+        }
+        assert parse_assignments(["n:=3", "flag:=true", "empty:=", "bad:=[1", "dsn:=a=b"]) == {
+            'n': 3, 'flag': True, 'empty': None, 'bad': '[1', 'dsn': 'a=b',
+        }
+        assert parse_assignments(["schemas=[app, audit]", "limits={cpu: 2}"]) == {
+            'schemas': ['app', 'audit'], 'limits': {'cpu': 2},
+        }
+
+    @pytest.mark.parametrize("literal", ["1.10", "010", "no", "off", "yes", "2024-01-01", "0x1F", "1e3", "~", "null"])
+    def test_ambiguous_literals_stay_strings(self, literal, monkeypatch):
+        """Test que los literales que YAML reinterpretaría llegan como se escribieron"""
+        monkeypatch.setenv("MSF_VAR_value", literal)
+
+        assert parse_assignments([f"value={literal}"]) == {'value': literal}
+        assert env_overrides()['value'] == literal
+        for invalid in ("schema", "=APP"):
+            with pytest.raises(ValueError, match="clave=valor"):
+                parse_assignments([invalid])
+
+    def test_with_layer(self):
+        """Test que una capa nueva comparte las existentes en lugar de copiarlas"""
+        base = {'a': 1}
+        scope = with_layer(VariableScope({'b': 2}, base), {'a': 0})
+
+        assert scope['a'] == 0 and scope['b'] == 2
+        assert scope.maps[-1] is base
+        assert with_layer(base, {}) is base
+
+
+class TestLayeredRender:
+    """Tests para el renderizado con variables en capas"""
+
+    def test_render_does_not_copy_base_layers(self, temp_dir):
+        """Test que el renderizado consulta las capas base sin recorrerlas"""
+        template = temp_dir / "main.sql"
+        template.write_text("DEFINE t='emp'\nSELECT * FROM {{ schema }}.{{ sql_t }}; -- {{ range(2)|list }}",
+                            encoding='utf-8')
+        engine = TemplateEngine({'jinja2': {'enabled': True, 'extensions': ['sqlplus']}})
+        scope = VariableScope(NoCopyDict(schema='app'))
+
+        result = engine.process_file(str(template), scope)
+        assert result.strip() == "SELECT * FROM app.emp; -- [0, 1]"
+        chunks = engine.process_file_stream(str(template), scope)
+        assert ''.join(chunks).strip() == "SELECT * FROM app.emp; -- [0, 1]"
+
+    def test_extension_layer_does_not_leak(self, temp_dir):
+        """Test que las variables sql_ de un renderizado no quedan en las capas compartidas"""
+        template = temp_dir / "main.sql"
+        template.write_text("DEFINE t='emp'\nSELECT '{{ sql_t }}' FROM dual;", encoding='utf-8')
+        engine = TemplateEngine({'jinja2': {'enabled': True, 'extensions': ['sqlplus']}})
+        scope = VariableScope({'schema': 'app'})
+
+        engine.process_file(str(template), scope)
+
+        assert dict(scope) == {'schema': 'app'}
+
+    def test_namespace_conflict_warning_kept(self, temp_dir, caplog):
+        """Test que sigue avisando si un DEFINE coincide con una variable de cualquier capa"""
+        template = temp_dir / "main.sql"
+        template.write_text("DEFINE env='dev'\nSELECT '{{ env }}', '{{ sql_env }}' FROM dual;", encoding='utf-8')
+        engine = TemplateEngine({'jinja2': {'enabled': True, 'extensions': ['sqlplus']}})
+        scope = VariableScope({'env': 'cli'}, {'env': 'yaml'})
+
+        result = engine.process_file(str(template), scope)
+
+        assert "SELECT 'cli', 'dev' FROM dual;" in result
+        assert "env" in caplog.text and "sql_env" in caplog.text
+
+
+class TestCliSet:
+    """Tests para msf --set"""
+
+    def _write_project(self, temp_dir, write_config):
+        (temp_dir / "main.sql").write_text("SELECT '{{ env }}', {{ n + 1 }} FROM dual;", encoding='utf-8')
+        (temp_dir / "vars.yaml").write_text("env: dev\nn: 1\n", encoding='utf-8')
+        return write_config(jinja2={'variables_file': temp_dir / "vars.yaml"})
+
+    def test_set_overrides_yaml(self, temp_dir, write_config):
+        """Test que --set prevalece sobre el YAML y clave:=valor respeta el tipo del valor"""
+        config_file = self._write_project(temp_dir, write_config)
+
+        assert cli([str(config_file), "--set", "env=prod", "--set", "n:=41"]) == 0
+
+        assert (temp_dir / "out.sql").read_text(encoding='utf-8') == "SELECT 'prod', 42 FROM dual;"
+
+    def test_invalid_assignment(self, temp_dir, write_config):
+        """Test que una asignación sin '=' es un error de uso"""
+        config_file = self._write_project(temp_dir, write_config)
+
+        with pytest.raises(SystemExit) as exc:
+            cli([str(config_file), "--set", "env"])
+        assert exc.value.code == 2